@@ -0,0 +1,192 @@
+"""Análise de cardinalidade das colunas-chave antes do merge.
+
+Chaves repetidas na origem multiplicam as linhas do destino em um merge
+'left'. A análise conta valores únicos e repetidos nos dois lados e projeta o
+total de linhas do resultado usando apenas value_counts, antes de qualquer
+junção; a política de duplicadas decide o que fazer com as repetições.
+"""
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+
+# política -> descrição exibida na interface
+POLITICAS_DUPLICADAS = {
+    'manter': "Manter todas (multiplica linhas do destino)",
+    'primeira': "Usar a primeira ocorrência",
+    'ultima': "Usar a última ocorrência",
+    'erro': "Interromper com erro",
+    'agregar': "Agregar valores (soma números, junta textos)",
+}
+
+# Resultado com mais de LIMITE_EXPANSAO vezes as linhas do destino é interrompido
+LIMITE_EXPANSAO = 2.0
+SEPARADOR_AGREGACAO = " | "
+
+
+@dataclass
+class AnaliseChaves:
+    """Contagens das colunas-chave e total de linhas projetado para o merge"""
+    linhas_origem: int
+    unicas_origem: int
+    duplicadas_origem: int
+    linhas_destino: int
+    unicas_destino: int
+    duplicadas_destino: int
+    linhas_projetadas: int
+    # Linhas do destino cuja chave aparece mais de uma vez na origem
+    ambiguas_destino: int = 0
+
+    @property
+    def expansao(self):
+        """Razão entre as linhas projetadas e as linhas do destino"""
+        return self.linhas_projetadas / self.linhas_destino if self.linhas_destino else 1.0
+
+    def resumo(self):
+        """Texto com as contagens, para mensagens ao usuário"""
+        return (f"Origem: {self.linhas_origem:,} linhas, {self.unicas_origem:,} chaves únicas, "
+                f"{self.duplicadas_origem:,} linhas com chave repetida\n"
+                f"Destino: {self.linhas_destino:,} linhas, {self.unicas_destino:,} chaves únicas, "
+                f"{self.duplicadas_destino:,} linhas com chave repetida\n"
+                f"Linhas projetadas no resultado: {self.linhas_projetadas:,}")
+
+
+def analisar_chaves(chave_origem, chave_destino, ausentes_casam=True):
+    """Analisa as duas colunas-chave (Series) sem realizar o merge.
+
+    Assim como o merge do pandas, valores ausentes também casam entre si. Com
+    `ausentes_casam=False` (junção aproximada, em que o ausente no destino
+    marca a linha sem correspondência), eles não entram nas chaves únicas e
+    repetidas do destino.
+    """
+    contagem_origem = chave_origem.value_counts(dropna=False)
+    contagem_destino = chave_destino.value_counts(dropna=False)
+    chaves_destino = chave_destino if ausentes_casam else chave_destino.dropna()
+
+    return AnaliseChaves(
+        linhas_origem=len(chave_origem),
+        unicas_origem=len(contagem_origem),
+        duplicadas_origem=int(chave_origem.duplicated(keep=False).sum()),
+        linhas_destino=len(chave_destino),
+        unicas_destino=chaves_destino.nunique(dropna=False),
+        duplicadas_destino=int(chaves_destino.duplicated(keep=False).sum()),
+        linhas_projetadas=linhas_projetadas(contagem_origem, contagem_destino),
+        ambiguas_destino=linhas_ambiguas(contagem_origem, contagem_destino),
+    )
+
+
+def linhas_projetadas(contagem_origem, contagem_destino):
+    """Total de linhas de um merge 'left' a partir dos value_counts das duas chaves"""
+    # Cada linha do destino gera max(1, ocorrências na origem) linhas
+    multiplicador = contagem_origem.reindex(contagem_destino.index, fill_value=0).clip(lower=1)
+    return int((contagem_destino * multiplicador).sum())
+
+
+def linhas_ambiguas(contagem_origem, contagem_destino):
+    """Linhas do destino com chave repetida na origem, a partir dos value_counts das duas chaves"""
+    repetidas = contagem_origem.index[contagem_origem > 1]
+    return int(contagem_destino.reindex(repetidas, fill_value=0).sum())
+
+
+@dataclass
+class Correspondencia:
+    """Linhas do destino com e sem chave encontrada na origem, contadas na própria junção.
+
+    Ambíguas são as linhas do destino cuja chave se repete na origem (resolvidas
+    pela política de duplicadas). Com a coleta de chaves pedida (ver
+    mergeEngine.RelatorioMerge), `chaves_destino` tem as chaves do destino sem
+    correspondência e `chaves_origem` as chaves da origem que nenhuma linha usou.
+    """
+    linhas_destino: int = 0
+    sem_correspondencia: int = 0
+    ambiguas: int = 0
+    chaves_destino: pd.DataFrame = field(default=None, repr=False)
+    chaves_origem: pd.DataFrame = field(default=None, repr=False)
+    # Chaves de junção encontradas (Series), usadas para chegar a chaves_origem
+    usadas: pd.Series = field(default=None, repr=False)
+
+    @property
+    def correspondidas(self):
+        return self.linhas_destino - self.sem_correspondencia
+
+    @property
+    def taxa(self):
+        """Fração das linhas do destino com chave encontrada na origem"""
+        return self.correspondidas / self.linhas_destino if self.linhas_destino else 0.0
+
+    @classmethod
+    def total(cls, partes):
+        """Soma as contagens (e junta as chaves coletadas) de vários blocos ou abas do destino"""
+        partes = list(partes)
+        total = cls(sum(p.linhas_destino for p in partes), sum(p.sem_correspondencia for p in partes),
+                    sum(p.ambiguas for p in partes))
+        chaves = [p.chaves_destino for p in partes if p.chaves_destino is not None]
+        if chaves:
+            total.chaves_destino = pd.concat(chaves, ignore_index=True).drop_duplicates(ignore_index=True)
+        usadas = [p.usadas for p in partes if p.usadas is not None]
+        if usadas:
+            total.usadas = pd.concat(usadas, ignore_index=True).drop_duplicates()
+        return total
+
+    def resumo(self):
+        """Texto com as contagens, para mensagens ao usuário"""
+        texto = (f"{self.correspondidas:,} de {self.linhas_destino:,} linhas do destino encontradas na origem "
+                 f"({self.taxa:.0%}), {self.sem_correspondencia:,} sem correspondência")
+        if self.ambiguas:
+            texto += f", {self.ambiguas:,} com chave repetida na origem"
+        return texto
+
+
+def verificar_expansao(analise, politica='manter', limite=LIMITE_EXPANSAO):
+    """Interrompe o merge antes da junção se as chaves repetidas forem explodir o resultado"""
+    if analise.duplicadas_origem == 0:
+        return
+    if politica == 'erro':
+        raise ValueError("A coluna-chave da origem tem valores repetidos:\n" + analise.resumo())
+    if politica == 'manter' and limite is not None and analise.expansao > limite:
+        raise ValueError(f"O merge multiplicaria o destino por {analise.expansao:,.1f} "
+                         f"(limite: {limite:,.1f}) por causa de chaves repetidas na origem.\n"
+                         f"{analise.resumo()}\n"
+                         "Escolha outra política para chaves duplicadas.")
+
+
+def _juntar_textos(valores):
+    distintos = valores.dropna().astype(str).unique()
+    return SEPARADOR_AGREGACAO.join(distintos) if len(distintos) else None
+
+
+def _agregar_repetidas(repetidas, chave):
+    """Soma colunas numéricas e junta os textos distintos de cada chave repetida"""
+    valores = [c for c in repetidas.columns if c != chave]
+    if not valores:
+        return repetidas.drop_duplicates(subset=chave)
+
+    numericas = [c for c in valores
+                 if pd.api.types.is_numeric_dtype(repetidas[c]) and not pd.api.types.is_bool_dtype(repetidas[c])]
+    textos = [c for c in valores if c not in numericas]
+
+    grupos = repetidas.groupby(chave, sort=False, dropna=False)
+    partes = []
+    if numericas:
+        partes.append(grupos[numericas].sum(min_count=1))
+    if textos:
+        partes.append(grupos[textos].agg(_juntar_textos))
+    return pd.concat(partes, axis=1)[valores].reset_index()
+
+
+def aplicar_politica(indice, chave, politica='manter'):
+    """Remove ou agrega as chaves repetidas do índice da origem conforme a política"""
+    if politica in ('manter', 'erro'):
+        return indice
+    if politica == 'primeira':
+        return indice.drop_duplicates(subset=chave, keep='first')
+    if politica == 'ultima':
+        return indice.drop_duplicates(subset=chave, keep='last')
+    if politica == 'agregar':
+        repetidas = indice[chave].duplicated(keep=False)
+        if not repetidas.any():
+            return indice
+        # Só as chaves repetidas passam pelo groupby; as demais seguem como estão
+        agregadas = _agregar_repetidas(indice[repetidas], chave)
+        return pd.concat([indice[~repetidas], agregadas], ignore_index=True)
+    raise ValueError(f"Política de chaves duplicadas desconhecida: '{politica}'")
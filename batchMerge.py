@@ -0,0 +1,179 @@
+"""Vinculação em lote: uma origem contra vários arquivos destino.
+
+A origem é lida e preparada (colunas-chave, normalização, índice de trigramas)
+uma única vez. Cada processo do pool recebe essa origem preparada ao iniciar e
+depois só lê, vincula e grava os destinos que lhe couberem; o progresso é
+informado a cada arquivo concluído e o resultado traz o sucesso ou a falha de
+cada destino.
+"""
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import mergeEngine
+
+
+EXTENSOES_DESTINO = ('.xlsx', '.xls', '.csv')
+SUFIXO_SAIDA = '_vinculado'
+
+
+@dataclass
+class ResultadoLote:
+    """Resultado da vinculação de um arquivo destino do lote"""
+    arquivo_destino: str
+    arquivo_saida: str = None
+    total_linhas: int = 0
+    segundos: float = 0.0
+    erro: str = None
+
+    @property
+    def sucesso(self):
+        return self.erro is None
+
+
+def listar_destinos(entradas):
+    """Arquivos destino a partir de arquivos e/ou pastas (sem os resultados já vinculados)"""
+    if isinstance(entradas, (str, os.PathLike)):
+        entradas = [entradas]
+    destinos = []
+    for entrada in entradas:
+        entrada = Path(entrada)
+        if entrada.is_dir():
+            destinos.extend(str(a) for a in sorted(entrada.iterdir())
+                            if a.is_file() and a.suffix.lower() in EXTENSOES_DESTINO
+                            and not a.stem.endswith(SUFIXO_SAIDA) and not a.name.startswith('~$'))
+        else:
+            destinos.append(str(entrada))
+    # Um destino informado duas vezes é vinculado uma vez só
+    return list(dict.fromkeys(destinos))
+
+
+def caminho_saida(arquivo_destino, pasta_saida=None):
+    """Arquivo vinculado de um destino, na pasta de saída ou ao lado do destino"""
+    sugerido = mergeEngine.nome_saida_sugerido(arquivo_destino)
+    return str(Path(pasta_saida) / sugerido.name if pasta_saida else sugerido)
+
+
+def caminhos_saida(destinos, pasta_saida=None):
+    """Arquivo vinculado de cada destino, sem que dois destinos gravem no mesmo arquivo.
+
+    Destinos de mesmo nome em pastas diferentes (ex.: jan/clientes.xlsx e
+    fev/clientes.xlsx) recebem o nome da própria pasta como prefixo
+    (jan_clientes_vinculado.xlsx); se ainda assim houver repetição, nada é gravado.
+    """
+    def chave(caminho):
+        return os.path.normcase(os.path.abspath(caminho))
+
+    saidas = [caminho_saida(destino, pasta_saida) for destino in destinos]
+    repetidas = Counter(chave(saida) for saida in saidas)
+    for numero, destino in enumerate(destinos):
+        if repetidas[chave(saidas[numero])] > 1:
+            pasta = os.path.basename(os.path.dirname(os.path.abspath(destino)))
+            sugerido = Path(saidas[numero])
+            saidas[numero] = str(sugerido.with_name(f"{pasta}_{sugerido.name}"))
+
+    repetidas = Counter(chave(saida) for saida in saidas)
+    conflitos = list(dict.fromkeys(saida for saida in saidas if repetidas[chave(saida)] > 1))
+    if conflitos:
+        raise ValueError("Mais de um destino do lote gravaria o mesmo arquivo: " + ", ".join(conflitos))
+    return saidas
+
+
+# Origem preparada, recebida por cada processo do pool ao iniciar
+_origem = None
+
+
+def _iniciar_processo(indice, coluna, tradutor, config, cache):
+    global _origem
+    _origem = (indice, coluna, tradutor, config, cache)
+
+
+def _vincular_destino(arquivo_destino, arquivo_saida, formato=None):
+    """Lê, vincula e grava um destino usando a origem preparada do processo"""
+    indice, coluna, tradutor, config, cache = _origem
+    inicio = time.perf_counter()
+    try:
+        config = replace(config, arquivo_destino=arquivo_destino)
+        df2 = mergeEngine.carregar_destino(config, cache)
+        if isinstance(df2, dict):
+            df_merge = mergeEngine.juntar_abas(indice, coluna, tradutor, df2, config)
+        else:
+            destino = mergeEngine.preparar_destino(df2, config, tradutor)
+            df_merge = mergeEngine.juntar(indice, destino, coluna, config)
+        arquivo_saida = mergeEngine.salvar_resultado(
+            df_merge, arquivo_saida, mergeEngine.extensao_saida(arquivo_destino), formato)
+        return ResultadoLote(arquivo_destino, arquivo_saida, mergeEngine.total_linhas(df_merge),
+                             time.perf_counter() - inicio)
+    except Exception as e:
+        return ResultadoLote(arquivo_destino, segundos=time.perf_counter() - inicio, erro=str(e))
+
+
+def executar_lote(config, destinos, pasta_saida=None, formato=None, processos=None,
+                  cache=None, ao_concluir=None):
+    """Vincula a origem de `config` a cada destino, em paralelo.
+
+    `config.arquivo_destino` é ignorado; as colunas-chave e as colunas a copiar
+    valem para todos os destinos. `ao_concluir(resultado, concluidos, total)`
+    é chamado a cada arquivo terminado. Retorna a lista de ResultadoLote na
+    ordem dos destinos; um destino com erro não interrompe os demais.
+    """
+    config.validar()
+    destinos = listar_destinos(destinos)
+    if not destinos:
+        raise ValueError("Nenhum arquivo destino encontrado para o lote")
+    saidas = caminhos_saida(destinos, pasta_saida)
+    if pasta_saida:
+        Path(pasta_saida).mkdir(parents=True, exist_ok=True)
+
+    df1 = mergeEngine.carregar_origem(config, cache)
+    indice, coluna, tradutor = mergeEngine.preparar_origem(df1, config)
+    del df1
+
+    processos = max(1, min(processos or os.cpu_count() or 1, len(destinos)))
+    if isinstance(cache, mergeEngine.SessaoMerge):
+        # A sessão da interface (threads e leituras em andamento) não vai para
+        # outros processos; os destinos usam apenas o cache em disco dela
+        cache = cache.cache
+    origem = (indice, coluna, tradutor, config, cache)
+    tarefas = [(destino, saida, formato) for destino, saida in zip(destinos, saidas)]
+    resultados = {}
+
+    def concluir(resultado):
+        resultados[resultado.arquivo_destino] = resultado
+        if ao_concluir is not None:
+            ao_concluir(resultado, len(resultados), len(destinos))
+
+    if processos == 1:
+        _iniciar_processo(*origem)
+        try:
+            for tarefa in tarefas:
+                concluir(_vincular_destino(*tarefa))
+        finally:
+            _iniciar_processo(None, None, None, None, None)
+    else:
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                                 initargs=origem) as executor:
+            futuros = {executor.submit(_vincular_destino, *tarefa): tarefa[0] for tarefa in tarefas}
+            for futuro in as_completed(futuros):
+                try:
+                    concluir(futuro.result())
+                except Exception as e:
+                    # Falha do próprio processo (ex.: memória esgotada)
+                    concluir(ResultadoLote(futuros[futuro], erro=str(e) or type(e).__name__))
+    return [resultados[destino] for destino in destinos]
+
+
+def resumo_lote(resultados):
+    """Texto com o sucesso ou a falha de cada destino do lote"""
+    sucessos = [r for r in resultados if r.sucesso]
+    linhas = [f"{len(sucessos)} de {len(resultados)} arquivos vinculados"]
+    for r in resultados:
+        nome = Path(r.arquivo_destino).name
+        if r.sucesso:
+            linhas.append(f"✔ {nome}: {r.total_linhas:,} linhas -> {r.arquivo_saida} ({r.segundos:.1f}s)")
+        else:
+            linhas.append(f"✘ {nome}: {r.erro}")
+    return "\n".join(linhas)
@@ -0,0 +1,201 @@
+"""Benchmark da vinculação: tempo de leitura, junção e gravação por cenário.
+
+Cada cenário combina o número de linhas, o formato dos arquivos de entrada,
+o motor de leitura e o formato da saída. A vinculação é executada pelo próprio
+motor (executar_merge e salvar_resultado, sem o cache em disco) com um
+metricas.MedidorMerge, e a mediana das repetições de cada etapa vai para um
+JSON. Com uma base gravada anteriormente, as etapas que ficaram mais lentas
+que a tolerância são apontadas como regressão (código de saída 1).
+
+Uso (na pasta do projeto):
+    python -m benchmark.benchmarkMerge --linhas 10000 200000 --formatos csv xlsx --motores auto openpyxl
+    python -m benchmark.benchmarkMerge --linhas 10000 200000 --gravar-base
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import escritores
+import leitores
+import mergeEngine
+import metricas
+import progresso
+from benchmark import gerarDados
+
+
+ARQUIVO_BASE = Path(__file__).parent / "base.json"
+PASTA_RESULTADOS = Path(__file__).parent / "resultados"
+TOLERANCIA = 0.25
+# Diferenças menores que isto são ruído de medição, mesmo acima da tolerância
+MINIMO_SEGUNDOS = 0.05
+
+
+def motor_aplicavel(formato, motor):
+    """Indica se o motor de leitura lê arquivos do formato e está instalado"""
+    if motor == 'auto':
+        return True
+    if formato == 'csv':
+        aceitos = leitores.MOTORES_CSV
+    elif formato == 'xls':
+        aceitos = ('calamine', 'xlrd')
+    else:
+        aceitos = ('calamine', 'openpyxl')
+    return motor in aceitos and leitores.motor_disponivel(motor)
+
+
+def nome_cenario(linhas, formato, motor, formato_saida, duplicacao, colunas_origem):
+    return f"{formato}-{linhas}-{motor}-{formato_saida}-dup{duplicacao:g}-col{colunas_origem}"
+
+
+def medir(origem, destino, motor, formato_saida, pasta_saida):
+    """Executa uma vinculação completa e retorna o MedidorMerge com as etapas"""
+    config = mergeEngine.ConfigMerge.automatica(
+        str(origem), str(destino), "Codigo",
+        [c for c in mergeEngine.ler_cabecalho(origem) if c != "Codigo"], motor_leitura=motor)
+    medicao = progresso.Progresso(medidor=metricas.MedidorMerge())
+    df_merge = mergeEngine.executar_merge(config, progresso=medicao)
+    extensao = escritores.FORMATOS[formato_saida][1]
+    mergeEngine.salvar_resultado(df_merge, Path(pasta_saida) / f"saida{extensao}", formato=formato_saida,
+                                 progresso=medicao)
+    medicao.concluir()
+    return medicao.medidor, mergeEngine.total_linhas(df_merge)
+
+
+def executar_cenario(linhas, formato, motor, formato_saida, duplicacao, colunas_origem, repeticoes, pasta):
+    """Mediana de cada etapa (e do total) nas repetições de um cenário"""
+    origem, destino = gerarDados.gerar_cenario(linhas, formato, colunas_origem, duplicacao=duplicacao,
+                                               pasta=pasta)
+    medidas = []
+    with tempfile.TemporaryDirectory() as pasta_saida:
+        for _ in range(repeticoes):
+            medidas.append(medir(origem, destino, motor, formato_saida, pasta_saida))
+
+    etapas = {}
+    for medidor, _ in medidas:
+        for etapa in medidor.etapas:
+            etapas.setdefault(etapa.etapa, []).append(etapa.segundos)
+    return {
+        "parametros": {"linhas": linhas, "formato": formato, "motor": motor, "formato_saida": formato_saida,
+                       "duplicacao": duplicacao, "colunas_origem": colunas_origem},
+        "linhas_resultado": medidas[0][1],
+        "etapas": {nome: round(statistics.median(tempos), 4) for nome, tempos in etapas.items()},
+        "total": round(statistics.median(m.segundos for m, _ in medidas), 4),
+        "pico_memoria": max((m.pico_memoria or 0) for m, _ in medidas) or None,
+    }
+
+
+def comparar(resultados, base, tolerancia=TOLERANCIA):
+    """Etapas (e totais) mais lentas que a base além da tolerância: lista de (cenário, etapa, base, atual)"""
+    regressoes = []
+    for nome, atual in resultados["cenarios"].items():
+        anterior = base.get("cenarios", {}).get(nome)
+        if anterior is None:
+            continue
+        tempos = dict(atual["etapas"], Total=atual["total"])
+        tempos_base = dict(anterior["etapas"], Total=anterior["total"])
+        for etapa, segundos in tempos.items():
+            referencia = tempos_base.get(etapa)
+            if referencia is None:
+                continue
+            if segundos > referencia * (1 + tolerancia) and segundos - referencia > MINIMO_SEGUNDOS:
+                regressoes.append((nome, etapa, referencia, segundos))
+    return regressoes
+
+
+def resumo(resultados):
+    """Tabela com o tempo de cada etapa por cenário"""
+    linhas = []
+    for nome, cenario in resultados["cenarios"].items():
+        etapas = ", ".join(f"{etapa} {segundos:.2f}s" for etapa, segundos in cenario["etapas"].items())
+        memoria = f", pico {cenario['pico_memoria'] / 1e6:,.0f} MB" if cenario["pico_memoria"] else ""
+        linhas.append(f"{nome}: total {cenario['total']:.2f}s ({etapas}){memoria}")
+    return "\n".join(linhas)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Benchmark da leitura, junção e gravação da vinculação")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Linhas da origem e do destino (ex.: 10000 200000 2000000)")
+    parser.add_argument("--formatos", nargs="+", choices=gerarDados.FORMATOS, default=['csv', 'xlsx'],
+                        help="Formatos dos arquivos de entrada")
+    parser.add_argument("--motores", nargs="+", choices=leitores.MOTORES, default=['auto'],
+                        help="Motores de leitura (os que não se aplicam ao formato são ignorados)")
+    parser.add_argument("--saidas", nargs="+", choices=list(escritores.FORMATOS), default=['csv'],
+                        help="Formatos de gravação do resultado")
+    parser.add_argument("--duplicacao", type=float, nargs="+", default=[0.0],
+                        help="Fração das linhas da origem com chave repetida")
+    parser.add_argument("--colunas", type=int, nargs="+", default=[10],
+                        help="Colunas de dados da origem (todas são copiadas)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--dados", help=f"Pasta dos arquivos gerados (padrão: {gerarDados.PASTA_PADRAO})")
+    parser.add_argument("--saida", help=f"JSON dos resultados (padrão: {PASTA_RESULTADOS}/<data>.json)")
+    parser.add_argument("--base", default=str(ARQUIVO_BASE), help="JSON da base para detectar regressões")
+    parser.add_argument("--gravar-base", action="store_true", help="Grava os resultados como a nova base")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="Aumento de tempo aceito em relação à base (0.25 = 25%%)")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    resultados = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "cenarios": {},
+    }
+
+    for linhas, formato, motor, saida, duplicacao, colunas in itertools.product(
+            args.linhas, args.formatos, args.motores, args.saidas, args.duplicacao, args.colunas):
+        nome = nome_cenario(linhas, formato, motor, saida, duplicacao, colunas)
+        if not motor_aplicavel(formato, motor):
+            print(f"- {nome}: ignorado (motor não lê {formato} ou não está instalado)")
+            continue
+        if linhas > gerarDados.LIMITE_LINHAS.get(formato, linhas):
+            print(f"- {nome}: ignorado (acima do limite de linhas de {formato})")
+            continue
+        if saida.startswith('xlsx') and linhas >= escritores.MAX_LINHAS_EXCEL:
+            print(f"- {nome}: ignorado (resultado acima do limite do Excel)")
+            continue
+        print(f"- {nome}...", flush=True)
+        try:
+            resultados["cenarios"][nome] = executar_cenario(linhas, formato, motor, saida, duplicacao, colunas,
+                                                            args.repeticoes, args.dados)
+        except ValueError as e:
+            print(f"  ignorado: {e}")
+
+    print(resumo(resultados))
+    arquivo = Path(args.saida or PASTA_RESULTADOS / f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    arquivo.write_text(json.dumps(resultados, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Resultados gravados em: {arquivo}")
+
+    if args.gravar_base:
+        Path(args.base).write_text(json.dumps(resultados, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Base atualizada: {args.base}")
+        return 0
+
+    if not Path(args.base).exists():
+        print("Sem base para comparar (use --gravar-base)")
+        return 0
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    regressoes = comparar(resultados, base, args.tolerancia)
+    for nome, etapa, anterior, atual in regressoes:
+        print(f"REGRESSÃO {nome} / {etapa}: {anterior:.2f}s -> {atual:.2f}s (+{atual / anterior - 1:.0%})")
+    if regressoes:
+        return 1
+    print(f"Nenhuma regressão acima de {args.tolerancia:.0%} em relação à base")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Arquivos origem e destino sintéticos para o benchmark da vinculação.
+
+A origem tem a coluna-chave "Codigo" e colunas de tipos variados (valores,
+quantidades, UF, nomes e datas), como as exportações que o SAFE costuma
+receber; `duplicacao` é a fração das linhas da origem cuja chave repete a de
+outra linha. O destino tem as chaves da origem (com `correspondencia` de
+linhas que casam) e algumas colunas próprias. Os arquivos são gravados em
+CSV, xlsx ou xls e reaproveitados quando já existem com os mesmos parâmetros.
+
+Uso (na pasta do projeto):
+    python -m benchmark.gerarDados --linhas 100000 --formato xlsx --duplicacao 0.1
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import escritores
+
+
+FORMATOS = ('csv', 'xlsx', 'xls')
+# Linhas de dados que cabem em uma aba (o cabeçalho ocupa uma linha)
+LIMITE_LINHAS = {'xlsx': escritores.MAX_LINHAS_EXCEL - 1, 'xls': 65_535}
+PASTA_PADRAO = Path(__file__).parent / "dados"
+
+UFS = np.array(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'PE', 'CE', 'GO', 'DF', 'ES'])
+
+
+def _coluna(numero, linhas, rng):
+    """Valores da coluna `numero`, alternando entre os tipos comuns em planilhas"""
+    tipo = numero % 5
+    if tipo == 0:
+        return rng.normal(1_000, 250, linhas).round(2)
+    if tipo == 1:
+        return rng.integers(0, 10_000, linhas)
+    if tipo == 2:
+        return UFS[rng.integers(0, len(UFS), linhas)]
+    if tipo == 3:
+        return pd.Series(rng.integers(0, linhas, linhas)).map("Empresa {:07d}".format).to_numpy()
+    return pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1_800, linhas), unit="D")
+
+
+def gerar_origem(linhas, colunas=10, duplicacao=0.0, semente=0):
+    """Origem com a chave "Codigo" e `colunas` colunas de dados"""
+    if not 0 <= duplicacao < 1:
+        raise ValueError("A duplicação deve estar entre 0 e 1 (exclusive)")
+    rng = np.random.default_rng(semente)
+    unicas = max(1, round(linhas * (1 - duplicacao)))
+    chaves = np.concatenate([np.arange(unicas), rng.integers(0, unicas, linhas - unicas)])
+    rng.shuffle(chaves)
+    dados = {"Codigo": chaves}
+    for numero in range(colunas):
+        dados[f"Origem_{numero + 1}"] = _coluna(numero, linhas, rng)
+    return pd.DataFrame(dados)
+
+
+def gerar_destino(linhas, chaves_origem, colunas=5, correspondencia=0.9, semente=1):
+    """Destino com a chave "Codigo"; `correspondencia` é a fração de linhas com chave existente na origem"""
+    rng = np.random.default_rng(semente)
+    chaves_origem = np.unique(chaves_origem)
+    casam = rng.random(linhas) < correspondencia
+    chaves = np.where(casam, chaves_origem[rng.integers(0, len(chaves_origem), linhas)],
+                      chaves_origem.max() + 1 + rng.integers(0, max(linhas, 1), linhas))
+    dados = {"Codigo": chaves}
+    for numero in range(colunas):
+        dados[f"Destino_{numero + 1}"] = _coluna(numero, linhas, rng)
+    return pd.DataFrame(dados)
+
+
+def _gravar_xls(df, caminho):
+    """O pandas não grava mais .xls; usa o xlwt diretamente"""
+    try:
+        import xlwt
+    except ImportError:
+        raise ValueError("Gerar arquivos .xls exige o pacote xlwt (pip install xlwt)") from None
+    livro = xlwt.Workbook()
+    aba = livro.add_sheet("Planilha1")
+    formato_data = xlwt.easyxf(num_format_str="dd/mm/yyyy")
+    for coluna, nome in enumerate(df.columns):
+        aba.write(0, coluna, nome)
+        serie = df[nome]
+        datas = pd.api.types.is_datetime64_any_dtype(serie)
+        for linha, valor in enumerate(serie.tolist(), start=1):
+            if datas:
+                aba.write(linha, coluna, valor.to_pydatetime(), formato_data)
+            else:
+                aba.write(linha, coluna, valor)
+    livro.save(str(caminho))
+
+
+def gravar(df, caminho, formato):
+    """Grava o DataFrame no formato pedido (csv, xlsx ou xls)"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: '{formato}' (use {', '.join(FORMATOS)})")
+    limite = LIMITE_LINHAS.get(formato)
+    if limite is not None and len(df) > limite:
+        raise ValueError(f"{len(df):,} linhas não cabem em uma aba {formato} (limite: {limite:,})")
+    if formato == 'xls':
+        _gravar_xls(df, caminho)
+    else:
+        escritores.gravar(df, caminho, formato)
+
+
+def gerar_cenario(linhas, formato, colunas_origem=10, colunas_destino=5, duplicacao=0.0,
+                  correspondencia=0.9, pasta=None, semente=0):
+    """Caminhos da origem e do destino do cenário, gerando os arquivos que ainda não existem.
+
+    Origem e destino têm o mesmo número de linhas.
+    """
+    pasta = Path(pasta or PASTA_PADRAO)
+    pasta.mkdir(parents=True, exist_ok=True)
+    nome = f"{linhas}_o{colunas_origem}_d{colunas_destino}_dup{duplicacao:g}_c{correspondencia:g}_s{semente}"
+    origem = pasta / f"origem_{nome}.{formato}"
+    destino = pasta / f"destino_{nome}.{formato}"
+    if origem.exists() and destino.exists():
+        return origem, destino
+
+    df_origem = gerar_origem(linhas, colunas_origem, duplicacao, semente)
+    df_destino = gerar_destino(linhas, df_origem["Codigo"].to_numpy(), colunas_destino, correspondencia,
+                               semente + 1)
+    gravar(df_origem, origem, formato)
+    gravar(df_destino, destino, formato)
+    return origem, destino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera arquivos origem e destino sintéticos")
+    parser.add_argument("--linhas", type=int, required=True)
+    parser.add_argument("--formato", choices=FORMATOS, default='csv')
+    parser.add_argument("--colunas-origem", type=int, default=10)
+    parser.add_argument("--colunas-destino", type=int, default=5)
+    parser.add_argument("--duplicacao", type=float, default=0.0,
+                        help="Fração das linhas da origem com chave repetida (0 a 1)")
+    parser.add_argument("--correspondencia", type=float, default=0.9,
+                        help="Fração das linhas do destino com chave existente na origem")
+    parser.add_argument("--pasta", help=f"Pasta dos arquivos gerados (padrão: {PASTA_PADRAO})")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    try:
+        origem, destino = gerar_cenario(args.linhas, args.formato, args.colunas_origem, args.colunas_destino,
+                                        args.duplicacao, args.correspondencia, args.pasta, args.semente)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    print(f"Origem: {origem}\nDestino: {destino}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Cache em disco das planilhas já lidas pelo motor de vinculação.
+
+A leitura de .xlsx/.xls pelo pandas é a etapa mais lenta de um merge. Cada
+DataFrame lido é gravado em pickle, identificado pelo caminho absoluto,
+tamanho, data de modificação, aba e linhas puladas do arquivo original (e pelas
+colunas lidas, quando só parte delas é carregada); se o arquivo mudar, a chave
+muda e a entrada antiga acaba removida pela política LRU.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+
+DIRETORIO_PADRAO = Path.home() / ".safe_cache"
+LIMITE_PADRAO_MB = 1024
+EXTENSAO_CACHE = ".pkl"
+
+
+class CacheLeitura:
+    """Cache LRU em disco de DataFrames lidos de planilhas"""
+
+    def __init__(self, diretorio=None, limite_mb=None):
+        self.diretorio = Path(diretorio or os.environ.get("SAFE_CACHE_DIR", DIRETORIO_PADRAO))
+        if limite_mb is None:
+            limite_mb = float(os.environ.get("SAFE_CACHE_LIMITE_MB", LIMITE_PADRAO_MB))
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+
+    def chave(self, caminho, skiprows=0, sheet=0, projecao=None):
+        """Identificador da entrada: caminho absoluto, tamanho, mtime, aba, skiprows e colunas lidas"""
+        info = os.stat(caminho)
+        partes = [os.path.abspath(caminho), info.st_size, info.st_mtime_ns, sheet, skiprows]
+        if projecao is not None:
+            partes.append(projecao)
+        return hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()
+
+    def _arquivo(self, chave):
+        return self.diretorio / f"{chave}{EXTENSAO_CACHE}"
+
+    def obter(self, caminho, leitor, skiprows=0, sheet=0, projecao=None, progresso=None):
+        """Retorna o DataFrame do cache ou chama leitor() e guarda o resultado.
+
+        `progresso` é usado apenas para interromper antes de ler o pickle; a
+        leitura do arquivo original informa o próprio progresso (ver leitores.ler).
+        """
+        if str(caminho).lower().endswith(".csv"):
+            # A leitura de CSV já é rápida; não vale ocupar o cache com ela
+            return leitor()
+
+        arquivo = self._arquivo(self.chave(caminho, skiprows, sheet, projecao))
+        if arquivo.exists():
+            if progresso is not None:
+                progresso.verificar()
+            try:
+                df = pd.read_pickle(arquivo)
+                # Atualiza o horário de acesso para a política LRU
+                os.utime(arquivo)
+                return df
+            except Exception as e:
+                logging.warning(f"Entrada de cache inválida descartada ({arquivo}): {e}")
+                arquivo.unlink(missing_ok=True)
+
+        df = leitor()
+        self.guardar(arquivo, df)
+        return df
+
+    def guardar(self, arquivo, df):
+        """Grava a entrada de forma atômica e aplica o limite de tamanho"""
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        os.close(fd)
+        try:
+            # pd.to_pickle também aceita o dict de abas lido com todas as abas
+            pd.to_pickle(df, temporario)
+            os.replace(temporario, arquivo)
+        except Exception as e:
+            logging.warning(f"Não foi possível gravar o cache ({arquivo}): {e}")
+            Path(temporario).unlink(missing_ok=True)
+            return
+        self.aplicar_limite()
+
+    def entradas(self):
+        """Entradas do cache da menos para a mais recentemente usada"""
+        arquivos = [(a, a.stat()) for a in self.diretorio.glob(f"*{EXTENSAO_CACHE}")]
+        arquivos.sort(key=lambda item: item[1].st_mtime)
+        return arquivos
+
+    def aplicar_limite(self):
+        """Remove as entradas menos usadas até o cache caber no limite"""
+        entradas = self.entradas()
+        total = sum(info.st_size for _, info in entradas)
+        for arquivo, info in entradas:
+            if total <= self.limite_bytes:
+                break
+            arquivo.unlink(missing_ok=True)
+            total -= info.st_size
+
+    def limpar(self):
+        """Remove todas as entradas do cache"""
+        for arquivo, _ in self.entradas():
+            arquivo.unlink(missing_ok=True)
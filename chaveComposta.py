@@ -0,0 +1,87 @@
+"""Chaves compostas (várias colunas) convertidas em uma única chave inteira.
+
+Cada coluna-chave da origem é fatorada (pd.factorize) e os códigos das colunas
+são combinados um a um e fatorados de novo, de modo que o número resultante
+nunca estoura um int64. O destino é traduzido com o vocabulário da origem
+(get_indexer): combinações que não existem na origem recebem códigos negativos
+e nunca casam. O merge passa a ser feito por uma única coluna int64, tão
+rápido quanto o de uma chave simples. Colunas do destino com tipo diferente
+do da origem (ex.: CNPJ em texto x int64) são convertidas antes (ver tiposChave).
+"""
+import numpy as np
+import pandas as pd
+
+import tiposChave
+
+
+def colunas_chave(chave):
+    """Lista de colunas de uma chave simples (nome) ou composta (lista de nomes)"""
+    if isinstance(chave, (list, tuple)):
+        return list(chave)
+    return [chave] if chave else []
+
+
+class CodificadorChave:
+    """Vocabulário das colunas-chave da origem, usado para codificar a origem e o destino"""
+
+    def __init__(self, colunas):
+        self._vocabularios = []
+        self._combinacoes = []
+        codigos = None
+        for serie in colunas:
+            # Valores ausentes também formam um código, como no merge do pandas
+            indices, unicos = pd.factorize(serie, use_na_sentinel=False)
+            self._vocabularios.append(pd.Index(unicos))
+            if codigos is None:
+                codigos = indices.astype(np.int64)
+                continue
+            codigos, combinacoes = pd.factorize(codigos * len(unicos) + indices)
+            self._combinacoes.append(pd.Index(combinacoes))
+        self.codigos = codigos
+        # Vocabulário convertido para o tipo do destino, guardado entre blocos e abas
+        self._memorias = [{} for _ in self._vocabularios]
+        self._conversoes = []
+
+    def _posicoes(self, numero, serie):
+        """Posição de cada valor no vocabulário da coluna, com os dois lados no mesmo tipo"""
+        vocabulario = self._vocabularios[numero]
+        convertido, serie, conversao = tiposChave.conciliar(vocabulario.to_series(), serie, self._memorias[numero])
+        if not conversao.convertida:
+            return vocabulario.get_indexer(serie)
+        # Valores distintos na origem podem virar o mesmo (ex.: "1" e "01"): o código das linhas
+        # da origem já está definido, então vale o primeiro e os demais são informados no relatório
+        posicoes = pd.Series(np.arange(len(vocabulario)), index=pd.Index(convertido))
+        colididos = posicoes.index.duplicated() & pd.notna(posicoes.index)
+        conversao.colididas = int(colididos.sum())
+        conversao.exemplos_colididos = list(vocabulario[colididos][:tiposChave.EXEMPLOS])
+        self._conversoes.append(conversao)
+        posicoes = posicoes[~posicoes.index.duplicated()]
+        encontradas = posicoes.index.get_indexer(serie)
+        return np.where(encontradas >= 0, posicoes.to_numpy()[encontradas], -1)
+
+    def conversao(self):
+        """Conversões de tipo feitas nas colunas até agora (tiposChave.ConversaoChave ou None)"""
+        return tiposChave.ConversaoChave.total(self._conversoes)
+
+    def codificar(self, colunas):
+        """Códigos das colunas do destino no vocabulário da origem.
+
+        Combinações ausentes da origem recebem códigos negativos distintos entre
+        si, para que a análise das chaves continue contando valores únicos.
+        """
+        codigos = None
+        for numero, (serie, vocabulario) in enumerate(zip(colunas, self._vocabularios)):
+            indices = self._posicoes(numero, pd.Series(serie))
+            if codigos is None:
+                codigos = indices.astype(np.int64)
+                continue
+            combinados = np.where((codigos >= 0) & (indices >= 0), codigos * len(vocabulario) + indices, -1)
+            codigos = self._combinacoes[numero - 1].get_indexer(combinados).astype(np.int64)
+
+        desconhecidas = codigos < 0
+        if desconhecidas.any():
+            valores = pd.DataFrame({numero: pd.Series(serie).to_numpy()[desconhecidas]
+                                    for numero, serie in enumerate(colunas)})
+            grupos = valores.groupby(list(valores.columns), dropna=False, sort=False).ngroup()
+            codigos[desconhecidas] = -1 - grupos.to_numpy()
+        return codigos
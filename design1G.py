@@ -2,17 +2,93 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-import pandas as pd
-import os
 from pathlib import Path
+import multiprocessing
 import threading
 import uuid
 
+import analiseChaves
+import batchMerge
+import cacheLeitura
+import escritores
+import fuzzyJoin
+import incremental
+import leitores
+import mergeEngine
+import metricas
+import normalizacao
+import progresso
+import receitas
+import sqlEngine
+
+
+# Opção das listas de abas que vincula (destino) ou junta (origem) todas as abas
+TEXTO_TODAS_ABAS = "(todas as abas)"
+
+
+class SeletorChaves(ttk.Menubutton):
+    """Lista suspensa de múltipla escolha para as colunas-chave (chave simples ou composta)"""
+    
+    def __init__(self, parent, ao_alterar=None, **kwargs):
+        super().__init__(parent, text="Selecione...", **kwargs)
+        self.menu = tk.Menu(self, tearoff=False)
+        self.configure(menu=self.menu)
+        self._variaveis = {}
+        self._selecionadas = []
+        self._ao_alterar = ao_alterar
+        
+    def definir_opcoes(self, colunas):
+        """Troca as colunas disponíveis, limpando a seleção"""
+        self.menu.delete(0, tk.END)
+        self._variaveis = {}
+        self._selecionadas = []
+        for coluna in colunas:
+            variavel = tk.BooleanVar(value=False)
+            self._variaveis[coluna] = variavel
+            self.menu.add_checkbutton(label=str(coluna), variable=variavel, 
+                                      command=lambda c=coluna: self._alternar(c))
+        self._atualizar_texto()
+        
+    def _alternar(self, coluna):
+        # Mantém a ordem em que as colunas foram marcadas
+        if self._variaveis[coluna].get():
+            self._selecionadas.append(coluna)
+        elif coluna in self._selecionadas:
+            self._selecionadas.remove(coluna)
+        self._atualizar_texto()
+        if self._ao_alterar is not None:
+            self._ao_alterar()
+        
+    def _atualizar_texto(self):
+        texto = " + ".join(str(c) for c in self._selecionadas)
+        self.configure(text=texto or "Selecione...")
+        
+    def set(self, colunas):
+        """Seleciona uma coluna ou uma lista de colunas"""
+        colunas = colunas if isinstance(colunas, (list, tuple)) else [colunas]
+        self._selecionadas = [c for c in colunas if c in self._variaveis]
+        for coluna, variavel in self._variaveis.items():
+            variavel.set(coluna in self._selecionadas)
+        self._atualizar_texto()
+        
+    def get(self):
+        """Colunas selecionadas, na ordem em que foram marcadas"""
+        return list(self._selecionadas)
+
 
 class ExcelMergerApp:
     def __init__(self, root):
         self.root = root
         self.manual_selection = tk.BooleanVar(value=False)
+        self.streaming_mode = tk.BooleanVar(value=False)
+        self.lote_mode = tk.BooleanVar(value=False)
+        self.incremental_mode = tk.BooleanVar(value=False)
+        self.exportar_chaves = tk.BooleanVar(value=False)
+        self.progresso_atual = None
+        self._previa_agendada = None
+        self._geracao_previa = 0
+        self._receita_pendente = None
+        self.sessao = mergeEngine.SessaoMerge(cacheLeitura.CacheLeitura())
         self.setup_window()
         self.create_widgets()
         self.df1_columns = []
@@ -21,14 +97,14 @@ class ExcelMergerApp:
     def setup_window(self):
         """Configura a janela principal com design moderno usando ttkbootstrap"""
         self.root.title("SAFE - Sistema de Alocação e Formatação de Elementos")
-        self.root.geometry("700x650")
+        self.root.geometry("1150x650")
         self.root.resizable(True, True)
         
         # Centralizar janela
         self.root.update_idletasks()
-        x = (self.root.winfo_screenwidth() // 2) - (750 // 2)
+        x = (self.root.winfo_screenwidth() // 2) - (1150 // 2)
         y = (self.root.winfo_screenheight() // 2) - (650 // 2)
-        self.root.geometry(f"700x650+{x}+{y}")
+        self.root.geometry(f"1150x650+{x}+{y}")
         
     def create_widgets(self):
         """Cria interface moderna com ttkbootstrap"""
@@ -157,6 +233,20 @@ class ExcelMergerApp:
         self.spin_skip2.grid(row=0, column=3, padx=(5, 0))
         self.spin_skip2.set(0)
         
+        ttk.Label(skip_frame, text="Motor de leitura:", style='Info.TLabel').grid(row=1, column=0, sticky=tk.W, pady=(10, 0))
+        self.combo_motor = ttk.Combobox(skip_frame, values=leitores.MOTORES, width=12, state="readonly",
+                                        font=('Segoe UI', 10))
+        self.combo_motor.grid(row=1, column=1, padx=(5, 20), pady=(10, 0))
+        self.combo_motor.set('auto')
+        
+        ttk.Label(skip_frame, text="Aba - Origem:", style='Info.TLabel').grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
+        self.combo_aba1 = ttk.Combobox(skip_frame, width=20, state="readonly", font=('Segoe UI', 10))
+        self.combo_aba1.grid(row=2, column=1, padx=(5, 20), pady=(10, 0))
+        
+        ttk.Label(skip_frame, text="Destino:", style='Info.TLabel').grid(row=2, column=2, sticky=tk.W, pady=(10, 0))
+        self.combo_aba2 = ttk.Combobox(skip_frame, width=20, state="readonly", font=('Segoe UI', 10))
+        self.combo_aba2.grid(row=2, column=3, padx=(5, 0), pady=(10, 0))
+        
     def create_advanced_config_section(self, parent, row):
         """Cria seção de configurações avançada com seleção múltipla"""
         self.config_frame = ttk.LabelFrame(parent, text="⚙️ Configurações Avançadas", padding="20")
@@ -167,33 +257,88 @@ class ExcelMergerApp:
         
         # Coluna chave (modo automático)
         self.label_chave_auto = ttk.Label(self.config_frame, 
-                                         text="🔑 Coluna-chave (comum aos dois arquivos):", 
+                                         text="🔑 Coluna(s)-chave (comuns aos dois arquivos):", 
                                          style='Info.TLabel')
         self.label_chave_auto.grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
-        self.combo_chave = ttk.Combobox(self.config_frame, width=40, state="readonly", 
-                                       font=('Segoe UI', 10))
+        self.combo_chave = SeletorChaves(self.config_frame, ao_alterar=self._agendar_previa, width=40, 
+                                          bootstyle="primary-outline")
         self.combo_chave.grid(row=current_row, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=(0, 5))
         current_row += 1
         
         # Colunas chave (modo manual)
         self.label_chave_origem = ttk.Label(self.config_frame, 
-                                           text="🔑 Coluna-chave (Arquivo Origem):", 
+                                           text="🔑 Coluna(s)-chave (Arquivo Origem):", 
                                            style='Info.TLabel')
         self.label_chave_origem.grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
-        self.combo_chave_origem = ttk.Combobox(self.config_frame, width=40, state="readonly", 
-                                             font=('Segoe UI', 10))
+        self.combo_chave_origem = SeletorChaves(self.config_frame, ao_alterar=self._agendar_previa, width=40, 
+                                          bootstyle="primary-outline")
         self.combo_chave_origem.grid(row=current_row, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=(0, 5))
         current_row += 1
         
         self.label_chave_destino = ttk.Label(self.config_frame, 
-                                            text="🔑 Coluna-chave (Arquivo Destino):", 
+                                            text="🔑 Coluna(s)-chave (Arquivo Destino):", 
                                             style='Info.TLabel')
         self.label_chave_destino.grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
-        self.combo_chave_destino = ttk.Combobox(self.config_frame, width=40, state="readonly", 
-                                               font=('Segoe UI', 10))
+        self.combo_chave_destino = SeletorChaves(self.config_frame, ao_alterar=self._agendar_previa, width=40, 
+                                          bootstyle="primary-outline")
         self.combo_chave_destino.grid(row=current_row, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=(0, 5))
         current_row += 1
         
+        # Política para chaves repetidas na origem
+        ttk.Label(self.config_frame, text="🔁 Chaves duplicadas na origem:", 
+                 style='Info.TLabel').grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
+        self.combo_duplicadas = ttk.Combobox(self.config_frame, width=40, state="readonly", 
+                                            values=list(analiseChaves.POLITICAS_DUPLICADAS.values()),
+                                            font=('Segoe UI', 10))
+        self.combo_duplicadas.grid(row=current_row, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=(0, 5))
+        self.combo_duplicadas.set(analiseChaves.POLITICAS_DUPLICADAS['manter'])
+        current_row += 1
+        
+        # Colunas a copiar que já existem no destino
+        ttk.Label(self.config_frame, text="✏️ Colunas já existentes no destino:", 
+                 style='Info.TLabel').grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
+        self.combo_atualizacao = ttk.Combobox(self.config_frame, width=40, state="readonly", 
+                                             values=list(mergeEngine.MODOS_ATUALIZACAO.values()),
+                                             font=('Segoe UI', 10))
+        self.combo_atualizacao.grid(row=current_row, column=1, sticky=(tk.W, tk.E), padx=(10, 0), pady=(0, 5))
+        self.combo_atualizacao.set(mergeEngine.MODOS_ATUALIZACAO['acrescentar'])
+        self.combo_atualizacao.bind('<<ComboboxSelected>>', lambda e: self._agendar_previa())
+        current_row += 1
+        
+        # Normalização das colunas-chave
+        ttk.Label(self.config_frame, text="🧹 Normalizar colunas-chave:", 
+                 style='Info.TLabel').grid(row=current_row, column=0, sticky=(tk.W, tk.N), pady=(0, 5))
+        norm_frame = ttk.Frame(self.config_frame)
+        norm_frame.grid(row=current_row, column=1, sticky=tk.W, padx=(10, 0), pady=(0, 5))
+        self.normalizacao_vars = {}
+        etapas = [('numeros_como_texto', "Números como texto"), ('strip', "Remover espaços"),
+                  ('remover_acentos', "Remover acentos"), ('casefold', "Ignorar maiúsculas"),
+                  ('apenas_digitos', "Apenas dígitos")]
+        for i, (etapa, texto) in enumerate(etapas):
+            self.normalizacao_vars[etapa] = tk.BooleanVar(value=False)
+            ttk.Checkbutton(norm_frame, text=texto, variable=self.normalizacao_vars[etapa], 
+                           bootstyle="primary").grid(row=i // 3, column=i % 3, sticky=tk.W, padx=(0, 10), pady=2)
+        ttk.Label(norm_frame, text="Zeros à esquerda:", style='Info.TLabel').grid(row=2, column=0, sticky=tk.W, pady=2)
+        self.spin_zeros = ttk.Spinbox(norm_frame, from_=0, to=30, width=5, font=('Segoe UI', 10))
+        self.spin_zeros.grid(row=2, column=1, sticky=tk.W, pady=2)
+        self.spin_zeros.set(0)
+        current_row += 1
+        
+        # Junção aproximada (chaves parecidas, como nomes de empresas)
+        ttk.Label(self.config_frame, text="🔎 Junção aproximada:", 
+                 style='Info.TLabel').grid(row=current_row, column=0, sticky=tk.W, pady=(0, 5))
+        aproximada_frame = ttk.Frame(self.config_frame)
+        aproximada_frame.grid(row=current_row, column=1, sticky=tk.W, padx=(10, 0), pady=(0, 5))
+        self.juncao_aproximada = tk.BooleanVar(value=False)
+        ttk.Checkbutton(aproximada_frame, text="Vincular chaves parecidas", variable=self.juncao_aproximada, 
+                       bootstyle="primary").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        ttk.Label(aproximada_frame, text="Similaridade mínima:", style='Info.TLabel').grid(row=0, column=1, sticky=tk.W)
+        self.spin_similaridade = ttk.Spinbox(aproximada_frame, from_=0.5, to=1.0, increment=0.05, width=5, 
+                                            font=('Segoe UI', 10))
+        self.spin_similaridade.grid(row=0, column=2, sticky=tk.W, padx=(5, 0))
+        self.spin_similaridade.set(fuzzyJoin.SIMILARIDADE_MINIMA)
+        current_row += 1
+        
         # Separador
         ttk.Separator(self.config_frame, bootstyle="primary").grid(row=current_row, column=0, columnspan=2, 
                                                                  sticky=(tk.W, tk.E), pady=15)
@@ -235,9 +380,35 @@ class ExcelMergerApp:
         ttk.Button(btn_frame, text="Limpar Seleção", 
                   command=self.limpar_selecao_colunas, style='Custom.TButton').pack(side=tk.LEFT)
         
+        # Prévia do resultado ao lado dos seletores
+        self.create_result_preview(self.config_frame, current_row + 1)
+        
         # Inicialmente, esconde os campos de seleção manual
         self.toggle_manual_selection()
         
+    def create_result_preview(self, parent, linhas):
+        """Cria o painel com as primeiras linhas do resultado e a taxa de correspondência"""
+        previa_frame = ttk.LabelFrame(parent, text="👁️ Prévia do resultado", padding="10")
+        previa_frame.grid(row=0, column=2, rowspan=linhas, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(20, 0))
+        previa_frame.columnconfigure(0, weight=1)
+        previa_frame.rowconfigure(0, weight=1)
+        
+        self.tree_previa = ttk.Treeview(previa_frame, show="headings", height=14, bootstyle="primary")
+        scroll_y = ttk.Scrollbar(previa_frame, orient=tk.VERTICAL, command=self.tree_previa.yview, 
+                                bootstyle="primary")
+        scroll_x = ttk.Scrollbar(previa_frame, orient=tk.HORIZONTAL, command=self.tree_previa.xview, 
+                                bootstyle="primary")
+        self.tree_previa.configure(yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
+        self.tree_previa.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scroll_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        scroll_x.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        self.previa_var = tk.StringVar(value="Carregue as colunas para ver a prévia")
+        ttk.Label(previa_frame, textvariable=self.previa_var, style='Info.TLabel', 
+                 wraplength=380).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(10, 5))
+        ttk.Button(previa_frame, text="🔄 Atualizar Prévia", command=self.atualizar_previa, 
+                  style='Custom.TButton').grid(row=3, column=0, columnspan=2, sticky=tk.W)
+        
     def toggle_manual_selection(self):
         """Mostra ou esconde os campos de seleção manual com base no checkbox"""
         if self.manual_selection.get():
@@ -254,6 +425,7 @@ class ExcelMergerApp:
             self.combo_chave_origem.grid_remove()
             self.label_chave_destino.grid_remove()
             self.combo_chave_destino.grid_remove()
+        self._agendar_previa()
     
     def create_preview_button(self, parent, row):
         """Cria checkbox e botão de carregar colunas"""
@@ -265,6 +437,22 @@ class ExcelMergerApp:
                                           command=self.toggle_manual_selection)
         self.manual_check.pack(pady=(0, 10))
         
+        self.streaming_check = ttk.Checkbutton(button_frame, text="Modo Streaming (destino CSV grande)", 
+                                             variable=self.streaming_mode, bootstyle="primary")
+        self.streaming_check.pack(pady=(0, 10))
+        
+        self.lote_check = ttk.Checkbutton(button_frame, text="Modo Lote (vários arquivos destino)", 
+                                        variable=self.lote_mode, bootstyle="primary")
+        self.lote_check.pack(pady=(0, 10))
+        
+        self.incremental_check = ttk.Checkbutton(button_frame, text="Modo Incremental (refaz só o que mudou na origem)", 
+                                               variable=self.incremental_mode, bootstyle="primary")
+        self.incremental_check.pack(pady=(0, 10))
+        
+        self.chaves_check = ttk.Checkbutton(button_frame, text="Salvar chaves sem correspondência (CSV ao lado da saída)", 
+                                          variable=self.exportar_chaves, bootstyle="primary")
+        self.chaves_check.pack(pady=(0, 10))
+        
         self.btn_preview = ttk.Button(button_frame, text="🔍 Carregar Colunas", 
                                     command=self.preview_columns, style='Custom.TButton', 
                                     width=20, state="disabled")
@@ -280,6 +468,17 @@ class ExcelMergerApp:
                                      width=20, state="disabled")
         self.btn_execute.pack(side=tk.LEFT, padx=10)
         
+        self.btn_cancelar = ttk.Button(button_frame, text="⛔ Cancelar", 
+                                      command=self.cancelar_vinculacao, bootstyle="danger", 
+                                      width=15, state="disabled")
+        self.btn_cancelar.pack(side=tk.LEFT, padx=10)
+        
+        ttk.Button(button_frame, text="💾 Salvar Receita", command=self.salvar_receita, 
+                  style='Custom.TButton', width=16).pack(side=tk.LEFT, padx=10)
+        
+        ttk.Button(button_frame, text="📂 Abrir Receita", command=self.abrir_receita, 
+                  style='Custom.TButton', width=16).pack(side=tk.LEFT, padx=10)
+        
         self.label_contador = ttk.Label(button_frame, text="", style='Info.TLabel')
         self.label_contador.pack(side=tk.LEFT, padx=20)
         
@@ -296,11 +495,13 @@ class ExcelMergerApp:
         """Seleciona todas as colunas na listbox"""
         self.listbox_colunas.select_set(0, tk.END)
         self.atualizar_contador_colunas()
+        self._agendar_previa()
         
     def limpar_selecao_colunas(self):
         """Limpa seleção de colunas"""
         self.listbox_colunas.selection_clear(0, tk.END)
         self.atualizar_contador_colunas()
+        self._agendar_previa()
         
     def atualizar_contador_colunas(self):
         """Atualiza contador de colunas selecionadas"""
@@ -312,6 +513,64 @@ class ExcelMergerApp:
         else:
             self.label_contador.config(text=f"📊 {selecionadas} colunas selecionadas", style='Info.TLabel')
             
+    def _colunas_alteradas(self, event=None):
+        self.atualizar_contador_colunas()
+        self._agendar_previa()
+        
+    def _agendar_previa(self):
+        """Recalcula a prévia após uma pausa, para não refazer a cada clique"""
+        if self._previa_agendada is not None:
+            self.root.after_cancel(self._previa_agendada)
+        self._previa_agendada = self.root.after(500, self.atualizar_previa)
+        
+    def atualizar_previa(self):
+        """Vincula a origem às primeiras linhas do destino em segundo plano"""
+        self._previa_agendada = None
+        # Resultados de prévias anteriores, ainda em andamento, são descartados
+        self._geracao_previa += 1
+        if not self.df1_columns:
+            self.previa_var.set("Carregue as colunas para ver a prévia")
+            return
+        try:
+            config = self._montar_config()
+            config.validar()
+        except ValueError as e:
+            self._limpar_previa()
+            self.previa_var.set(f"⚠️ {e}")
+            return
+        self.previa_var.set("⏳ Calculando prévia...")
+        threading.Thread(target=self._previa_thread, args=(config, self._geracao_previa), daemon=True).start()
+        
+    def _previa_thread(self, config, geracao):
+        try:
+            previa = mergeEngine.previsualizar(config, self.sessao)
+        except Exception as e:
+            self.root.after(0, lambda msg=str(e): self._mostrar_previa(geracao, erro=msg))
+        else:
+            self.root.after(0, lambda: self._mostrar_previa(geracao, previa))
+            
+    def _limpar_previa(self):
+        self.tree_previa.delete(*self.tree_previa.get_children())
+        self.tree_previa.configure(columns=())
+        
+    def _mostrar_previa(self, geracao, previa=None, erro=None):
+        if geracao != self._geracao_previa:
+            return
+        self._limpar_previa()
+        if erro is not None:
+            self.previa_var.set(f"❌ {erro}")
+            return
+        df = previa.resultado
+        colunas = [str(c) for c in df.columns]
+        self.tree_previa.configure(columns=colunas)
+        for coluna in colunas:
+            self.tree_previa.heading(coluna, text=coluna)
+            self.tree_previa.column(coluna, width=110, minwidth=60, stretch=False)
+        for linha in df.astype(object).where(df.notna(), "").itertuples(index=False):
+            self.tree_previa.insert("", tk.END, values=[str(v) for v in linha])
+        self.previa_var.set(f"🎯 {previa.resumo()}\n"
+                            f"{len(df):,} linhas na prévia (primeiras {previa.correspondencia.linhas_destino:,} do destino)")
+            
     def selecionar_arquivo1(self):
         """Seleciona o arquivo origem"""
         caminho = filedialog.askopenfilename(
@@ -322,6 +581,7 @@ class ExcelMergerApp:
             self.entrada_arquivo1.delete(0, tk.END)
             self.entrada_arquivo1.insert(0, caminho)
             self.validar_arquivo(caminho, 1)
+            self._carregar_abas(caminho, self.combo_aba1)
             self.check_ready_state()
             
     def selecionar_arquivo2(self):
@@ -334,18 +594,13 @@ class ExcelMergerApp:
             self.entrada_arquivo2.delete(0, tk.END)
             self.entrada_arquivo2.insert(0, caminho)
             self.validar_arquivo(caminho, 2)
+            self._carregar_abas(caminho, self.combo_aba2)
             self.check_ready_state()
             
     def validar_arquivo(self, caminho, numero):
         """Valida se o arquivo existe e é legível"""
         try:
-            if not os.path.exists(caminho):
-                raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
-                
-            if caminho.lower().endswith('.csv'):
-                pd.read_csv(caminho, nrows=1)
-            else:
-                pd.read_excel(caminho, nrows=1)
+            self.sessao.validar(caminho)
                 
             self.status_var.set(f"✅ Arquivo {numero} carregado com sucesso!")
             self.status_label.configure(style='Success.TLabel')
@@ -357,12 +612,30 @@ class ExcelMergerApp:
             self.status_var.set(f"❌ Erro no arquivo {numero}")
             self.status_label.configure(style='Error.TLabel')
             
+    def _carregar_abas(self, caminho, combo):
+        """Preenche a lista de abas da planilha (vazia para CSV)"""
+        try:
+            abas = leitores.nomes_abas(caminho, self.combo_motor.get())
+        except Exception:
+            # Erros de leitura já foram reportados na validação do arquivo
+            abas = []
+        combo.config(values=abas + [TEXTO_TODAS_ABAS] if abas else [])
+        combo.set(abas[0] if abas else "")
+        
+    def _aba(self, combo):
+        """Aba escolhida no formato aceito pelo motor (nome, 0 ou TODAS_ABAS)"""
+        texto = combo.get()
+        if texto == TEXTO_TODAS_ABAS:
+            return leitores.TODAS_ABAS
+        return texto or 0
+            
     def check_ready_state(self):
         """Verifica se pode habilitar os botões"""
         arquivo1_ok = bool(self.entrada_arquivo1.get().strip())
         arquivo2_ok = bool(self.entrada_arquivo2.get().strip())
         
         if arquivo1_ok and arquivo2_ok:
+            self._pre_carregar_arquivos()
             self.btn_preview.config(state="normal")
             self.status_var.set("✅ Arquivos prontos! Clique em 'Carregar Colunas'")
             self.status_label.configure(style='Success.TLabel')
@@ -370,6 +643,23 @@ class ExcelMergerApp:
             self.btn_preview.config(state="disabled")
             self.btn_execute.config(state="disabled")
             
+    def _pre_carregar_arquivos(self):
+        """Inicia em segundo plano a leitura completa do arquivo destino.
+
+        A origem não é pré-carregada: na execução são lidas apenas a chave e as
+        colunas a copiar, o que é bem mais rápido em exportações com muitas colunas.
+        """
+        arquivo1 = self.entrada_arquivo1.get().strip()
+        arquivo2 = self.entrada_arquivo2.get().strip()
+        self.sessao.manter_apenas([arquivo1, arquivo2])
+        try:
+            skip2 = int(self.spin_skip2.get())
+            motor = self.combo_motor.get()
+            self.sessao.pre_carregar(arquivo2, skip2, motor, self._aba(self.combo_aba2))
+        except (ValueError, OSError):
+            # Erros de leitura são reportados ao carregar colunas ou executar
+            pass
+            
     def preview_columns(self):
         """Carrega e exibe as colunas disponíveis"""
         try:
@@ -403,18 +693,12 @@ class ExcelMergerApp:
                 self.root.after(0, lambda: self._handle_column_error("Os campos 'Pular linhas' devem ser números inteiros"))
                 return
                 
-            if arquivo1.lower().endswith('.csv'):
-                df1 = pd.read_csv(arquivo1, skiprows=skip1, nrows=5)
-            else:
-                df1 = pd.read_excel(arquivo1, skiprows=skip1, nrows=5)
-                
-            if arquivo2.lower().endswith('.csv'):
-                df2 = pd.read_csv(arquivo2, skiprows=skip2, nrows=5)
-            else:
-                df2 = pd.read_excel(arquivo2, skiprows=skip2, nrows=5)
+            self.df1_columns = self.sessao.cabecalho(arquivo1, skip1, self._aba(self.combo_aba1))
+            self.df2_columns = self.sessao.cabecalho(arquivo2, skip2, self._aba(self.combo_aba2))
             
-            self.df1_columns = list(df1.columns)
-            self.df2_columns = list(df2.columns)
+            # Garante a leitura completa do destino com as linhas puladas definitivas
+            motor = self.combo_motor.get()
+            self.sessao.pre_carregar(arquivo2, skip2, motor, self._aba(self.combo_aba2))
             
             if not self.manual_selection.get():
                 colunas_comuns = list(set(self.df1_columns) & set(self.df2_columns))
@@ -431,8 +715,8 @@ class ExcelMergerApp:
         self.progress.stop()
         
         if self.manual_selection.get():
-            self.combo_chave_origem['values'] = self.df1_columns
-            self.combo_chave_destino['values'] = self.df2_columns
+            self.combo_chave_origem.definir_opcoes(self.df1_columns)
+            self.combo_chave_destino.definir_opcoes(self.df2_columns)
             if self.df1_columns:
                 self.combo_chave_origem.set(self.df1_columns[0])
             if self.df2_columns:
@@ -442,7 +726,7 @@ class ExcelMergerApp:
             self.status_label.configure(style='Success.TLabel')
         else:
             colunas_comuns = list(set(self.df1_columns) & set(self.df2_columns))
-            self.combo_chave['values'] = colunas_comuns
+            self.combo_chave.definir_opcoes(colunas_comuns)
             if colunas_comuns:
                 self.combo_chave.set(colunas_comuns[0])
             self.btn_execute.config(state="normal")
@@ -454,13 +738,16 @@ class ExcelMergerApp:
         for coluna in self.df1_columns:
             self.listbox_colunas.insert(tk.END, coluna)
             
-        self.listbox_colunas.bind('<<ListboxSelect>>', 
-                                 lambda e: self.atualizar_contador_colunas())
+        self.listbox_colunas.bind('<<ListboxSelect>>', self._colunas_alteradas)
+        if self._receita_pendente is not None:
+            self._aplicar_selecao_receita(self._receita_pendente)
+            self._receita_pendente = None
         self.toggle_manual_selection()
         
     def _handle_column_error(self, error_msg):
         """Trata erros no carregamento de colunas"""
         self.progress.stop()
+        self._receita_pendente = None
         messagebox.showerror("❌ Erro ao Carregar Colunas", error_msg, parent=self.root)
         self.status_var.set("❌ Erro ao carregar colunas")
         self.status_label.configure(style='Error.TLabel')
@@ -470,13 +757,30 @@ class ExcelMergerApp:
         if not self.validar_inputs():
             return
             
+        if self.lote_mode.get():
+            self.executar_lote()
+            return
+            
+        if self.streaming_mode.get():
+            self.executar_streaming()
+            return
+            
+        if self.incremental_mode.get():
+            self.executar_incremental()
+            return
+            
         try:
+            config = self._montar_config()
+            if sqlEngine.recomendado(config):
+                self.executar_fora_da_memoria(config)
+                return
+            
             self.progress.start()
             self.btn_execute.config(state="disabled")
             self.status_var.set("⚙️ Processando vinculação...")
             self.status_label.configure(style='Info.TLabel')
             
-            thread = threading.Thread(target=self._executar_merge_thread)
+            thread = threading.Thread(target=self._executar_merge_thread, args=(config, self._novo_progresso()))
             thread.daemon = True
             thread.start()
             
@@ -487,89 +791,504 @@ class ExcelMergerApp:
             self.status_var.set("❌ Erro na vinculação")
             self.status_label.configure(style='Error.TLabel')
             
-    def _executar_merge_thread(self):
-        """Thread para executar o merge sem travar a interface"""
+    def executar_streaming(self):
+        """Executa a vinculação em blocos, gravando direto no CSV de saída"""
         try:
-            arquivo1 = self.entrada_arquivo1.get()
-            arquivo2 = self.entrada_arquivo2.get()
-            skip1 = int(self.spin_skip1.get())
-            skip2 = int(self.spin_skip2.get())
+            config = self._montar_config()
+            if not mergeEngine.eh_csv(config.arquivo_destino):
+                raise ValueError("O modo streaming exige um arquivo destino CSV")
             
-            indices_selecionados = self.listbox_colunas.curselection()
-            colunas_selecionadas = [self.df1_columns[i] for i in indices_selecionados]
+            # No streaming o arquivo de saída precisa ser escolhido antes do merge
+            nome_sugerido = mergeEngine.nome_saida_sugerido(config.arquivo_destino)
+            nome_saida = filedialog.asksaveasfilename(
+                title="Salvar Arquivo Vinculado",
+                initialdir=nome_sugerido.parent,
+                initialfile=nome_sugerido.name,
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")]
+            )
+            if not nome_saida:
+                return
             
-            if arquivo1.lower().endswith('.csv'):
-                df1 = pd.read_csv(arquivo1, skiprows=skip1)
-            else:
-                df1 = pd.read_excel(arquivo1, skiprows=skip1)
-                
-            if arquivo2.lower().endswith('.csv'):
-                df2 = pd.read_csv(arquivo2, skiprows=skip2)
-            else:
-                df2 = pd.read_excel(arquivo2, skiprows=skip2)
-            
-            if self.manual_selection.get():
-                chave_origem = self.combo_chave_origem.get()
-                chave_destino = self.combo_chave_destino.get()
-                if not chave_origem or not chave_destino:
-                    raise ValueError("Selecione as colunas-chave para ambos os arquivos")
-                df1 = df1.rename(columns={chave_origem: chave_destino})
-                chave = chave_destino
-            else:
-                chave = self.combo_chave.get()
-                if not chave:
-                    raise ValueError("Selecione a coluna-chave")
-            
-            if chave not in df1.columns or chave not in df2.columns:
-                raise ValueError(f"Coluna-chave '{chave}' não encontrada em um dos arquivos")
-                
-            for coluna in colunas_selecionadas:
-                if coluna not in df1.columns:
-                    raise ValueError(f"Coluna '{coluna}' não encontrada no arquivo origem")
+            self.progress.start()
+            self.btn_execute.config(state="disabled")
+            self.status_var.set("⚙️ Processando vinculação em blocos...")
+            self.status_label.configure(style='Info.TLabel')
+            
+            thread = threading.Thread(target=self._executar_streaming_thread, 
+                                      args=(config, nome_saida, self._novo_progresso()))
+            thread.daemon = True
+            thread.start()
+            
+        except Exception as e:
+            self.progress.stop()
+            self.btn_execute.config(state="normal")
+            messagebox.showerror("❌ Erro", f"Erro inesperado:\n{str(e)}", parent=self.root)
+            self.status_var.set("❌ Erro na vinculação")
+            self.status_label.configure(style='Error.TLabel')
+            
+    def _executar_streaming_thread(self, config, nome_saida, progresso_merge):
+        """Thread para o merge em blocos sem travar a interface"""
+        try:
+            relatorio = self._novo_relatorio()
+            total_linhas = mergeEngine.executar_merge_streaming(config, nome_saida, cache=self.sessao,
+                                                                progresso=progresso_merge, relatorio=relatorio)
+            self._registrar_metricas(progresso_merge, relatorio, config, nome_saida, total_linhas, 'streaming')
+            self.root.after(0, lambda: self._merge_success(nome_saida, total_linhas,
+                                                         len(config.colunas), config.colunas, relatorio))
+        except progresso.MergeCancelado:
+            self.root.after(0, self._merge_cancelado)
+        except Exception as e:
+            self.root.after(0, lambda: self._merge_error(str(e)))
+            
+    def executar_fora_da_memoria(self, config):
+        """Vincula arquivos maiores que a memória pelo SQLite, gravando a saída em blocos"""
+        try:
+            # Como no streaming, o arquivo de saída precisa ser escolhido antes do merge
+            extensao = mergeEngine.extensao_saida(config.arquivo_destino)
+            formato_inicial = 'csv' if extensao == '.csv' else 'xlsx'
+            tipo_escolhido = tk.StringVar(value=escritores.FORMATOS[formato_inicial][0])
+            nome_sugerido = mergeEngine.nome_saida_sugerido(config.arquivo_destino)
+            nome_saida = filedialog.asksaveasfilename(
+                title="Arquivos grandes: vinculação fora da memória",
+                initialdir=nome_sugerido.parent,
+                initialfile=nome_sugerido.name,
+                filetypes=escritores.tipos_arquivo(formato_inicial),
+                typevariable=tipo_escolhido
+            )
+            if not nome_saida:
+                return
+            formato = escritores.resolver_formato(nome_saida, tipo_escolhido.get())
+            
+            self.progress.start()
+            self.btn_execute.config(state="disabled")
+            self.status_var.set("⚙️ Vinculando fora da memória (SQLite)...")
+            self.status_label.configure(style='Info.TLabel')
+            
+            thread = threading.Thread(target=self._executar_fora_da_memoria_thread,
+                                      args=(config, nome_saida, formato, self._novo_progresso()))
+            thread.daemon = True
+            thread.start()
+            
+        except Exception as e:
+            self.progress.stop()
+            self.btn_execute.config(state="normal")
+            messagebox.showerror("❌ Erro", f"Erro inesperado:\n{str(e)}", parent=self.root)
+            self.status_var.set("❌ Erro na vinculação")
+            self.status_label.configure(style='Error.TLabel')
+            
+    def _executar_fora_da_memoria_thread(self, config, nome_saida, formato, progresso_merge):
+        """Thread para a vinculação pelo SQLite sem travar a interface"""
+        try:
+            relatorio = self._novo_relatorio()
+            caminho_saida, total_linhas = sqlEngine.executar_merge_sql(config, nome_saida, formato, relatorio,
+                                                                       progresso_merge)
+            self._registrar_metricas(progresso_merge, relatorio, config, caminho_saida, total_linhas,
+                                     'fora_da_memoria', formato)
+            self.root.after(0, lambda: self._merge_success(caminho_saida, total_linhas, len(config.colunas),
+                                                         config.colunas, relatorio))
+        except progresso.MergeCancelado:
+            self.root.after(0, self._merge_cancelado)
+        except Exception as e:
+            self.root.after(0, lambda: self._merge_error(str(e)))
+            
+    def executar_incremental(self):
+        """Executa a vinculação incremental sobre o último resultado gravado"""
+        try:
+            config = self._montar_config()
+            
+            # O estado incremental é guardado por arquivo de saída, escolhido antes do merge
+            extensao = mergeEngine.extensao_saida(config.arquivo_destino)
+            formato_inicial = 'csv' if extensao == '.csv' else 'xlsx'
+            tipo_escolhido = tk.StringVar(value=escritores.FORMATOS[formato_inicial][0])
+            nome_sugerido = mergeEngine.nome_saida_sugerido(config.arquivo_destino)
+            nome_saida = filedialog.asksaveasfilename(
+                title="Arquivo Vinculado (atualizado se já existir)",
+                initialdir=nome_sugerido.parent,
+                initialfile=nome_sugerido.name,
+                filetypes=escritores.tipos_arquivo(formato_inicial),
+                typevariable=tipo_escolhido,
+                confirmoverwrite=False
+            )
+            if not nome_saida:
+                return
+            formato = escritores.resolver_formato(nome_saida, tipo_escolhido.get())
+            
+            self.progress.start()
+            self.btn_execute.config(state="disabled")
+            self.status_var.set("⚙️ Comparando a origem com a última execução...")
+            self.status_label.configure(style='Info.TLabel')
+            
+            thread = threading.Thread(target=self._executar_incremental_thread, 
+                                      args=(config, nome_saida, formato, self._novo_progresso()))
+            thread.daemon = True
+            thread.start()
+            
+        except Exception as e:
+            self.progress.stop()
+            self.btn_execute.config(state="normal")
+            messagebox.showerror("❌ Erro", f"Erro inesperado:\n{str(e)}", parent=self.root)
+            self.status_var.set("❌ Erro na vinculação")
+            self.status_label.configure(style='Error.TLabel')
+            
+    def _executar_incremental_thread(self, config, nome_saida, formato, progresso_merge):
+        """Thread para a vinculação incremental sem travar a interface"""
+        try:
+            relatorio = mergeEngine.RelatorioMerge()
+            caminho_saida, total_linhas = incremental.executar_incremental(config, nome_saida, formato,
+                                                                          self.sessao, relatorio,
+                                                                          progresso=progresso_merge)
+            self._registrar_metricas(progresso_merge, relatorio, config, caminho_saida, total_linhas,
+                                     'incremental')
+            self.root.after(0, lambda: self._merge_success(caminho_saida, total_linhas, len(config.colunas),
+                                                         config.colunas, relatorio))
+        except progresso.MergeCancelado:
+            self.root.after(0, self._merge_cancelado)
+        except Exception as e:
+            self.root.after(0, lambda: self._merge_error(str(e)))
+            
+    def executar_lote(self):
+        """Vincula a origem a vários arquivos destino em paralelo"""
+        try:
+            config = self._montar_config()
+            pasta_destino = Path(config.arquivo_destino).parent
+            destinos = filedialog.askopenfilenames(
+                title="Selecionar Arquivos Destino do Lote",
+                initialdir=pasta_destino,
+                filetypes=[("Excel/CSV files", "*.xlsx *.xls *.csv"), ("Todos os arquivos", "*.*")]
+            )
+            if not destinos:
+                return
+            pasta_saida = filedialog.askdirectory(title="Pasta para os Arquivos Vinculados",
+                                                  initialdir=pasta_destino)
+            if not pasta_saida:
+                return
+            
+            self.btn_execute.config(state="disabled")
+            self.progress.config(mode='determinate', maximum=len(destinos), value=0)
+            self.status_var.set(f"⚙️ Processando lote de {len(destinos)} arquivos...")
+            self.status_label.configure(style='Info.TLabel')
+            
+            thread = threading.Thread(target=self._executar_lote_thread, 
+                                      args=(config, list(destinos), pasta_saida))
+            thread.daemon = True
+            thread.start()
+            
+        except Exception as e:
+            self.btn_execute.config(state="normal")
+            messagebox.showerror("❌ Erro", f"Erro inesperado:\n{str(e)}", parent=self.root)
+            self.status_var.set("❌ Erro na vinculação")
+            self.status_label.configure(style='Error.TLabel')
+            
+    def _executar_lote_thread(self, config, destinos, pasta_saida):
+        """Thread que acompanha o lote sem travar a interface"""
+        def progresso(resultado, concluidos, total):
+            self.root.after(0, lambda: self._lote_progresso(resultado, concluidos, total))
+            
+        try:
+            resultados = batchMerge.executar_lote(config, destinos, pasta_saida, 
+                                                  cache=self.sessao, ao_concluir=progresso)
+            self.root.after(0, lambda: self._lote_concluido(resultados))
+        except Exception as e:
+            self.root.after(0, lambda: self._lote_erro(str(e)))
+            
+    def _lote_progresso(self, resultado, concluidos, total):
+        """Atualiza a barra de progresso a cada arquivo do lote concluído"""
+        self.progress.config(value=concluidos)
+        situacao = "✔" if resultado.sucesso else "✘"
+        self.status_var.set(f"⚙️ Lote: {concluidos}/{total} — {situacao} {Path(resultado.arquivo_destino).name}")
+        
+    def _lote_concluido(self, resultados):
+        """Mostra o resumo por arquivo ao final do lote"""
+        self.progress.config(mode='indeterminate', value=0)
+        self.btn_execute.config(state="normal")
+        falhas = [r for r in resultados if not r.sucesso]
+        resumo = batchMerge.resumo_lote(resultados)
+        if falhas:
+            self.status_var.set(f"⚠️ Lote concluído com {len(falhas)} falha(s)")
+            self.status_label.configure(style='Error.TLabel')
+            messagebox.showwarning("⚠️ Lote Concluído com Falhas", resumo, parent=self.root)
+        else:
+            self.status_var.set("🎉 Lote concluído com sucesso!")
+            self.status_label.configure(style='Success.TLabel')
+            messagebox.showinfo("🎉 Lote Concluído", resumo, parent=self.root)
+            
+    def _lote_erro(self, error_msg):
+        """Trata erro que impediu o lote de começar (ex.: origem inválida)"""
+        self._merge_error(error_msg)
+            
+    def _politica_duplicadas(self):
+        """Política de chaves duplicadas correspondente à opção escolhida"""
+        escolhida = self.combo_duplicadas.get()
+        for politica, descricao in analiseChaves.POLITICAS_DUPLICADAS.items():
+            if descricao == escolhida:
+                return politica
+        return 'manter'
+        
+    def _modo_atualizacao(self):
+        """Modo de atualização das colunas existentes correspondente à opção escolhida"""
+        escolhido = self.combo_atualizacao.get()
+        for modo, descricao in mergeEngine.MODOS_ATUALIZACAO.items():
+            if descricao == escolhido:
+                return modo
+        return 'acrescentar'
+            
+    def _opcoes_normalizacao(self):
+        """Opções de normalização marcadas na interface"""
+        etapas = [etapa for etapa, var in self.normalizacao_vars.items() if var.get()]
+        try:
+            zeros = int(self.spin_zeros.get())
+        except ValueError:
+            zeros = 0
+        return normalizacao.opcoes_de_nomes(etapas, zeros)
             
-            colunas_merge = [chave] + [col for col in colunas_selecionadas if col != chave]
+    def _opcoes_aproximada(self):
+        """Opções da junção aproximada marcadas na interface"""
+        try:
+            similaridade = float(self.spin_similaridade.get().replace(',', '.'))
+        except ValueError:
+            similaridade = fuzzyJoin.SIMILARIDADE_MINIMA
+        return {'juncao_aproximada': self.juncao_aproximada.get(), 'similaridade_minima': similaridade}
             
-            df_merge = df2.merge(df1[colunas_merge], on=chave, how='left')
+    def _montar_config(self):
+        """Monta a configuração do motor de vinculação a partir dos widgets"""
+        indices_selecionados = self.listbox_colunas.curselection()
+        colunas_selecionadas = [self.df1_columns[i] for i in indices_selecionados]
+        
+        arquivo1 = self.entrada_arquivo1.get()
+        arquivo2 = self.entrada_arquivo2.get()
+        skip1 = int(self.spin_skip1.get())
+        skip2 = int(self.spin_skip2.get())
+        
+        if self.manual_selection.get():
+            return mergeEngine.ConfigMerge(arquivo1, arquivo2,
+                                           self.combo_chave_origem.get(),
+                                           self.combo_chave_destino.get(),
+                                           colunas_selecionadas,
+                                           skip_origem=skip1, skip_destino=skip2,
+                                           motor_leitura=self.combo_motor.get(),
+                                           duplicadas=self._politica_duplicadas(),
+                                           atualizacao=self._modo_atualizacao(),
+                                           normalizar_chave=self._opcoes_normalizacao(),
+                                           aba_origem=self._aba(self.combo_aba1),
+                                           aba_destino=self._aba(self.combo_aba2),
+                                           **self._opcoes_aproximada())
+        return mergeEngine.ConfigMerge.automatica(arquivo1, arquivo2, self.combo_chave.get(),
+                                                  colunas_selecionadas,
+                                                  skip_origem=skip1, skip_destino=skip2,
+                                                  motor_leitura=self.combo_motor.get(),
+                                                  duplicadas=self._politica_duplicadas(),
+                                                  atualizacao=self._modo_atualizacao(),
+                                                  normalizar_chave=self._opcoes_normalizacao(),
+                                                  aba_origem=self._aba(self.combo_aba1),
+                                                  aba_destino=self._aba(self.combo_aba2),
+                                                  **self._opcoes_aproximada())
             
-            arquivo_base = Path(arquivo2)
-            extensao = '.csv' if arquivo2.lower().endswith('.csv') else '.xlsx'
-            nome_sugerido = f"{arquivo_base.stem}_vinculado{extensao}"
+    def salvar_receita(self):
+        """Grava a configuração atual como receita JSON, para repetir o merge depois"""
+        if not self.validar_inputs():
+            return
+        nome = filedialog.asksaveasfilename(title="Salvar Receita", defaultextension=receitas.EXTENSAO_RECEITA,
+                                            filetypes=[("Receita SAFE", "*.json")], parent=self.root)
+        if not nome:
+            return
+        try:
+            config = self._montar_config()
+            config.validar()
+            caminho = receitas.salvar(receitas.Receita(config), nome)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("❌ Erro ao Salvar Receita", str(e), parent=self.root)
+            return
+        self.status_var.set(f"💾 Receita salva em {caminho}")
+        self.status_label.configure(style='Success.TLabel')
         
+    def abrir_receita(self):
+        """Preenche a tela com uma receita salva e carrega as colunas dos arquivos"""
+        nome = filedialog.askopenfilename(title="Abrir Receita", filetypes=[("Receita SAFE", "*.json")], 
+                                          parent=self.root)
+        if not nome:
+            return
+        try:
+            config = receitas.carregar(nome).config
+        except (ValueError, OSError) as e:
+            messagebox.showerror("❌ Erro ao Abrir Receita", str(e), parent=self.root)
+            return
+        
+        for entrada, arquivo in ((self.entrada_arquivo1, config.arquivo_origem), 
+                                 (self.entrada_arquivo2, config.arquivo_destino)):
+            entrada.delete(0, tk.END)
+            entrada.insert(0, arquivo)
+        self.spin_skip1.set(config.skip_origem)
+        self.spin_skip2.set(config.skip_destino)
+        self.combo_motor.set(config.motor_leitura)
+        self.combo_duplicadas.set(analiseChaves.POLITICAS_DUPLICADAS[config.duplicadas])
+        self.combo_atualizacao.set(mergeEngine.MODOS_ATUALIZACAO[config.atualizacao])
+        for etapa, var in self.normalizacao_vars.items():
+            var.set(getattr(config.normalizar_chave, etapa))
+        self.spin_zeros.set(config.normalizar_chave.largura_zeros)
+        self.juncao_aproximada.set(config.juncao_aproximada)
+        self.spin_similaridade.set(config.similaridade_minima)
+        self.manual_selection.set(config.colunas_chave_origem != config.colunas_chave_destino)
+        for caminho, combo, aba in ((config.arquivo_origem, self.combo_aba1, config.aba_origem), 
+                                    (config.arquivo_destino, self.combo_aba2, config.aba_destino)):
+            self._carregar_abas(caminho, combo)
+            self._selecionar_aba(combo, aba)
+        
+        # Chaves e colunas a copiar são marcadas quando as colunas terminarem de carregar
+        self._receita_pendente = config
+        self.check_ready_state()
+        self.preview_columns()
+        
+    def _selecionar_aba(self, combo, aba):
+        """Marca a aba da receita (nome, posição ou TODAS_ABAS) na lista de abas"""
+        abas = list(combo.cget('values'))
+        if not abas:
+            return
+        if aba == leitores.TODAS_ABAS:
+            combo.set(TEXTO_TODAS_ABAS)
+        elif isinstance(aba, int) and aba < len(abas) - 1:
+            combo.set(abas[aba])
+        elif aba in abas:
+            combo.set(aba)
+        
+    def _aplicar_selecao_receita(self, config):
+        """Marca as colunas-chave e as colunas a copiar da receita aberta"""
+        if self.manual_selection.get():
+            self.combo_chave_origem.set(config.colunas_chave_origem)
+            self.combo_chave_destino.set(config.colunas_chave_destino)
+        else:
+            self.combo_chave.set(config.colunas_chave_destino)
+        self.listbox_colunas.selection_clear(0, tk.END)
+        selecionadas = set(config.colunas)
+        for i, coluna in enumerate(self.df1_columns):
+            if coluna in selecionadas:
+                self.listbox_colunas.select_set(i)
+        self.atualizar_contador_colunas()
+        ausentes = [c for c in config.colunas if c not in self.df1_columns]
+        if ausentes:
+            self.status_var.set(f"⚠️ Colunas da receita ausentes na origem: {', '.join(map(str, ausentes))}")
+            self.status_label.configure(style='Error.TLabel')
+        else:
+            self.status_var.set("📂 Receita carregada! Confira a prévia e execute a vinculação")
+            self.status_label.configure(style='Success.TLabel')
+            
+    def _executar_merge_thread(self, config, progresso_merge):
+        """Thread para executar o merge sem travar a interface"""
+        try:
+            relatorio = self._novo_relatorio()
+            df_merge = mergeEngine.executar_merge(config, self.sessao, relatorio, progresso_merge)
+            # O tempo de escolha do arquivo de saída não entra nas métricas
+            progresso_merge.concluir()
+            
+            arquivo_base = Path(config.arquivo_destino)
+            extensao = mergeEngine.extensao_saida(config.arquivo_destino)
+            nome_sugerido = mergeEngine.nome_saida_sugerido(config.arquivo_destino).name
             
             def save_file():
+                formato_inicial = 'csv' if extensao == '.csv' else 'xlsx'
+                tipo_escolhido = tk.StringVar(value=escritores.FORMATOS[formato_inicial][0])
                 nome_saida = filedialog.asksaveasfilename(
                     title="Salvar Arquivo Vinculado",
                     initialdir=arquivo_base.parent,
                     initialfile=nome_sugerido,
-                    filetypes=[("Excel files", "*.xlsx *.xls") if extensao == '.xlsx' else ("CSV files", "*.csv"), ("All files", "*.*")]
+                    filetypes=escritores.tipos_arquivo(formato_inicial),
+                    typevariable=tipo_escolhido
                 )
                 if not nome_saida:
                     self.root.after(0, lambda: self._merge_error("Nenhum arquivo de saída selecionado"))
                     return
                 
-                if not nome_saida.lower().endswith(('.xlsx', '.xls', '.csv')):
-                    nome_saida += extensao
-                    
-                if nome_saida.lower().endswith('.csv'):
-                    df_merge.to_csv(nome_saida, index=False)
-                else:
-                    df_merge.to_excel(nome_saida, index=False)
-                
-                total_linhas = len(df_merge)
-                colunas_adicionadas = len(colunas_selecionadas)
-                
-                self.root.after(0, lambda: self._merge_success(str(nome_saida), total_linhas, 
-                                                             colunas_adicionadas, colunas_selecionadas))
+                self.status_var.set(f"💾 Gravando arquivo ({tipo_escolhido.get()})...")
+                thread = threading.Thread(target=self._gravar_resultado_thread,
+                                          args=(df_merge, nome_saida, extensao, tipo_escolhido.get(), config, relatorio,
+                                                progresso_merge))
+                thread.daemon = True
+                thread.start()
             
             self.root.after(0, save_file)
             
+        except progresso.MergeCancelado:
+            self.root.after(0, self._merge_cancelado)
         except Exception as e:
             self.root.after(0, lambda: self._merge_error(str(e)))
             
-    def _merge_success(self, caminho_saida, total_linhas, colunas_adicionadas, nomes_colunas):
-        """Trata sucesso do merge com estatísticas detalhadas"""
+    def _gravar_resultado_thread(self, df_merge, nome_saida, extensao, tipo_escolhido, config, relatorio,
+                                 progresso_merge):
+        """Thread para gravar o resultado sem travar a interface"""
+        try:
+            formato = escritores.resolver_formato(nome_saida, tipo_escolhido)
+            nome_saida = mergeEngine.salvar_resultado(df_merge, nome_saida, extensao, formato, progresso_merge)
+            total_linhas = mergeEngine.total_linhas(df_merge)
+            self._registrar_metricas(progresso_merge, relatorio, config, nome_saida, total_linhas, formato=formato)
+            self.root.after(0, lambda: self._merge_success(str(nome_saida), total_linhas,
+                                                         len(config.colunas), config.colunas, relatorio))
+        except progresso.MergeCancelado:
+            self.root.after(0, self._merge_cancelado)
+        except Exception as e:
+            self.root.after(0, lambda: self._merge_error(str(e)))
+            
+    def _novo_relatorio(self):
+        """Relatório da execução, coletando as chaves sem correspondência se pedido"""
+        return mergeEngine.RelatorioMerge(coletar_chaves=self.exportar_chaves.get())
+        
+    def _registrar_metricas(self, progresso_merge, relatorio, config, caminho_saida, total_linhas,
+                            modo='completo', formato=None):
+        """Encerra a medição, guarda as métricas no relatório e acrescenta o registro ao log.
+
+        Com a coleta de chaves pedida, grava também os CSVs das chaves sem correspondência.
+        """
+        progresso_merge.concluir()
+        relatorio.metricas = progresso_merge.medidor
+        metricas.gravar_log(metricas.registro(progresso_merge.medidor, config, caminho_saida, total_linhas,
+                                              formato, modo))
+        if relatorio.coletar_chaves and relatorio.correspondencia is not None:
+            mergeEngine.salvar_chaves_sem_correspondencia(relatorio.correspondencia, caminho_saida)
+        
+    def _novo_progresso(self):
+        """Cria o acompanhamento da execução e habilita o botão de cancelar"""
+        self.progresso_atual = progresso.Progresso(
+            lambda estado: self.root.after(0, lambda: self._mostrar_progresso(estado)),
+            metricas.MedidorMerge())
+        self.btn_cancelar.config(state="normal")
+        return self.progresso_atual
+        
+    def _mostrar_progresso(self, estado):
+        """Atualiza a barra (determinada quando o total da etapa é conhecido) e o texto da etapa"""
+        if self.progresso_atual is None or self.progresso_atual.cancelado:
+            return
+        if estado.percentual is None:
+            if str(self.progress.cget('mode')) != 'indeterminate':
+                self.progress.config(mode='indeterminate', value=0)
+                self.progress.start()
+        else:
+            self.progress.stop()
+            self.progress.config(mode='determinate', maximum=100, value=estado.percentual)
+        self.status_var.set(f"⚙️ {estado.texto()}")
+        
+    def cancelar_vinculacao(self):
+        """Pede o cancelamento da execução em andamento"""
+        if self.progresso_atual is not None:
+            self.progresso_atual.cancelar()
+            self.btn_cancelar.config(state="disabled")
+            self.status_var.set("⏳ Cancelando...")
+            
+    def _finalizar_execucao(self):
+        """Restaura a barra de progresso e os botões ao fim de uma execução"""
         self.progress.stop()
+        self.progress.config(mode='indeterminate', value=0)
+        self.btn_cancelar.config(state="disabled")
         self.btn_execute.config(state="normal")
+        self.progresso_atual = None
+        
+    def _merge_cancelado(self):
+        """Trata o cancelamento pedido pelo usuário"""
+        self._finalizar_execucao()
+        self.status_var.set("⛔ Vinculação cancelada; nenhum arquivo foi gravado")
+        self.status_label.configure(style='Error.TLabel')
+        
+    def _merge_success(self, caminho_saida, total_linhas, colunas_adicionadas, nomes_colunas, relatorio=None):
+        """Trata sucesso do merge com estatísticas detalhadas"""
+        self._finalizar_execucao()
         self.status_var.set("🎉 Vinculação concluída com sucesso!")
         self.status_label.configure(style='Success.TLabel')
         
@@ -581,13 +1300,54 @@ class ExcelMergerApp:
                            f"📊 Estatísticas:\n"
                            f"• Total de linhas: {total_linhas:,}\n"
                            f"• Colunas adicionadas: {colunas_adicionadas}\n\n"
+                           f"{self._texto_relatorio(relatorio)}"
                            f"📋 Colunas vinculadas:\n{colunas_texto}", 
                            parent=self.root)
         
+    def _texto_relatorio(self, relatorio):
+        """Monta o trecho do relatório da vinculação exibido na mensagem de sucesso"""
+        if relatorio is None:
+            return ""
+        
+        texto = ""
+        analise = relatorio.analise_chaves
+        if analise is not None:
+            texto += (f"🔑 Colunas-chave:\n"
+                      f"• Origem: {analise.unicas_origem:,} únicas, {analise.duplicadas_origem:,} repetidas\n"
+                      f"• Destino: {analise.unicas_destino:,} únicas, {analise.duplicadas_destino:,} repetidas\n"
+                      f"• Linhas projetadas: {analise.linhas_projetadas:,}\n\n")
+        if relatorio.conversao_chave is not None:
+            texto += f"🔢 Tipos das chaves: {relatorio.conversao_chave.resumo()}\n\n"
+        correspondencia = relatorio.correspondencia
+        if correspondencia is not None:
+            texto += (f"🎯 Correspondência:\n"
+                      f"• Encontradas na origem: {correspondencia.correspondidas:,} ({correspondencia.taxa:.0%})\n"
+                      f"• Sem correspondência: {correspondencia.sem_correspondencia:,}\n"
+                      f"• Com chave repetida na origem: {correspondencia.ambiguas:,}\n")
+            if relatorio.coletar_chaves:
+                texto += "• Chaves sem correspondência salvas em CSV ao lado do arquivo\n"
+            texto += "\n"
+        if relatorio.celulas_atualizadas:
+            texto += "✏️ Células atualizadas:\n"
+            for coluna, celulas in relatorio.celulas_atualizadas.items():
+                texto += f"• {coluna}: {celulas:,}\n"
+            texto += "\n"
+        if relatorio.abas_vinculadas is not None:
+            texto += f"📑 Abas vinculadas: {', '.join(relatorio.abas_vinculadas)}\n"
+            if relatorio.abas_mantidas:
+                texto += f"• Mantidas sem alteração: {', '.join(relatorio.abas_mantidas)}\n"
+            texto += "\n"
+        if relatorio.incremental is not None:
+            texto += f"🔄 Incremental:\n{relatorio.incremental.resumo()}\n\n"
+        if relatorio.linhas_aproximadas is not None:
+            texto += f"🔎 Linhas vinculadas por similaridade: {relatorio.linhas_aproximadas:,}\n\n"
+        if relatorio.metricas is not None and relatorio.metricas.etapas:
+            texto += f"⏱️ Desempenho:\n{relatorio.metricas.resumo()}\n\n"
+        return texto
+        
     def _merge_error(self, error_msg):
         """Trata erro no merge"""
-        self.progress.stop()
-        self.btn_execute.config(state="normal")
+        self._finalizar_execucao()
         messagebox.showerror("❌ Erro na Vinculação", error_msg, parent=self.root)
         self.status_var.set("❌ Erro na vinculação")
         self.status_label.configure(style='Error.TLabel')
@@ -607,6 +1367,10 @@ class ExcelMergerApp:
                 messagebox.showerror("❌ Erro", "Selecione as colunas-chave para ambos os arquivos", 
                                     parent=self.root)
                 return False
+            if len(self.combo_chave_origem.get()) != len(self.combo_chave_destino.get()):
+                messagebox.showerror("❌ Erro", "Selecione a mesma quantidade de colunas-chave nos dois arquivos", 
+                                    parent=self.root)
+                return False
         else:
             if not self.combo_chave.get():
                 messagebox.showerror("❌ Erro", "Selecione a coluna-chave", parent=self.root)
@@ -632,7 +1396,10 @@ def main():
     root = ttk.Window()
     app = ExcelMergerApp(root)
     root.mainloop()
+    app.sessao.encerrar()
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos do modo lote no executável do Windows
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Detecção do dialeto de arquivos CSV: separador, codificação, decimal e milhar.
+
+Exportações de ERPs brasileiros costumam vir separadas por ";", em latin-1 /
+cp1252 e com vírgula decimal ("1.234,56"), e lidas com as opções padrão do
+pandas viram uma única coluna ou falham na decodificação. O dialeto é deduzido
+de uma amostra com os primeiros AMOSTRA_BYTES bytes do arquivo (nunca do
+arquivo inteiro) e guardado por caminho, tamanho e data de modificação, de modo
+que cabeçalho, validação e leitura completa do mesmo arquivo detectam uma vez só.
+"""
+import codecs
+import csv
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+AMOSTRA_BYTES = 32 * 1024
+SEPARADORES = (',', ';', '\t', '|')
+# Fração mínima das linhas da amostra com o mesmo número de campos
+CONSISTENCIA_MINIMA = 0.8
+
+_DECIMAL_PONTO = re.compile(r"-?\d+\.\d+")
+_DECIMAL_VIRGULA = re.compile(r"-?\d+,\d+")
+_MILHAR_PONTO = re.compile(r"-?\d{1,3}(\.\d{3})+(,\d+)?")
+_MILHAR_VIRGULA = re.compile(r"-?\d{1,3}(,\d{3})+(\.\d+)?")
+
+
+@dataclass(frozen=True)
+class DialetoCsv:
+    """Opções de leitura deduzidas da amostra do arquivo"""
+    separador: str = ','
+    codificacao: str = 'utf-8'
+    decimal: str = '.'
+    milhar: str = None
+
+    def opcoes(self):
+        """Argumentos correspondentes do pd.read_csv"""
+        return {'sep': self.separador, 'encoding': self.codificacao, 'decimal': self.decimal,
+                'thousands': self.milhar}
+
+
+def _codificacao(amostra):
+    """Codificação da amostra: UTF-8 (com ou sem BOM), UTF-16 com BOM ou cp1252/latin-1"""
+    if amostra.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if amostra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        amostra.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A amostra pode terminar no meio de um caractere de vários bytes
+        if e.reason == 'unexpected end of data':
+            return 'utf-8'
+    try:
+        amostra.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _linhas(texto, completa):
+    """Linhas não vazias da amostra, sem a última quando ela pode estar cortada"""
+    linhas = texto.splitlines()
+    if not completa and linhas:
+        linhas = linhas[:-1]
+    return [linha for linha in linhas if linha.strip()]
+
+
+def _separador(linhas):
+    """Separador que divide as linhas no mesmo número de campos, preferindo mais campos"""
+    melhor, melhor_pontuacao = ',', (False, 1)
+    for candidato in SEPARADORES:
+        campos = Counter(len(linha) for linha in csv.reader(linhas, delimiter=candidato))
+        quantidade, ocorrencias = campos.most_common(1)[0]
+        if quantidade < 2:
+            continue
+        pontuacao = (ocorrencias >= CONSISTENCIA_MINIMA * len(linhas), quantidade)
+        if pontuacao > melhor_pontuacao:
+            melhor, melhor_pontuacao = candidato, pontuacao
+    return melhor
+
+
+def _numeros(linhas, separador):
+    """Separadores decimal e de milhar dos números da amostra"""
+    votos = Counter()
+    for linha in csv.reader(linhas, delimiter=separador):
+        for valor in linha:
+            valor = valor.strip()
+            if _MILHAR_PONTO.fullmatch(valor):
+                # "1.234" tanto pode ser milhar quanto decimal
+                ambiguo = ',' not in valor and valor.count('.') == 1
+                votos['ponto_ambiguo' if ambiguo else 'milhar_ponto'] += 1
+            elif _MILHAR_VIRGULA.fullmatch(valor):
+                ambiguo = '.' not in valor and valor.count(',') == 1
+                votos['virgula_ambigua' if ambiguo else 'milhar_virgula'] += 1
+            elif _DECIMAL_VIRGULA.fullmatch(valor):
+                votos['decimal_virgula'] += 1
+            elif _DECIMAL_PONTO.fullmatch(valor):
+                votos['decimal_ponto'] += 1
+
+    if votos['decimal_virgula'] + votos['milhar_ponto'] > votos['decimal_ponto'] + votos['milhar_virgula']:
+        return ',', '.' if votos['milhar_ponto'] or votos['ponto_ambiguo'] else None
+    if votos['milhar_virgula'] and separador != ',':
+        return '.', ','
+    return '.', None
+
+
+def detectar(amostra, completa=False):
+    """Dialeto deduzido de uma amostra em bytes; `completa` indica que ela é o arquivo inteiro"""
+    codificacao = _codificacao(amostra)
+    linhas = _linhas(amostra.decode(codificacao, errors='ignore'), completa)
+    if not linhas:
+        return DialetoCsv(codificacao=codificacao)
+    separador = _separador(linhas)
+    decimal, milhar = _numeros(linhas, separador)
+    return DialetoCsv(separador, codificacao, decimal, milhar)
+
+
+@lru_cache(maxsize=256)
+def _dialeto_arquivo(caminho, tamanho, modificacao):
+    with open(caminho, 'rb') as arquivo:
+        amostra = arquivo.read(AMOSTRA_BYTES)
+    return detectar(amostra, completa=tamanho <= AMOSTRA_BYTES)
+
+
+def dialeto(caminho):
+    """Dialeto do arquivo CSV, detectado uma única vez enquanto o arquivo não mudar"""
+    info = os.stat(caminho)
+    return _dialeto_arquivo(os.path.abspath(caminho), info.st_size, info.st_mtime_ns)
@@ -0,0 +1,248 @@
+"""Gravação do resultado da vinculação em diferentes formatos.
+
+O to_excel do pandas grava célula a célula pelo openpyxl e mantém a planilha
+inteira em memória. Aqui os arquivos Excel são gravados linha a linha, em
+blocos, pelo xlsxwriter em modo constant_memory ou pelo openpyxl write-only;
+CSV, CSV compactado e Parquet usam os gravadores nativos do pandas.
+
+Um dict {nome da aba: DataFrame} é gravado como uma pasta de trabalho com
+várias abas, apenas nos formatos Excel. Um ResultadoEmBlocos (resultado lido
+aos poucos, ex.: de um banco de dados) é gravado bloco a bloco, sem juntar
+os blocos em memória.
+
+A gravação é feita em um arquivo temporário na mesma pasta, que só substitui
+o arquivo de saída ao final: um erro ou cancelamento no meio da gravação não
+deixa um arquivo pela metade.
+"""
+import gzip
+import importlib.util
+import os
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+import progresso as progresso_merge
+
+
+BLOCO_LINHAS = 10_000
+BLOCO_LINHAS_CSV = 100_000
+MAX_LINHAS_EXCEL = 1_048_576
+
+# formato -> (descrição exibida na caixa de diálogo, extensão)
+FORMATOS = {
+    'xlsx': ("Excel - xlsxwriter (memória constante)", '.xlsx'),
+    'xlsx-openpyxl': ("Excel - openpyxl (streaming)", '.xlsx'),
+    'csv': ("CSV", '.csv'),
+    'csv.gz': ("CSV compactado", '.csv.gz'),
+    'parquet': ("Parquet", '.parquet'),
+}
+
+EXTENSOES = tuple(sorted({ext for _, ext in FORMATOS.values()}, key=len, reverse=True))
+
+
+def formato_por_caminho(caminho):
+    """Deduz o formato de gravação pela extensão do arquivo"""
+    nome = str(caminho).lower()
+    if nome.endswith('.xls'):
+        raise ValueError("Gravação em .xls não é suportada; use .xlsx")
+    for formato, (_, extensao) in FORMATOS.items():
+        if nome.endswith(extensao):
+            return formato
+    return None
+
+
+def formato_por_descricao(descricao):
+    """Formato correspondente à descrição escolhida na caixa de diálogo"""
+    for formato, (texto, _) in FORMATOS.items():
+        if texto == descricao:
+            return formato
+    return None
+
+
+def resolver_formato(caminho, descricao=None):
+    """Formato a partir do tipo escolhido no diálogo; a extensão digitada prevalece"""
+    formato = formato_por_descricao(descricao)
+    formato_extensao = formato_por_caminho(caminho)
+    if formato_extensao is None:
+        return formato
+    if formato is None or FORMATOS[formato][1] != FORMATOS[formato_extensao][1]:
+        return formato_extensao
+    return formato
+
+
+def tipos_arquivo(formato_inicial=None):
+    """Lista de filetypes para o filedialog, com o formato inicial primeiro"""
+    ordem = sorted(FORMATOS, key=lambda f: f != formato_inicial)
+    return [(FORMATOS[f][0], f"*{FORMATOS[f][1]}") for f in ordem]
+
+
+class ResultadoEmBlocos:
+    """Resultado entregue em blocos (DataFrames com as mesmas colunas), com o total já conhecido.
+
+    Pode ser percorrido uma única vez; gravar() aceita-o no lugar de um DataFrame.
+    """
+
+    def __init__(self, colunas, blocos, total):
+        self.columns = pd.Index(colunas)
+        self._blocos = blocos
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        return iter(self._blocos)
+
+
+def _blocos(df, tamanho):
+    """Blocos de até `tamanho` linhas do DataFrame (ou os próprios blocos de um ResultadoEmBlocos)"""
+    if isinstance(df, ResultadoEmBlocos):
+        yield from df
+        return
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+
+def _linhas(df, progresso):
+    """Percorre as linhas do DataFrame em blocos, trocando valores ausentes por None"""
+    for bloco in _blocos(df, BLOCO_LINHAS):
+        bloco = bloco.astype(object)
+        bloco = bloco.where(bloco.notna(), None)
+        yield from bloco.itertuples(index=False, name=None)
+        progresso.avancar(len(bloco))
+
+
+def _abas(df):
+    """Abas a gravar: {nome: DataFrame}, com nome None para a aba padrão"""
+    return df if isinstance(df, dict) else {None: df}
+
+
+def _verificar_limite_excel(abas):
+    for nome, df in abas.items():
+        if len(df) + 1 > MAX_LINHAS_EXCEL:
+            aba = f" na aba '{nome}'" if nome is not None else ""
+            raise ValueError(f"O resultado tem {len(df):,} linhas{aba}, acima do limite do Excel "
+                             f"({MAX_LINHAS_EXCEL - 1:,}); salve em CSV ou Parquet")
+
+
+def gravar_xlsxwriter(df, caminho, progresso=None):
+    """Grava .xlsx pelo xlsxwriter em modo constant_memory (linha a linha)"""
+    import xlsxwriter
+
+    progresso = progresso_merge.obter(progresso)
+    abas = _abas(df)
+    _verificar_limite_excel(abas)
+    livro = xlsxwriter.Workbook(caminho, {
+        'constant_memory': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'default_date_format': 'dd/mm/yyyy',
+    })
+    try:
+        for nome, df in abas.items():
+            planilha = livro.add_worksheet(nome)
+            planilha.write_row(0, 0, [str(coluna) for coluna in df.columns])
+            for numero, linha in enumerate(_linhas(df, progresso), start=1):
+                planilha.write_row(numero, 0, linha)
+    finally:
+        livro.close()
+
+
+def gravar_openpyxl(df, caminho, progresso=None):
+    """Grava .xlsx pelo openpyxl em modo write-only (streaming)"""
+    from openpyxl import Workbook
+
+    progresso = progresso_merge.obter(progresso)
+    abas = _abas(df)
+    _verificar_limite_excel(abas)
+    livro = Workbook(write_only=True)
+    for nome, df in abas.items():
+        planilha = livro.create_sheet(nome)
+        planilha.append([str(coluna) for coluna in df.columns])
+        for linha in _linhas(df, progresso):
+            planilha.append(linha)
+    livro.save(caminho)
+
+
+def gravar_csv(df, caminho, progresso=None, compactar=False):
+    """Grava CSV (ou CSV gzip) em blocos de linhas, informando o progresso"""
+    progresso = progresso_merge.obter(progresso)
+    abrir = gzip.open if compactar else open
+    with abrir(caminho, 'wt', encoding='utf-8', newline='') as arquivo:
+        pd.DataFrame(columns=df.columns).to_csv(arquivo, index=False)
+        for bloco in _blocos(df, BLOCO_LINHAS_CSV):
+            bloco.to_csv(arquivo, index=False, header=False)
+            progresso.avancar(len(bloco))
+
+
+def gravar_parquet(df, caminho, progresso=None):
+    """Grava Parquet; um ResultadoEmBlocos vira um grupo de linhas por bloco"""
+    progresso = progresso_merge.obter(progresso)
+    if not isinstance(df, ResultadoEmBlocos):
+        # Parquet exige nomes de coluna em texto
+        df.rename(columns=str).to_parquet(caminho, index=False)
+        progresso.avancar(len(df))
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    gravador = None
+    try:
+        for bloco in df:
+            tabela = pa.Table.from_pandas(bloco.rename(columns=str), preserve_index=False)
+            if gravador is None:
+                # Colunas vazias no primeiro bloco não têm tipo; ficam como texto
+                esquema = pa.schema([pa.field(c.name, pa.string()) if pa.types.is_null(c.type) else c
+                                     for c in tabela.schema])
+                gravador = pq.ParquetWriter(caminho, esquema)
+            gravador.write_table(tabela.cast(esquema, safe=False))
+            progresso.avancar(len(bloco))
+        if gravador is None:
+            pd.DataFrame(columns=df.columns).rename(columns=str).to_parquet(caminho, index=False)
+    finally:
+        if gravador is not None:
+            gravador.close()
+
+
+def temporario_para(caminho):
+    """Arquivo temporário oculto, na mesma pasta e com a mesma extensão do arquivo final"""
+    caminho = Path(caminho)
+    return caminho.with_name(f".{caminho.stem}.{uuid.uuid4().hex[:8]}.tmp{caminho.suffix}")
+
+
+def gravar(df, caminho, formato=None, progresso=None):
+    """Grava o DataFrame (ou o dict de abas) no formato informado ou deduzido pela extensão"""
+    formato = formato or formato_por_caminho(caminho) or 'xlsx'
+    if formato == 'xlsx' and importlib.util.find_spec('xlsxwriter') is None:
+        formato = 'xlsx-openpyxl'
+    if isinstance(df, dict) and formato not in ('xlsx', 'xlsx-openpyxl'):
+        raise ValueError("Resultados com várias abas só podem ser gravados em Excel (.xlsx)")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de saída desconhecido: '{formato}'")
+
+    progresso = progresso_merge.obter(progresso)
+    linhas = sum(len(aba) for aba in df.values()) if isinstance(df, dict) else len(df)
+    progresso.etapa("Gravando", total=linhas)
+    temporario = temporario_para(caminho)
+    try:
+        _gravar_formato(df, temporario, formato, progresso)
+        progresso.verificar()
+        os.replace(temporario, caminho)
+    except BaseException:
+        temporario.unlink(missing_ok=True)
+        raise
+
+
+def _gravar_formato(df, caminho, formato, progresso):
+    if formato == 'xlsx':
+        gravar_xlsxwriter(df, caminho, progresso)
+    elif formato == 'xlsx-openpyxl':
+        gravar_openpyxl(df, caminho, progresso)
+    elif formato == 'csv':
+        gravar_csv(df, caminho, progresso)
+    elif formato == 'csv.gz':
+        gravar_csv(df, caminho, progresso, compactar=True)
+    elif formato == 'parquet':
+        gravar_parquet(df, caminho, progresso)
@@ -0,0 +1,246 @@
+"""Junção aproximada das colunas-chave (nomes de empresas com pequenas diferenças).
+
+Comparar cada chave do destino com todas as da origem é inviável em 100 mil x
+100 mil linhas. Os textos são quebrados em trigramas de caracteres,
+codificados como inteiros com numpy, e só os trigramas mais raros de cada chave
+(o "prefixo", cujo tamanho depende da similaridade mínima) entram em um índice
+invertido: dois textos com similaridade suficiente sempre compartilham ao menos
+um trigrama dos prefixos, então apenas esses pares viram candidatos. A
+pontuação final (coeficiente de Dice sobre os trigramas) é calculada só para os
+CANDIDATOS_POR_CHAVE candidatos que mais compartilham trigramas do prefixo com
+cada chave do destino, e a melhor origem entre eles é aceita quando atinge a
+similaridade mínima. Esse corte é uma heurística: a blocagem não perde nenhum
+par válido, mas uma origem mais parecida fora dos primeiros candidatos pode ser
+preterida por outra que também atinge a similaridade mínima, ou deixar a chave
+sem correspondência. Pontuar todos os candidatos tornaria a junção várias vezes
+mais lenta em nomes com trigramas comuns (ex.: "LTDA").
+"""
+import numpy as np
+import pandas as pd
+
+import normalizacao
+
+
+SIMILARIDADE_MINIMA = 0.8
+# Candidatos pontuados por chave do destino (os que mais compartilham trigramas raros);
+# heurística, ver a descrição do módulo
+CANDIDATOS_POR_CHAVE = 5
+# Chaves do destino comparadas por vez e pares candidatos gerados por vez, para limitar a memória
+BLOCO_CHAVES = 20_000
+LIMITE_PARES = 5_000_000
+
+# Colunas acrescentadas ao resultado para auditoria das correspondências
+COLUNA_CHAVE_ENCONTRADA = 'Chave origem encontrada'
+COLUNA_SIMILARIDADE = 'Similaridade'
+
+# Comparação sempre sem acentos, maiúsculas e espaços repetidos
+_OPCOES_TEXTO = normalizacao.PREDEFINIDAS['texto']
+
+
+def validar_similaridade(similaridade_minima):
+    """Valida a similaridade mínima (maior que 0 e até 1)"""
+    if not 0 < similaridade_minima <= 1:
+        raise ValueError("A similaridade mínima deve estar entre 0 e 1")
+
+
+def _textos(chaves):
+    """Valores únicos não nulos das chaves e o texto normalizado de cada um"""
+    valores = chaves.dropna().drop_duplicates().reset_index(drop=True)
+    return valores, normalizacao.normalizar(valores, _OPCOES_TEXTO).fillna('').tolist()
+
+
+def _contar(valores):
+    """Valores distintos (ordenados) e quantas vezes cada um aparece"""
+    valores = np.sort(valores)
+    inicios = np.flatnonzero(np.concatenate(([True], valores[1:] != valores[:-1])))
+    return valores[inicios], np.diff(np.append(inicios, len(valores)))
+
+
+def trigramas(textos):
+    """Trigramas distintos de cada texto, como pares (posição do texto, código inteiro).
+
+    Os textos recebem um espaço em cada ponta e são convertidos de uma vez em
+    pontos de código (UTF-32); cada trigrama vira um inteiro de 63 bits. O
+    resultado vem ordenado por posição e código.
+    """
+    textos = [f" {t} " for t in textos]
+    tamanhos = np.fromiter(map(len, textos), dtype=np.int64, count=len(textos))
+    letras = np.frombuffer(''.join(textos).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    if len(letras) < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    janelas = (letras[:-2] << 42) | (letras[1:-1] << 21) | letras[2:]
+
+    # Só as janelas inteiramente dentro de um mesmo texto
+    quantidades = np.maximum(tamanhos - 2, 0)
+    inicios = np.cumsum(tamanhos) - tamanhos
+    posicoes = np.repeat(np.arange(len(textos), dtype=np.int64), quantidades)
+    deslocamento = np.arange(quantidades.sum()) - np.repeat(np.cumsum(quantidades) - quantidades, quantidades)
+    codigos = janelas[inicios[posicoes] + deslocamento]
+
+    # Remove trigramas repetidos no mesmo texto (ordenando inteiros pequenos, não os códigos)
+    indices, distintos = pd.factorize(codigos)
+    pares, _ = _contar(posicoes * len(distintos) + indices)
+    posicoes, indices = np.divmod(pares, len(distintos))
+    return posicoes, distintos[indices]
+
+
+class IndiceNgramas:
+    """Índice invertido dos prefixos de trigramas das chaves da origem.
+
+    Montado uma vez e consultado quantas vezes for preciso (por exemplo, a cada
+    bloco do destino no modo streaming).
+    """
+
+    def __init__(self, chaves, similaridade_minima=SIMILARIDADE_MINIMA, rotulos=None):
+        validar_similaridade(similaridade_minima)
+        self.similaridade_minima = similaridade_minima
+        self.chaves, textos = _textos(chaves)
+        # Valor exibido na auditoria para cada chave (ex.: a chave original antes da normalização)
+        unicas = (chaves.notna() & ~chaves.duplicated()).to_numpy()
+        self.rotulos = (self.chaves.to_numpy() if rotulos is None
+                        else pd.Series(rotulos).to_numpy()[unicas])
+        # Textos idênticos após a normalização casam sem passar pela blocagem
+        primeiras = pd.Series(range(len(textos))).groupby(pd.Series(textos, dtype=object), sort=False).first()
+        primeiras = primeiras[primeiras.index != '']
+        self._exatas, self._posicao_exata = primeiras.index, primeiras.to_numpy()
+
+        posicoes, gramas = trigramas(textos)
+        codigos, vocabulario = pd.factorize(gramas)
+        self._vocabulario = pd.Index(vocabulario)
+        # Ordem global dos trigramas: do mais raro ao mais frequente na origem
+        frequencia = np.bincount(codigos, minlength=len(vocabulario))
+        self._ordem = np.empty(len(frequencia), dtype=np.int64)
+        self._ordem[np.argsort(frequencia, kind='stable')] = np.arange(len(frequencia))
+        self._tamanhos = np.bincount(posicoes, minlength=len(textos))
+        # (posição, trigrama) de toda a origem, para contar os trigramas em comum
+        self._pares = np.sort(posicoes * len(vocabulario) + codigos)
+
+        # Prefixos ordenados por trigrama e tamanho: a busca já descarta tamanhos incompatíveis
+        prefixo_posicoes, prefixo_codigos = self._prefixo(posicoes, codigos, self._tamanhos)
+        self._maior = int(self._tamanhos.max(initial=0)) + 1
+        blocagem = prefixo_codigos * self._maior + self._tamanhos[prefixo_posicoes]
+        arranjo = np.argsort(blocagem, kind='stable')
+        self._blocagem = blocagem[arranjo]
+        self._prefixo_posicoes = prefixo_posicoes[arranjo]
+
+    def _prefixo(self, posicoes, codigos, tamanhos):
+        """Mantém, para cada chave, apenas os trigramas mais raros que bastam para a blocagem"""
+        s = self.similaridade_minima
+        # Menor quantidade de trigramas em comum para atingir a similaridade mínima
+        sobreposicao = np.ceil(s * tamanhos / (2 - s) - 1e-9).astype(np.int64)
+        # Trigramas que não existem na origem vêm antes de todos (nunca geram candidatos)
+        ordem = np.where(codigos >= 0, self._ordem[np.maximum(codigos, 0)], -1)
+        arranjo = np.lexsort((ordem, posicoes))
+        posicoes, codigos = posicoes[arranjo], codigos[arranjo]
+        inicio = np.cumsum(tamanhos) - tamanhos
+        rank = np.arange(len(posicoes)) - inicio[posicoes]
+        mantidos = (rank < (tamanhos - sobreposicao + 1)[posicoes]) & (codigos >= 0)
+        return posicoes[mantidos], codigos[mantidos]
+
+    def candidatos(self, posicoes, codigos, tamanhos):
+        """Pares (destino, origem) cujos prefixos compartilham algum trigrama"""
+        posicoes, codigos = self._prefixo(posicoes, codigos, tamanhos)
+        # Filtro de tamanho: conjuntos muito diferentes não atingem a similaridade
+        s = self.similaridade_minima
+        menor = np.ceil(tamanhos[posicoes] * s / (2 - s) - 1e-9).astype(np.int64)
+        maior = np.minimum(np.floor(tamanhos[posicoes] * (2 - s) / s + 1e-9), self._maior - 1).astype(np.int64)
+        inicio = np.searchsorted(self._blocagem, codigos * self._maior + menor, side='left')
+        quantidades = np.maximum(
+            np.searchsorted(self._blocagem, codigos * self._maior + maior, side='right') - inicio, 0)
+
+        # Os pares são gerados em partes de até LIMITE_PARES, sem dividir uma chave do destino
+        anteriores = np.cumsum(quantidades) - quantidades
+        partes = anteriores[np.searchsorted(posicoes, posicoes, side='left')] // LIMITE_PARES
+        destinos, origens = [], []
+        for parte in np.unique(partes):
+            linhas = partes == parte
+            d, o = self._melhores_pares(posicoes[linhas], inicio[linhas], quantidades[linhas])
+            destinos.append(d)
+            origens.append(o)
+        if not destinos:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(destinos), np.concatenate(origens)
+
+    def _melhores_pares(self, posicoes, inicio, quantidades):
+        """Origens que mais compartilham trigramas do prefixo com cada chave do destino"""
+        destino = np.repeat(posicoes, quantidades)
+        deslocamento = np.arange(quantidades.sum()) - np.repeat(np.cumsum(quantidades) - quantidades, quantidades)
+        origem = self._prefixo_posicoes[np.repeat(inicio, quantidades) + deslocamento]
+
+        pares, comuns = _contar(destino * len(self._tamanhos) + origem)
+        destino, origem = np.divmod(pares, len(self._tamanhos))
+        arranjo = np.lexsort((-comuns, destino))
+        destino, origem = destino[arranjo], origem[arranjo]
+        rank = np.arange(len(destino)) - np.searchsorted(destino, destino, side='left')
+        melhores = rank < CANDIDATOS_POR_CHAVE
+        return destino[melhores], origem[melhores]
+
+    def _pontuar(self, textos):
+        """Melhor origem e similaridade de cada texto do destino (sem correspondência exata)"""
+        melhor_origem = np.full(len(textos), -1, dtype=np.int64)
+        melhor_nota = np.zeros(len(textos))
+        if not len(self._tamanhos):
+            return melhor_origem, melhor_nota
+
+        posicoes, gramas = trigramas(textos)
+        codigos = self._vocabulario.get_indexer(gramas)
+        tamanhos = np.bincount(posicoes, minlength=len(textos))
+        destino, origem = self.candidatos(posicoes, codigos, tamanhos)
+        if not len(destino):
+            return melhor_origem, melhor_nota
+
+        # Trigramas em comum: cada trigrama conhecido do destino é procurado na origem candidata
+        conhecidos = codigos >= 0
+        posicoes, codigos = posicoes[conhecidos], codigos[conhecidos]
+        inicio = np.searchsorted(posicoes, destino, side='left')
+        quantidades = np.searchsorted(posicoes, destino, side='right') - inicio
+        par = np.repeat(np.arange(len(destino)), quantidades)
+        deslocamento = np.arange(quantidades.sum()) - np.repeat(np.cumsum(quantidades) - quantidades, quantidades)
+        procurados = origem[par] * len(self._vocabulario) + codigos[np.repeat(inicio, quantidades) + deslocamento]
+        encontrados = np.searchsorted(self._pares, procurados)
+        encontrados = self._pares[np.minimum(encontrados, len(self._pares) - 1)] == procurados
+        comuns = np.bincount(par, weights=encontrados, minlength=len(destino))
+        notas = 2 * comuns / (tamanhos[destino] + self._tamanhos[origem])
+
+        arranjo = np.lexsort((-notas, destino))
+        destino, origem, notas = destino[arranjo], origem[arranjo], notas[arranjo]
+        primeiros = np.ones(len(destino), dtype=bool)
+        primeiros[1:] = destino[1:] != destino[:-1]
+        melhor_origem[destino[primeiros]] = origem[primeiros]
+        melhor_nota[destino[primeiros]] = notas[primeiros]
+        return melhor_origem, melhor_nota
+
+    def posicoes(self, chaves):
+        """Posição de cada valor em `chaves` (-1 para valores ausentes)"""
+        return pd.Index(self.chaves).get_indexer(chaves)
+
+    def correspondencias(self, chaves):
+        """Chave da origem mais parecida e a similaridade para cada chave única do destino.
+
+        Retorna um DataFrame indexado pelos valores do destino que atingiram a
+        similaridade mínima, com as colunas 'posicao' (em `chaves`), 'origem'
+        (o rótulo da chave encontrada) e 'similaridade'.
+        """
+        valores, textos = _textos(chaves)
+        exatas = self._exatas.get_indexer(textos)
+        melhor_origem = np.full(len(valores), -1, dtype=np.int64)
+        melhor_origem[exatas >= 0] = self._posicao_exata[exatas[exatas >= 0]]
+        melhor_nota = (exatas >= 0).astype(float)
+
+        textos = np.array(textos, dtype=object)
+        pendentes = np.flatnonzero((exatas < 0) & (textos != ''))
+        for inicio in range(0, len(pendentes), BLOCO_CHAVES):
+            bloco = pendentes[inicio:inicio + BLOCO_CHAVES]
+            melhor_origem[bloco], melhor_nota[bloco] = self._pontuar(textos[bloco].tolist())
+
+        aceitas = (melhor_origem >= 0) & (melhor_nota >= self.similaridade_minima - 1e-9)
+        return pd.DataFrame({
+            'posicao': melhor_origem[aceitas],
+            'origem': self.rotulos[melhor_origem[aceitas]],
+            'similaridade': melhor_nota[aceitas].round(4),
+        }, index=pd.Index(valores.to_numpy()[aceitas], dtype=object))
+
+
+def correspondencias(chaves_origem, chaves_destino, similaridade_minima=SIMILARIDADE_MINIMA):
+    """Correspondências aproximadas entre duas colunas-chave (ver IndiceNgramas)"""
+    return IndiceNgramas(chaves_origem, similaridade_minima).correspondencias(chaves_destino)
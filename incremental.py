@@ -0,0 +1,300 @@
+"""Vinculação incremental: refaz só as linhas afetadas por mudanças na origem.
+
+A cada execução são guardados, fora da pasta do usuário, o hash do conteúdo
+da origem por chave de junção, o hash de cada linha do último resultado e o
+próprio resultado. Na execução seguinte a origem é lida e comparada chave a
+chave (inseridas, atualizadas e removidas); apenas as linhas do resultado com
+essas chaves são vinculadas de novo, e o arquivo de saída só é regravado se
+alguma linha realmente mudar. Se o destino, a configuração ou o arquivo de
+saída mudarem desde a última execução, a vinculação completa é refeita.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import cacheLeitura
+import mergeEngine
+import normalizacao
+import progresso as progresso_merge
+import tiposChave
+from leitores import TODAS_ABAS
+
+
+DIRETORIO_ESTADO = cacheLeitura.DIRETORIO_PADRAO / "incremental"
+EXTENSAO_ESTADO = ".pkl"
+
+
+@dataclass
+class ResumoIncremental:
+    """O que mudou na origem e no resultado desde a última execução"""
+    completa: bool = True
+    chaves_inseridas: int = 0
+    chaves_atualizadas: int = 0
+    chaves_removidas: int = 0
+    linhas_alteradas: int = 0
+    regravado: bool = True
+
+    def resumo(self):
+        """Texto com as contagens, para mensagens ao usuário"""
+        if self.completa:
+            return f"Vinculação completa: {self.linhas_alteradas:,} linhas gravadas"
+        texto = (f"Chaves da origem: {self.chaves_inseridas:,} inseridas, {self.chaves_atualizadas:,} "
+                 f"atualizadas, {self.chaves_removidas:,} removidas\n"
+                 f"Linhas alteradas no resultado: {self.linhas_alteradas:,}")
+        if not self.regravado:
+            texto += " (arquivo de saída não regravado)"
+        return texto
+
+
+def _tabela_hash(df):
+    """Hash de cada linha; números viram float para que 1 e 1.0 tenham o mesmo hash"""
+    numericas = {c: 'float64' for c in df.columns
+                 if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])}
+    return pd.util.hash_pandas_object(df.astype(numericas), index=False).to_numpy()
+
+
+def identidades(colunas):
+    """Hash das chaves (já normalizadas) de cada linha; Series de várias colunas formam uma chave"""
+    return _tabela_hash(pd.DataFrame({numero: pd.Series(serie).reset_index(drop=True)
+                                      for numero, serie in enumerate(colunas)}))
+
+
+def chaves_conciliadas(df1, destino, config):
+    """Chaves normalizadas da origem no tipo comum com as do destino, como na junção (ver tiposChave).
+
+    Retorna (colunas-chave da origem, tipos escolhidos); os tipos convertem
+    depois as chaves do resultado, para que a mesma chave tenha o mesmo hash
+    nos dois lados.
+    """
+    opcoes = config.normalizar_chave
+    chaves, tipos = [], []
+    for chave_origem, chave_destino in zip(config.colunas_chave_origem, config.colunas_chave_destino):
+        origem, _, conversao = tiposChave.conciliar(normalizacao.chave_normalizada(df1, chave_origem, opcoes),
+                                                    normalizacao.normalizar(destino[chave_destino], opcoes))
+        chaves.append(origem)
+        tipos.append(conversao.tipo)
+    return chaves, tuple(tipos)
+
+
+def identidades_destino(resultado, tipos, config):
+    """Identidades das chaves de cada linha do resultado, convertidas para os tipos da origem"""
+    colunas = []
+    for coluna, tipo in zip(config.colunas_chave_destino, tipos):
+        chave = normalizacao.normalizar(resultado[coluna], config.normalizar_chave)
+        if tipo is not None:
+            chave, _ = tiposChave.converter(chave, tipo)
+        colunas.append(chave)
+    return identidades(colunas)
+
+
+def hashes_origem(chaves, indice, coluna, config):
+    """Hash do conteúdo a copiar de cada chave da origem (Series indexada pela identidade da chave).
+
+    `chaves` são as colunas-chave da origem retornadas por chaves_conciliadas();
+    só entram as linhas que ficaram no índice (ver mergeEngine.preparar_origem).
+    """
+    chaves = identidades([chave.loc[indice.index] for chave in chaves])
+    copiadas = [c for c in indice.columns if c != coluna and c not in config.colunas_chave_destino]
+    conteudo = _tabela_hash(indice[copiadas])
+
+    # Chaves repetidas: a ordem e a quantidade das linhas também entram no hash
+    ordem = pd.Series(conteudo).groupby(chaves).cumcount().to_numpy()
+    linhas = pd.util.hash_pandas_object(pd.DataFrame({'h': conteudo, 'n': ordem}), index=False)
+    return pd.Series(linhas.to_numpy()).groupby(chaves).sum()
+
+
+def comparar(anteriores, atuais):
+    """Identidades das chaves inseridas, atualizadas e removidas entre duas execuções"""
+    inseridas = atuais.index.difference(anteriores.index)
+    removidas = anteriores.index.difference(atuais.index)
+    comuns = atuais.index.intersection(anteriores.index)
+    atualizadas = comuns[atuais[comuns].to_numpy() != anteriores[comuns].to_numpy()]
+    return inseridas, atualizadas, removidas
+
+
+def _assinatura_arquivo(caminho):
+    info = os.stat(caminho)
+    return info.st_size, info.st_mtime_ns
+
+
+def _assinatura_config(config):
+    """Parâmetros que, se mudarem, exigem a vinculação completa"""
+    return repr(replace(config, arquivo_origem=os.path.abspath(config.arquivo_origem),
+                        arquivo_destino=os.path.abspath(config.arquivo_destino),
+                        motor_leitura=None, limite_expansao=None))
+
+
+def arquivo_estado(caminho_saida, diretorio=None):
+    """Arquivo onde fica o estado da vinculação incremental de uma saída"""
+    diretorio = Path(diretorio or os.environ.get("SAFE_INCREMENTAL_DIR", DIRETORIO_ESTADO))
+    chave = hashlib.sha1(os.path.abspath(caminho_saida).encode("utf-8")).hexdigest()
+    return diretorio / f"{chave}{EXTENSAO_ESTADO}"
+
+
+def ler_estado(arquivo):
+    """Estado da última execução, ou None se não existir ou estiver inválido"""
+    if not arquivo.exists():
+        return None
+    try:
+        return pd.read_pickle(arquivo)
+    except Exception as e:
+        logging.warning(f"Estado incremental inválido descartado ({arquivo}): {e}")
+        arquivo.unlink(missing_ok=True)
+        return None
+
+
+def gravar_estado(arquivo, estado):
+    """Grava o estado de forma atômica"""
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        pd.to_pickle(estado, temporario)
+        os.replace(temporario, arquivo)
+    except Exception:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+
+
+def _estado_valido(estado, config, caminho_saida):
+    return (estado is not None
+            and estado['config'] == _assinatura_config(config)
+            and estado['destino'] == _assinatura_arquivo(config.arquivo_destino)
+            and os.path.exists(caminho_saida)
+            and estado['saida'] == _assinatura_arquivo(caminho_saida))
+
+
+def _remendar(estado, alteradas, indice, coluna, tradutor, config):
+    """Vincula de novo as linhas do último resultado com chaves alteradas.
+
+    Retorna (resultado, linhas alteradas) ou None quando a junção deixa de
+    ser um para um (chaves repetidas mantidas), caso em que a vinculação
+    completa é refeita.
+    """
+    resultado = estado['resultado']
+    afetadas = np.isin(estado['identidades'], alteradas.to_numpy())
+    if not afetadas.any():
+        return resultado, 0
+
+    # Colunas do destino com os nomes do resultado (ex.: Email_x), de volta aos nomes originais
+    nomes_destino = estado.get('nomes_destino', estado['colunas_destino'])
+    destino = resultado.loc[afetadas, estado['colunas_destino']].set_axis(nomes_destino, axis=1)
+    novas = mergeEngine.juntar(indice, mergeEngine.preparar_destino(destino, config, tradutor), coluna, config)
+    if len(novas) != len(destino):
+        return None
+    novas.index = destino.index
+
+    adicionadas = [c for c in resultado.columns if c not in estado['colunas_destino']]
+    hashes = _tabela_hash(novas[adicionadas])
+    mudaram = hashes != estado['linhas'][afetadas]
+    if not mudaram.any():
+        return resultado, 0
+
+    linhas = estado['linhas'].copy()
+    linhas[np.flatnonzero(afetadas)[mudaram]] = hashes[mudaram]
+    estado['linhas'] = linhas
+    resultado = pd.concat([resultado[~afetadas], novas[resultado.columns]]).sort_index()
+    return resultado, int(mudaram.sum())
+
+
+def executar_incremental(config, caminho_saida, formato=None, cache=None, relatorio=None, diretorio=None,
+                         progresso=None):
+    """Vincula e grava o resultado, refazendo só o que mudou desde a última execução.
+
+    Retorna (caminho final da saída, total de linhas do resultado). O que foi
+    refeito fica em `relatorio.incremental` (ResumoIncremental).
+    """
+    config.validar()
+    if config.juncao_aproximada:
+        raise ValueError("O modo incremental não aceita a junção aproximada")
+    if config.aba_destino == TODAS_ABAS:
+        raise ValueError("O modo incremental aceita apenas uma aba do destino")
+    if config.atualizacao != 'acrescentar':
+        raise ValueError("O modo incremental apenas acrescenta colunas")
+    caminho_saida = mergeEngine.caminho_final(caminho_saida, mergeEngine.extensao_saida(config.arquivo_destino),
+                                              formato)
+    arquivo = arquivo_estado(caminho_saida, diretorio)
+
+    resumo = ResumoIncremental()
+    if relatorio is not None:
+        relatorio.incremental = resumo
+
+    estado = ler_estado(arquivo)
+    if not _estado_valido(estado, config, caminho_saida):
+        estado = None
+    elif estado['arquivo_origem'] == _assinatura_arquivo(config.arquivo_origem):
+        # Nenhum dos arquivos mudou: nada a ler nem a gravar
+        resumo.completa = False
+        resumo.regravado = False
+        return caminho_saida, len(estado['resultado'])
+
+    progresso = progresso_merge.obter(progresso)
+    progresso.etapa("Lendo origem")
+    df1 = mergeEngine.carregar_origem(config, cache, progresso)
+    indice, coluna, tradutor = mergeEngine.preparar_origem(df1, config)
+
+    if estado is not None:
+        progresso.etapa("Comparando com a última execução")
+        chaves, tipos = chaves_conciliadas(df1, estado['resultado'], config)
+        if tipos != estado.get('tipos'):
+            # O tipo comum das chaves mudou: as identidades guardadas não são mais comparáveis
+            estado = None
+
+    if estado is not None:
+        origem = hashes_origem(chaves, indice, coluna, config)
+        inseridas, atualizadas, removidas = comparar(estado['origem'], origem)
+        remendo = _remendar(estado, inseridas.append(atualizadas).append(removidas),
+                            indice, coluna, tradutor, config)
+        if remendo is not None:
+            resultado, alteradas = remendo
+            resumo.completa = False
+            resumo.chaves_inseridas = len(inseridas)
+            resumo.chaves_atualizadas = len(atualizadas)
+            resumo.chaves_removidas = len(removidas)
+            resumo.linhas_alteradas = alteradas
+            resumo.regravado = alteradas > 0
+            if resumo.regravado:
+                mergeEngine.salvar_resultado(resultado, caminho_saida, formato=formato, progresso=progresso)
+                estado['resultado'] = resultado
+                estado['saida'] = _assinatura_arquivo(caminho_saida)
+            estado['origem'] = origem
+            estado['arquivo_origem'] = _assinatura_arquivo(config.arquivo_origem)
+            gravar_estado(arquivo, estado)
+            return caminho_saida, len(resultado)
+
+    # Sem estado compatível: vinculação completa, que passa a ser a referência
+    progresso.etapa("Lendo destino")
+    df2 = mergeEngine.carregar_destino(config, cache, progresso)
+    chaves, tipos = chaves_conciliadas(df1, df2, config)
+    origem = hashes_origem(chaves, indice, coluna, config)
+    del df1, chaves
+    progresso.etapa("Vinculando")
+    destino = mergeEngine.preparar_destino(df2, config, tradutor)
+    resultado = mergeEngine.juntar(indice, destino, coluna, config, relatorio, progresso)
+    mergeEngine.salvar_resultado(resultado, caminho_saida, formato=formato, progresso=progresso)
+
+    # O merge mantém as colunas do destino no início e na ordem, com sufixo (_x) quando
+    # a origem tem colunas de mesmo nome
+    colunas_destino = list(resultado.columns[:len(df2.columns)])
+    adicionadas = [c for c in resultado.columns if c not in colunas_destino]
+    gravar_estado(arquivo, {
+        'config': _assinatura_config(config),
+        'destino': _assinatura_arquivo(config.arquivo_destino),
+        'arquivo_origem': _assinatura_arquivo(config.arquivo_origem),
+        'saida': _assinatura_arquivo(caminho_saida),
+        'origem': origem,
+        'identidades': identidades_destino(resultado, tipos, config),
+        'tipos': tipos,
+        'linhas': _tabela_hash(resultado[adicionadas]),
+        'colunas_destino': colunas_destino,
+        'nomes_destino': list(df2.columns),
+        'resultado': resultado,
+    })
+    resumo.linhas_alteradas = len(resultado)
+    return caminho_saida, len(resultado)
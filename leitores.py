@@ -0,0 +1,201 @@
+"""Leitura de arquivos do motor de vinculação, com escolha do motor do pandas.
+
+Motores disponíveis:
+    Excel (.xlsx, .xls, .ods): calamine (python-calamine), openpyxl, xlrd, odf
+    CSV: pyarrow, c, python
+
+No modo "auto" é usado o motor mais rápido instalado: calamine para planilhas
+e pyarrow para CSV, com os motores padrão do pandas como alternativa.
+
+A aba da planilha é informada pelo nome ou pela posição (0 = primeira);
+TODAS_ABAS lê todas as abas em um dict {nome da aba: DataFrame}. Em CSV a
+aba é ignorada.
+
+Quando só algumas colunas interessam (ex.: chave + colunas a copiar da
+origem), a seleção é repassada ao leitor (usecols), e colunas de texto com
+muitos valores repetidos podem ser carregadas como `category`.
+
+O separador, a codificação e os separadores decimal e de milhar dos CSVs são
+detectados de uma amostra do início do arquivo (ver dialetoCsv).
+"""
+import contextlib
+import importlib.util
+
+import pandas as pd
+
+import dialetoCsv
+from progresso import ArquivoMonitorado
+
+
+MOTORES_EXCEL = ('calamine', 'openpyxl', 'xlrd', 'odf')
+MOTORES_CSV = ('pyarrow', 'c', 'python')
+MOTORES = ('auto',) + MOTORES_EXCEL + MOTORES_CSV
+TODAS_ABAS = '*'
+
+# Linhas do CSV lidas para decidir quais colunas de texto viram category
+AMOSTRA_CATEGORIAS = 10_000
+# Coluna de texto com no máximo essa proporção de valores distintos vira category
+PROPORCAO_CATEGORIA = 0.5
+
+# Módulo que precisa estar instalado para cada motor (None = embutido no pandas)
+_MODULOS = {
+    'calamine': 'python_calamine',
+    'openpyxl': 'openpyxl',
+    'xlrd': 'xlrd',
+    'odf': 'odf',
+    'pyarrow': 'pyarrow',
+    'c': None,
+    'python': None,
+}
+
+
+def eh_csv(caminho):
+    """Indica se o caminho aponta para um arquivo CSV"""
+    return str(caminho).lower().endswith('.csv')
+
+
+def motor_disponivel(motor):
+    """Indica se a biblioteca do motor está instalada"""
+    modulo = _MODULOS.get(motor)
+    return modulo is None or importlib.util.find_spec(modulo) is not None
+
+
+def motor_padrao(caminho):
+    """Motor usado pelo pandas quando nenhum é informado"""
+    caminho = str(caminho).lower()
+    if eh_csv(caminho):
+        return 'c'
+    if caminho.endswith('.xls'):
+        return 'xlrd'
+    if caminho.endswith('.ods'):
+        return 'odf'
+    return 'openpyxl'
+
+
+def escolher_motor(caminho, motor='auto', parcial=False):
+    """Resolve o motor de leitura para o arquivo.
+
+    `parcial` indica leitura de apenas algumas linhas (nrows) ou em blocos,
+    que o motor pyarrow não suporta; nesse caso o parser C é usado. Um motor
+    que não se aplica ao tipo do arquivo é trocado pela escolha automática.
+    """
+    csv = eh_csv(caminho)
+    if motor in (None, '', 'auto'):
+        if parcial and (csv or str(caminho).lower().endswith(('.xlsx', '.xlsm'))):
+            # O parser C e o openpyxl (somente leitura) param ao atingir nrows,
+            # enquanto pyarrow e calamine processam o arquivo inteiro
+            return motor_padrao(caminho)
+        preferido = 'pyarrow' if csv else 'calamine'
+        if motor_disponivel(preferido):
+            return preferido
+        return motor_padrao(caminho)
+
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de leitura desconhecido: '{motor}'")
+    if motor not in (MOTORES_CSV if csv else MOTORES_EXCEL):
+        # Motor de outro tipo de arquivo (ex.: calamine para um CSV): usa o automático
+        return escolher_motor(caminho, 'auto', parcial)
+    if not motor_disponivel(motor):
+        raise ValueError(f"Motor de leitura '{motor}' não está instalado")
+    if motor == 'pyarrow' and parcial:
+        return 'c'
+    return motor
+
+
+def aba_de_texto(texto):
+    """Converte a aba digitada (nome, posição ou "*") no valor aceito por ler()"""
+    texto = str(texto).strip()
+    if not texto:
+        return 0
+    return int(texto) if texto.isdigit() else texto
+
+
+def nomes_abas(caminho, motor='auto'):
+    """Nomes das abas da planilha (CSV não tem abas)"""
+    if eh_csv(caminho):
+        return []
+    with pd.ExcelFile(caminho, engine=escolher_motor(caminho, motor)) as planilha:
+        return list(planilha.sheet_names)
+
+
+def colunas_repetitivas(df, candidatas):
+    """Colunas de texto entre as candidatas com poucos valores distintos"""
+    if not len(df):
+        return []
+    return [c for c in candidatas
+            if c in df.columns and (pd.api.types.is_string_dtype(df[c]) or df[c].dtype == object)
+            and df[c].nunique() <= PROPORCAO_CATEGORIA * len(df)]
+
+
+def _categorizar(df, categorias):
+    repetitivas = colunas_repetitivas(df, categorias)
+    return df.astype({c: 'category' for c in repetitivas}) if repetitivas else df
+
+
+def _abrir(caminho, progresso):
+    """O próprio caminho ou, com progresso, o arquivo aberto informando os bytes lidos"""
+    if progresso is None:
+        return contextlib.nullcontext(caminho)
+    return ArquivoMonitorado(caminho, progresso)
+
+
+def _opcoes_csv(caminho, engine):
+    """Motor e opções do pd.read_csv conforme o dialeto detectado do CSV"""
+    dialeto = dialetoCsv.dialeto(caminho)
+    if dialeto.milhar and engine == 'pyarrow':
+        # O motor pyarrow não aceita separador de milhar
+        engine = 'c'
+    return engine, dialeto.opcoes()
+
+
+def ler(caminho, skiprows=0, nrows=None, motor='auto', aba=0, colunas=None, categorias=None, progresso=None):
+    """Lê um arquivo Excel ou CSV em um DataFrame com o motor escolhido.
+
+    Com aba=TODAS_ABAS retorna um dict {nome da aba: DataFrame} (exceto em CSV).
+    `colunas` restringe a leitura a essas colunas (as ausentes são ignoradas);
+    as colunas de `categorias` com muitos valores repetidos são lidas como category.
+    Com `progresso` (progresso.Progresso), a leitura informa os bytes lidos e
+    pode ser cancelada.
+    """
+    engine = escolher_motor(caminho, motor, parcial=nrows is not None)
+    if eh_csv(caminho):
+        engine, opcoes = _opcoes_csv(caminho, engine)
+        dtype = None
+        if colunas is not None or categorias:
+            # Uma amostra do início do arquivo dá o cabeçalho e a repetição dos textos
+            amostra = pd.read_csv(caminho, skiprows=skiprows, nrows=AMOSTRA_CATEGORIAS,
+                                  engine=escolher_motor(caminho, motor, parcial=True), **opcoes)
+            if colunas is not None:
+                selecionadas = set(colunas)
+                colunas = [c for c in amostra.columns if c in selecionadas]
+            dtype = {c: 'category' for c in colunas_repetitivas(amostra, categorias or [])} or None
+        with _abrir(caminho, progresso) as fonte:
+            return pd.read_csv(fonte, skiprows=skiprows, nrows=nrows, engine=engine,
+                               usecols=colunas, dtype=dtype, **opcoes)
+
+    usecols = None
+    if colunas is not None:
+        selecionadas = frozenset(colunas)
+        # Função em vez de lista: abas sem alguma das colunas não geram erro
+        usecols = lambda coluna: coluna in selecionadas
+    with _abrir(caminho, progresso) as fonte:
+        lido = pd.read_excel(fonte, sheet_name=None if aba == TODAS_ABAS else aba,
+                             skiprows=skiprows, nrows=nrows, engine=engine, usecols=usecols)
+    if not categorias:
+        return lido
+    if isinstance(lido, dict):
+        return {nome: _categorizar(df, categorias) for nome, df in lido.items()}
+    return _categorizar(lido, categorias)
+
+
+@contextlib.contextmanager
+def ler_em_blocos(caminho, skiprows=0, chunksize=100_000, motor='auto', progresso=None, dtype=None):
+    """Iterador de blocos de um CSV (usar com `with ... as leitor`).
+
+    `dtype` fixa o tipo de colunas cujo tipo deduzido poderia mudar de um bloco para outro.
+    """
+    engine, opcoes = _opcoes_csv(caminho, escolher_motor(caminho, motor, parcial=True))
+    with _abrir(caminho, progresso) as fonte:
+        with pd.read_csv(fonte, skiprows=skiprows, chunksize=chunksize, engine=engine, dtype=dtype,
+                         **opcoes) as leitor:
+            yield leitor
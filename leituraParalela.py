@@ -0,0 +1,130 @@
+"""Leitura simultânea da origem e do destino.
+
+Os dois arquivos são independentes, mas a leitura de uma planilha (.xlsx/.xls)
+é quase toda código Python (openpyxl, xlrd) que segura o GIL: em threads, duas
+planilhas grandes levariam a soma dos dois tempos. Quando há mais de uma
+planilha a partir de LIMITE_PROCESSO bytes, cada uma é lida em um processo
+separado e o tempo total cai para o da leitura mais lenta. CSVs (o pyarrow e o
+motor C liberam o GIL) e planilhas pequenas, que não compensam iniciar um
+processo, são lidos em threads. O andamento de cada arquivo (bytes lidos) fica
+em memória compartilhada e é somado em uma única etapa do progresso.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import leitores
+import progresso as progresso_merge
+
+
+# Planilhas menores que isso são lidas em thread: iniciar um processo custaria mais que a leitura
+LIMITE_PROCESSO = 4 * 1024 * 1024
+
+
+class _ProgressoArquivo:
+    """Andamento de um arquivo em memória compartilhada, no lugar do Progresso dentro da leitura"""
+
+    def __init__(self, feitos, totais, indice, cancelado):
+        self._feitos = feitos
+        self._totais = totais
+        self._indice = indice
+        self._cancelado = cancelado
+
+    def definir_total(self, total, unidade='bytes'):
+        self._totais[self._indice] = total
+
+    def posicionar(self, feito):
+        self._feitos[self._indice] = feito
+        self.verificar()
+
+    def verificar(self):
+        if self._cancelado.is_set():
+            raise progresso_merge.MergeCancelado()
+
+
+# Memória compartilhada com o processo principal, recebida por cada processo do pool ao iniciar
+_compartilhado = None
+
+
+def _iniciar_processo(feitos, totais, cancelado):
+    global _compartilhado
+    _compartilhado = (feitos, totais, cancelado)
+
+
+def _ler_no_processo(indice, caminho, opcoes):
+    feitos, totais, cancelado = _compartilhado
+    return leitores.ler(caminho, progresso=_ProgressoArquivo(feitos, totais, indice, cancelado), **opcoes)
+
+
+def planilha_grande(caminho):
+    """Indica se o arquivo é uma planilha grande o bastante para ser lida em outro processo"""
+    # Arquivos inexistentes seguem para a leitura comum, que informa o erro
+    return (not leitores.eh_csv(caminho) and os.path.isfile(caminho)
+            and os.path.getsize(caminho) >= LIMITE_PROCESSO)
+
+
+class LeituraParalela:
+    """Leituras simultâneas de arquivos nomeados (usar com `with`).
+
+    `arquivos` é um dict {nome: caminho}; leitor(nome) retorna a função que lê
+    esse arquivo, com a assinatura de leitores.ler, para ser chamada de threads
+    diferentes. `progresso` recebe o andamento somado e o detalhe por arquivo;
+    o cancelamento pedido a ele interrompe todas as leituras.
+    """
+
+    def __init__(self, arquivos, progresso=None):
+        self.progresso = progresso_merge.obter(progresso)
+        self._nomes = list(arquivos)
+        grandes = {nome for nome, caminho in arquivos.items() if planilha_grande(caminho)}
+        # Com uma única planilha grande (ou um único processador) não há o que ganhar com processos
+        self._em_processo = grandes if len(grandes) > 1 and (os.cpu_count() or 1) > 1 else set()
+        self._feitos = multiprocessing.RawArray('q', len(self._nomes))
+        self._totais = multiprocessing.RawArray('q', len(self._nomes))
+        self._cancelado = multiprocessing.Event()
+        self._processos = None
+        self._lock = threading.Lock()
+        self._fim = threading.Event()
+        self._acompanhamento = None
+
+    def __enter__(self):
+        self._acompanhamento = threading.Thread(target=self._acompanhar, daemon=True)
+        self._acompanhamento.start()
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        if erro is not None:
+            # Uma leitura falhou: as outras não serão usadas
+            self._cancelado.set()
+        self._fim.set()
+        self._acompanhamento.join()
+        if self._processos is not None:
+            self._processos.shutdown(cancel_futures=True)
+        return False
+
+    def _acompanhar(self):
+        while not self._fim.wait(progresso_merge.INTERVALO_ATUALIZACAO):
+            if self.progresso.cancelado:
+                self._cancelado.set()
+            self.progresso.posicionar_arquivos({nome: (self._feitos[i], self._totais[i])
+                                                for i, nome in enumerate(self._nomes)})
+
+    def _pool(self):
+        with self._lock:
+            if self._processos is None:
+                self._processos = ProcessPoolExecutor(max_workers=len(self._em_processo),
+                                                      initializer=_iniciar_processo,
+                                                      initargs=(self._feitos, self._totais, self._cancelado))
+            return self._processos
+
+    def leitor(self, nome):
+        """Função que lê o arquivo `nome`, em outro processo quando compensa"""
+        indice = self._nomes.index(nome)
+
+        def ler(caminho, progresso=None, **opcoes):
+            # O andamento vai para a memória compartilhada, não para `progresso`
+            if nome in self._em_processo:
+                return self._pool().submit(_ler_no_processo, indice, caminho, opcoes).result()
+            return leitores.ler(caminho, progresso=_ProgressoArquivo(self._feitos, self._totais, indice,
+                                                                     self._cancelado), **opcoes)
+        return ler
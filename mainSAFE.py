@@ -1,10 +1,10 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import pandas as pd
-import os
 from pathlib import Path
 import threading
 
+import mergeEngine
+
 
 class ExcelMergerApp:
     def __init__(self, root):
@@ -351,14 +351,7 @@ class ExcelMergerApp:
     def validar_arquivo(self, caminho, numero):
         """Valida se o arquivo existe e é legível"""
         try:
-            if not os.path.exists(caminho):
-                raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
-                
-            # Detecta tipo de arquivo e tenta ler
-            if caminho.lower().endswith('.csv'):
-                pd.read_csv(caminho, nrows=1)
-            else:
-                pd.read_excel(caminho, nrows=1)
+            mergeEngine.validar_arquivo(caminho)
                 
             self.status_var.set(f"✅ Arquivo {numero} carregado com sucesso!")
             
@@ -406,19 +399,8 @@ class ExcelMergerApp:
             if not int(skip1) or not int(skip2):
                 print()
             
-            # Carrega dados baseado no tipo de arquivo
-            if arquivo1.lower().endswith('.csv'):
-                df1 = pd.read_csv(arquivo1, skiprows=skip1, nrows=5)
-            else:
-                df1 = pd.read_excel(arquivo1, skiprows=skip1, nrows=5)
-                
-            if arquivo2.lower().endswith('.csv'):
-                df2 = pd.read_csv(arquivo2, skiprows=skip2, nrows=5)
-            else:
-                df2 = pd.read_excel(arquivo2, skiprows=skip2, nrows=5)
-            
-            self.df1_columns = list(df1.columns)
-            self.df2_columns = list(df2.columns)
+            self.df1_columns = mergeEngine.ler_colunas(arquivo1, skip1)
+            self.df2_columns = mergeEngine.ler_colunas(arquivo2, skip2)
             
             # No modo automático, verifica colunas em comum
             if not self.manual_selection.get():
@@ -506,49 +488,28 @@ class ExcelMergerApp:
             indices_selecionados = self.listbox_colunas.curselection()
             colunas_selecionadas = [self.df1_columns[i] for i in indices_selecionados]
             
-            # Carrega os dados completos
-            if arquivo1.lower().endswith('.csv'):
-                df1 = pd.read_csv(arquivo1, skiprows=skip1)
-            else:
-                df1 = pd.read_excel(arquivo1, skiprows=skip1)
-                
-            if arquivo2.lower().endswith('.csv'):
-                df2 = pd.read_csv(arquivo2, skiprows=skip2)
-            else:
-                df2 = pd.read_excel(arquivo2, skiprows=skip2)
-            
             # Obter colunas-chave com base no modo
             if self.manual_selection.get():
-                chave_origem = self.combo_chave_origem.get()
-                chave_destino = self.combo_chave_destino.get()
-                if not chave_origem or not chave_destino:
-                    raise ValueError("Selecione as colunas-chave para ambos os arquivos")
-                # Renomeia temporariamente a coluna do arquivo origem para corresponder ao destino
-                df1 = df1.rename(columns={chave_origem: chave_destino})
-                chave = chave_destino
+                config = mergeEngine.ConfigMerge(arquivo1, arquivo2,
+                                                 self.combo_chave_origem.get(),
+                                                 self.combo_chave_destino.get(),
+                                                 colunas_selecionadas,
+                                                 skip_origem=skip1, skip_destino=skip2)
             else:
                 chave = self.combo_chave.get()
                 if not chave:
                     raise ValueError("Selecione a coluna-chave")
+                config = mergeEngine.ConfigMerge.automatica(arquivo1, arquivo2, chave,
+                                                            colunas_selecionadas,
+                                                            skip_origem=skip1, skip_destino=skip2)
             
-            # Verifica se as colunas existem
-            if chave not in df1.columns or chave not in df2.columns:
-                raise ValueError(f"Coluna-chave '{chave}' não encontrada em um dos arquivos")
-                
-            for coluna in colunas_selecionadas:
-                if coluna not in df1.columns:
-                    raise ValueError(f"Coluna '{coluna}' não encontrada no arquivo origem")
-            
-            # Colunas para merge (chave + selecionadas)
-            colunas_merge = [chave] + [col for col in colunas_selecionadas if col != chave]
-            
-            # Realiza o merge
-            df_merge = df2.merge(df1[colunas_merge], on=chave, how='left')
+            # Carrega os dados completos e realiza o merge
+            df_merge = mergeEngine.executar_merge(config)
             
             # Abre caixa de diálogo para escolher nome e local do arquivo de saída
             arquivo_base = Path(arquivo2)
-            extensao = '.csv' if arquivo2.lower().endswith('.csv') else '.xlsx'
-            nome_sugerido = f"{arquivo_base.stem}_vinculado{extensao}"
+            extensao = mergeEngine.extensao_saida(arquivo2)
+            nome_sugerido = mergeEngine.nome_saida_sugerido(arquivo2).name
             
             # Executa a caixa de diálogo na thread principal
             nome_saida = filedialog.asksaveasfilename(
@@ -561,15 +522,8 @@ class ExcelMergerApp:
             if not nome_saida:
                 raise ValueError("Nenhum arquivo de saída selecionado")
                 
-            # Garante que o arquivo tenha a extensão correta
-            if not nome_saida.lower().endswith(('.xlsx', '.xls', '.csv')):
-                nome_saida += extensao
-                
-            # Salva o resultado
-            if nome_saida.lower().endswith('.csv'):
-                df_merge.to_csv(nome_saida, index=False)
-            else:
-                df_merge.to_excel(nome_saida, index=False)
+            # Salva o resultado (garantindo a extensão correta)
+            nome_saida = mergeEngine.salvar_resultado(df_merge, nome_saida, extensao)
             
             # Estatísticas
             total_linhas = len(df_merge)
@@ -0,0 +1,921 @@
+"""Motor de vinculação do SAFE, independente da interface gráfica.
+
+Reúne a leitura dos arquivos, a validação das colunas-chave, o merge e a
+gravação do resultado, para que a mesma lógica seja usada pela interface
+(design1G.py / mainSAFE.py) e pela linha de comando (safeMerge.py).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+import analiseChaves
+import chaveComposta
+import escritores
+import fuzzyJoin
+import leitores
+import leituraParalela
+import normalizacao
+import progresso as progresso_merge
+import tiposChave
+from leitores import eh_csv
+
+
+EXTENSOES_SAIDA = escritores.EXTENSOES + ('.xls',)
+TAMANHO_CHUNK = 100_000
+# Linhas do destino por bloco da junção quando há acompanhamento de progresso
+BLOCO_JUNCAO = 500_000
+# Coluna temporária usada na junção quando a chave é normalizada ou convertida de tipo
+COLUNA_JUNCAO = '__chave_safe__'
+# Indicador do merge ('both' ou 'left_only'), usado para contar as correspondências
+COLUNA_INDICADOR = '__vinculo_safe__'
+# modo -> descrição exibida na interface: o que fazer com as colunas a copiar
+# que já existem no destino
+MODOS_ATUALIZACAO = {
+    'acrescentar': "Acrescentar como novas colunas (sufixos _x/_y)",
+    'preencher': "Preencher apenas as células vazias",
+    'sobrescrever': "Sobrescrever com os valores da origem",
+}
+# Sufixo temporário das colunas da origem que atualizam colunas do destino
+SUFIXO_ORIGEM = '__origem_safe__'
+# Linhas do destino vinculadas na prévia do resultado
+LINHAS_PREVIA = 300
+
+
+def ler_arquivo(caminho, skiprows=0, nrows=None, motor='auto', aba=0, colunas=None, categorias=None,
+                progresso=None):
+    """Lê um arquivo Excel ou CSV em um DataFrame (ou dict de abas, com TODAS_ABAS)"""
+    return leitores.ler(caminho, skiprows=skiprows, nrows=nrows, motor=motor, aba=aba,
+                        colunas=colunas, categorias=categorias, progresso=progresso)
+
+
+def carregar_arquivo(caminho, skiprows=0, cache=None, motor='auto', aba=0, colunas=None, categorias=None,
+                     progresso=None, ler=ler_arquivo):
+    """Lê o arquivo completo, usando o cache (em disco ou da sessão) quando informado.
+
+    Com `colunas`, só essas colunas são lidas (ver leitores.ler); a projeção
+    faz parte da chave do cache. `ler` substitui a leitura do arquivo (ver
+    leituraParalela.LeituraParalela.leitor).
+    """
+    def leitor():
+        return ler(caminho, skiprows=skiprows, motor=motor, aba=aba,
+                   colunas=colunas, categorias=categorias, progresso=progresso)
+    if cache is None:
+        df = leitor()
+    else:
+        projecao = None if colunas is None else (tuple(colunas), tuple(categorias or ()))
+        df = cache.obter(caminho, leitor, skiprows=skiprows, sheet=aba, projecao=projecao, progresso=progresso)
+    if progresso is not None:
+        progresso.registrar_linhas(total_linhas(df))
+    return df
+
+
+def ler_cabecalho(caminho, skiprows=0, motor='auto', aba=0):
+    """Retorna as colunas do arquivo lendo apenas até a linha de cabeçalho.
+
+    Com nrows=0 o pandas interrompe a leitura logo após o cabeçalho (o
+    openpyxl, por exemplo, abre o .xlsx em modo somente leitura), mantendo os
+    mesmos nomes de coluna (inclusive "Unnamed: n" e duplicadas) que a leitura completa.
+    Com TODAS_ABAS retorna as colunas de todas as abas, sem repetição.
+    """
+    lido = ler_arquivo(caminho, skiprows=skiprows, nrows=0, motor=motor, aba=aba)
+    if isinstance(lido, dict):
+        return list(dict.fromkeys(c for df in lido.values() for c in df.columns))
+    return list(lido.columns)
+
+
+def validar_arquivo(caminho):
+    """Valida se o arquivo existe e é legível"""
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
+    ler_cabecalho(caminho)
+
+
+def ler_colunas(caminho, skiprows=0):
+    """Retorna a lista de colunas do arquivo, lendo apenas o cabeçalho"""
+    return ler_cabecalho(caminho, skiprows)
+
+
+def colunas_comuns(colunas1, colunas2):
+    """Retorna as colunas presentes nos dois arquivos"""
+    return list(set(colunas1) & set(colunas2))
+
+
+@dataclass
+class ConfigMerge:
+    """Parâmetros de uma vinculação entre arquivo origem e destino.
+
+    As chaves podem ser o nome de uma coluna ou uma lista de colunas (chave composta).
+    """
+    arquivo_origem: str
+    arquivo_destino: str
+    chave_origem: object
+    chave_destino: object
+    colunas: list = field(default_factory=list)
+    skip_origem: int = 0
+    skip_destino: int = 0
+    motor_leitura: str = 'auto'
+    duplicadas: str = 'manter'
+    limite_expansao: float = analiseChaves.LIMITE_EXPANSAO
+    normalizar_chave: normalizacao.OpcoesNormalizacao = normalizacao.OpcoesNormalizacao()
+    juncao_aproximada: bool = False
+    similaridade_minima: float = fuzzyJoin.SIMILARIDADE_MINIMA
+    # Nome ou posição da aba; TODAS_ABAS usa todas (ver carregar_origem e carregar_destino)
+    aba_origem: object = 0
+    aba_destino: object = 0
+    # Colunas a copiar que já existem no destino (ver MODOS_ATUALIZACAO)
+    atualizacao: str = 'acrescentar'
+
+    @classmethod
+    def automatica(cls, arquivo_origem, arquivo_destino, chave, colunas, **kwargs):
+        """Cria a configuração com a(s) mesma(s) coluna(s)-chave nos dois arquivos"""
+        return cls(arquivo_origem, arquivo_destino, chave, chave, list(colunas), **kwargs)
+
+    @property
+    def colunas_chave_origem(self):
+        return chaveComposta.colunas_chave(self.chave_origem)
+
+    @property
+    def colunas_chave_destino(self):
+        return chaveComposta.colunas_chave(self.chave_destino)
+
+    @property
+    def chave_composta(self):
+        """Indica se a junção usa mais de uma coluna-chave"""
+        return len(self.colunas_chave_destino) > 1
+
+    def validar(self):
+        """Valida os parâmetros antes de ler os arquivos"""
+        if not self.colunas_chave_origem or not self.colunas_chave_destino:
+            raise ValueError("Selecione as colunas-chave para ambos os arquivos")
+        if len(self.colunas_chave_origem) != len(self.colunas_chave_destino):
+            raise ValueError("Selecione a mesma quantidade de colunas-chave nos dois arquivos")
+        if not self.colunas:
+            raise ValueError("Selecione pelo menos uma coluna para copiar")
+        if self.duplicadas not in analiseChaves.POLITICAS_DUPLICADAS:
+            raise ValueError(f"Política de chaves duplicadas desconhecida: '{self.duplicadas}'")
+        if self.atualizacao not in MODOS_ATUALIZACAO:
+            raise ValueError(f"Modo de atualização desconhecido: '{self.atualizacao}'")
+        if self.juncao_aproximada:
+            if self.chave_composta:
+                raise ValueError("A junção aproximada aceita apenas uma coluna-chave")
+            fuzzyJoin.validar_similaridade(self.similaridade_minima)
+
+
+@dataclass
+class RelatorioMerge:
+    """Informações coletadas durante a vinculação, para exibição ao usuário"""
+    analise_chaves: analiseChaves.AnaliseChaves = None
+    # Linhas do destino vinculadas por similaridade (abaixo de 1) na junção aproximada
+    linhas_aproximadas: int = None
+    # Com todas as abas do destino: abas vinculadas e abas copiadas sem alteração
+    abas_vinculadas: list = None
+    abas_mantidas: list = None
+    # Modo incremental: incremental.ResumoIncremental com o que foi refeito
+    incremental: object = None
+    # Tempo, vazão e memória por etapa: metricas.MedidorMerge
+    metricas: object = None
+    # Linhas do destino com e sem correspondência: analiseChaves.Correspondencia
+    correspondencia: analiseChaves.Correspondencia = None
+    # Com atualização das colunas existentes: {coluna: células preenchidas ou alteradas}
+    celulas_atualizadas: dict = None
+    # Chaves de tipos diferentes convertidas para um tipo comum: tiposChave.ConversaoChave
+    conversao_chave: tiposChave.ConversaoChave = None
+    # Informado pelo chamador: guarda também as chaves sem correspondência
+    # (ver salvar_chaves_sem_correspondencia)
+    coletar_chaves: bool = False
+
+
+@dataclass
+class PreviaMerge:
+    """Primeiras linhas do resultado e quantas delas encontraram a chave na origem"""
+    resultado: pd.DataFrame
+    correspondencia: analiseChaves.Correspondencia
+
+    def resumo(self):
+        """Texto com a taxa de correspondência, para mensagens ao usuário"""
+        return self.correspondencia.resumo()
+
+
+def indice_origem(df1, config):
+    """Reduz a origem às colunas-chave (já com os nomes do destino) e às colunas a copiar"""
+    chaves = config.colunas_chave_destino
+    renomear = {o: d for o, d in zip(config.colunas_chave_origem, chaves) if o != d}
+    if renomear:
+        # Renomeia as colunas do arquivo origem para corresponder ao destino
+        df1 = df1.rename(columns=renomear)
+
+    for chave in chaves:
+        if chave not in df1.columns:
+            raise ValueError(f"Coluna-chave '{chave}' não encontrada em um dos arquivos")
+
+    for coluna in config.colunas:
+        if coluna not in df1.columns:
+            raise ValueError(f"Coluna '{coluna}' não encontrada no arquivo origem")
+
+    colunas_merge = chaves + [col for col in config.colunas if col not in chaves]
+    return df1[colunas_merge]
+
+
+def preparar_origem(df1, config):
+    """Índice da origem pronto para a junção, com o nome da coluna de junção.
+
+    Sem normalização a junção é feita pela própria coluna-chave. Com
+    normalização, a chave normalizada vai para uma coluna temporária,
+    preservando os valores originais da chave no resultado. Chaves compostas
+    viram um código inteiro na coluna temporária, e na junção aproximada ela
+    recebe a posição da chave no índice de trigramas. O terceiro valor
+    retornado (codificador da chave composta, índice de trigramas ou None) é
+    usado para preparar o destino da mesma forma. Chaves que a normalização
+    deixa vazias (ex.: "N/D" só com dígitos) ficam fora do índice, para que
+    não casem entre si como os ausentes no merge do pandas.
+    """
+    indice = indice_origem(df1, config)
+    opcoes = config.normalizar_chave
+    # As chaves normalizadas ficam guardadas por DataFrame lido (ver normalizacao.py)
+    normalizadas = [normalizacao.chave_normalizada(df1, c, opcoes) for c in config.colunas_chave_origem]
+
+    if config.chave_composta:
+        codificador = chaveComposta.CodificadorChave(normalizadas)
+        indice = indice.drop(columns=config.colunas_chave_destino).assign(**{COLUNA_JUNCAO: codificador.codigos})
+        if opcoes.ativa:
+            indice = indice[pd.concat(normalizadas, axis=1).notna().all(axis=1).to_numpy()]
+        return indice, COLUNA_JUNCAO, codificador
+
+    coluna = config.colunas_chave_destino[0]
+    if opcoes.ativa:
+        indice = indice.drop(columns=coluna).assign(**{COLUNA_JUNCAO: normalizadas[0]})
+        indice = indice[indice[COLUNA_JUNCAO].notna()]
+        coluna = COLUNA_JUNCAO
+
+    if not config.juncao_aproximada:
+        return indice, coluna, None
+
+    indice_ngramas = fuzzyJoin.IndiceNgramas(indice[coluna], config.similaridade_minima,
+                                             rotulos=df1.loc[indice.index, config.colunas_chave_origem[0]])
+    indice = indice.drop(columns=coluna).assign(**{COLUNA_JUNCAO: indice_ngramas.posicoes(indice[coluna])})
+    # Chaves vazias da origem não participam da junção aproximada
+    indice = indice[indice[COLUNA_JUNCAO] >= 0]
+    return indice, COLUNA_JUNCAO, indice_ngramas
+
+
+def preparar_destino(destino, config, tradutor=None):
+    """Destino (ou um bloco dele) com a coluna de junção correspondente à da origem.
+
+    `tradutor` é o terceiro valor retornado por preparar_origem().
+    """
+    chaves = config.colunas_chave_destino
+    for chave in chaves:
+        if chave not in destino.columns:
+            raise ValueError(f"Coluna-chave '{chave}' não encontrada em um dos arquivos")
+
+    opcoes = config.normalizar_chave
+    if config.chave_composta:
+        codigos = tradutor.codificar([normalizacao.chave_normalizada(destino, c, opcoes) for c in chaves])
+        return destino.assign(**{COLUNA_JUNCAO: codigos})
+
+    coluna = chaves[0]
+    if opcoes.ativa:
+        destino = destino.assign(**{COLUNA_JUNCAO: normalizacao.chave_normalizada(destino, coluna, opcoes)})
+        coluna = COLUNA_JUNCAO
+
+    if config.juncao_aproximada:
+        # Cada chave recebe a posição da origem mais parecida (vazia sem correspondência),
+        # a chave encontrada e a similaridade, para auditoria
+        pares = tradutor.correspondencias(destino[coluna])
+        valores = destino[coluna]
+        destino = destino.assign(**{
+            COLUNA_JUNCAO: valores.map(pares['posicao']).astype('Int64'),
+            fuzzyJoin.COLUNA_CHAVE_ENCONTRADA: valores.map(pares['origem']),
+            fuzzyJoin.COLUNA_SIMILARIDADE: valores.map(pares['similaridade']),
+        })
+    return destino
+
+
+def tem_chaves(df, config):
+    """Indica se o DataFrame (aba do destino) tem todas as colunas-chave do destino"""
+    return all(chave in df.columns for chave in config.colunas_chave_destino)
+
+
+def colunas_leitura_origem(config):
+    """Colunas da origem usadas na vinculação: as chaves e as colunas a copiar"""
+    return list(dict.fromkeys(config.colunas_chave_origem + list(config.colunas)))
+
+
+def carregar_origem(config, cache=None, progresso=None, ler=ler_arquivo):
+    """Lê só as colunas usadas da origem; com todas as abas, junta as abas que têm as colunas-chave.
+
+    As colunas a copiar com textos muito repetidos (UF, cidade, situação...)
+    são carregadas como category; as colunas-chave mantêm o tipo original.
+    """
+    categorias = [c for c in config.colunas if c not in config.colunas_chave_origem]
+    df1 = carregar_arquivo(config.arquivo_origem, config.skip_origem, cache, config.motor_leitura,
+                           config.aba_origem, colunas_leitura_origem(config), categorias, progresso, ler)
+    if not isinstance(df1, dict):
+        return df1
+    abas = [df for df in df1.values() if all(c in df.columns for c in config.colunas_chave_origem)]
+    if not abas:
+        raise ValueError("Nenhuma aba do arquivo origem tem as colunas-chave selecionadas")
+    return pd.concat(abas, ignore_index=True)
+
+
+def carregar_destino(config, cache=None, progresso=None, ler=ler_arquivo):
+    """Lê o destino: um DataFrame ou, com todas as abas, um dict {aba: DataFrame}"""
+    return carregar_arquivo(config.arquivo_destino, config.skip_destino, cache, config.motor_leitura,
+                            config.aba_destino, progresso=progresso, ler=ler)
+
+
+def carregar_entradas(config, cache=None, progresso=None):
+    """Lê a origem e o destino ao mesmo tempo (ver leituraParalela); retorna (origem, destino)"""
+    progresso = progresso_merge.obter(progresso)
+    progresso.etapa("Lendo origem e destino")
+    arquivos = {'origem': config.arquivo_origem, 'destino': config.arquivo_destino}
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="safe-entrada") as executor:
+        with leituraParalela.LeituraParalela(arquivos, progresso) as leitura:
+            origem = executor.submit(carregar_origem, config, cache, progresso, leitura.leitor('origem'))
+            destino = executor.submit(carregar_destino, config, cache, progresso, leitura.leitor('destino'))
+            df1, df2 = origem.result(), destino.result()
+    # Cada leitura registrou só as próprias linhas
+    progresso.registrar_linhas(total_linhas(df1) + total_linhas(df2))
+    return df1, df2
+
+
+def juntar_abas(indice, coluna, tradutor, abas, config, relatorio=None, progresso=None):
+    """Vincula cada aba do destino à origem já preparada, em paralelo.
+
+    Abas sem as colunas-chave seguem sem alteração. Retorna um dict
+    {aba: DataFrame} na ordem original das abas, pronto para salvar_resultado().
+    """
+    vinculaveis = [nome for nome, df in abas.items() if tem_chaves(df, config)]
+    if not vinculaveis:
+        raise ValueError("Nenhuma aba do arquivo destino tem as colunas-chave selecionadas")
+
+    progresso = progresso_merge.obter(progresso)
+    progresso.etapa("Vinculando abas", total=len(vinculaveis), unidade='abas')
+    memoria = {}
+
+    def vincular_aba(nome):
+        progresso.verificar()
+        relatorio_aba = RelatorioMerge(coletar_chaves=relatorio is not None and relatorio.coletar_chaves)
+        destino = preparar_destino(abas[nome], config, tradutor)
+        resultado = juntar(indice, destino, coluna, config, relatorio_aba, memoria=memoria)
+        progresso.avancar(1)
+        return resultado, relatorio_aba
+
+    # Merge e fatoração das chaves liberam o GIL em boa parte do tempo
+    with ThreadPoolExecutor(max_workers=min(len(vinculaveis), os.cpu_count() or 1),
+                            thread_name_prefix="safe-aba") as executor:
+        vinculadas = dict(zip(vinculaveis, executor.map(vincular_aba, vinculaveis)))
+
+    if relatorio is not None:
+        relatorio.abas_vinculadas = vinculaveis
+        relatorio.abas_mantidas = [nome for nome in abas if nome not in vinculadas]
+        if config.juncao_aproximada:
+            relatorio.linhas_aproximadas = sum(r.linhas_aproximadas for _, r in vinculadas.values())
+        relatorio.correspondencia = analiseChaves.Correspondencia.total(
+            r.correspondencia for _, r in vinculadas.values())
+        relatorio.celulas_atualizadas = somar_contagens(r.celulas_atualizadas for _, r in vinculadas.values())
+        relatorio.conversao_chave = tiposChave.ConversaoChave.total(
+            r.conversao_chave for _, r in vinculadas.values())
+    return {nome: vinculadas[nome][0] if nome in vinculadas else df for nome, df in abas.items()}
+
+
+def total_linhas(resultado):
+    """Linhas do resultado (somando as abas, quando houver várias)"""
+    if isinstance(resultado, dict):
+        return sum(len(df) for df in resultado.values())
+    return len(resultado)
+
+
+def preparar_juncao(df1, df2, config):
+    """Índice da origem e destino prontos para o merge, com o nome da coluna de junção"""
+    indice, coluna, tradutor = preparar_origem(df1, config)
+    return indice, preparar_destino(df2, config, tradutor), coluna
+
+
+def analisar(df1, df2, config):
+    """Analisa as colunas-chave da origem e do destino sem realizar o merge"""
+    indice, destino, coluna = preparar_juncao(df1, df2, config)
+    indice, destino, coluna, _ = conciliar_chaves(indice, destino, coluna)
+    return analiseChaves.analisar_chaves(indice[coluna], destino[coluna], not config.juncao_aproximada)
+
+
+def conciliar_chaves(indice, destino, coluna, memoria=None):
+    """Coloca as chaves da origem e do destino em um tipo comum antes do merge (ver tiposChave).
+
+    Retorna (indice, destino, coluna de junção, tiposChave.ConversaoChave). Com
+    conversão, a chave convertida vai para COLUNA_JUNCAO, preservando no
+    resultado os valores originais da chave do destino. Chaves da origem que
+    ficam ausentes na conversão saem do índice: senão casariam com os valores
+    do destino que não viram número (ex.: "N/D"), como os ausentes no merge do pandas.
+    """
+    chave_origem, chave_destino, conversao = tiposChave.conciliar(indice[coluna], destino[coluna], memoria)
+    if not conversao.convertida:
+        return indice, destino, coluna, conversao
+    indice = indice.drop(columns=coluna).assign(**{COLUNA_JUNCAO: chave_origem})
+    indice = indice[indice[COLUNA_JUNCAO].notna()]
+    return indice, destino.assign(**{COLUNA_JUNCAO: chave_destino}), COLUNA_JUNCAO, conversao
+
+
+def juntar(indice, destino, coluna, config, relatorio=None, progresso=None, memoria=None):
+    """Merge da origem e do destino já preparados (ver preparar_juncao).
+
+    Com `progresso`, o destino é juntado em blocos de BLOCO_JUNCAO linhas,
+    informando as linhas vinculadas e permitindo o cancelamento entre blocos.
+    `memoria` (dict) guarda a chave da origem convertida entre abas do destino.
+    """
+    chave_original = indice[coluna]
+    indice, destino, coluna, conversao = conciliar_chaves(indice, destino, coluna, memoria)
+    chave_original = chave_original.loc[indice.index]
+    chave_convertida = indice[coluna]
+    analise = analiseChaves.analisar_chaves(indice[coluna], destino[coluna], not config.juncao_aproximada)
+    if relatorio is not None:
+        relatorio.analise_chaves = analise
+        relatorio.conversao_chave = conversao if conversao.convertida else None
+        if config.juncao_aproximada:
+            relatorio.linhas_aproximadas = int((destino[fuzzyJoin.COLUNA_SIMILARIDADE] < 1).sum())
+
+    # Interrompe antes da junção se as chaves repetidas forem explodir o resultado
+    analiseChaves.verificar_expansao(analise, config.duplicadas, config.limite_expansao)
+    indice = analiseChaves.aplicar_politica(indice, coluna, config.duplicadas)
+    atualizadas = colunas_atualizadas(indice, destino, coluna, config)
+    indice = indice.rename(columns={c: _coluna_origem(c) for c in atualizadas})
+
+    if progresso is None or len(destino) <= BLOCO_JUNCAO:
+        df_merge = destino.merge(indice, on=coluna, how='left', indicator=COLUNA_INDICADOR)
+    else:
+        # No merge 'left' cada bloco do destino pode ser juntado separadamente
+        progresso.definir_total(len(destino))
+        partes = []
+        for inicio in range(0, len(destino), BLOCO_JUNCAO):
+            bloco = destino.iloc[inicio:inicio + BLOCO_JUNCAO]
+            partes.append(bloco.merge(indice, on=coluna, how='left', indicator=COLUNA_INDICADOR))
+            progresso.avancar(len(bloco))
+        df_merge = pd.concat(partes, ignore_index=True)
+    coletar = relatorio is not None and relatorio.coletar_chaves
+    df_merge, correspondencia = separar_indicador(df_merge, coluna, len(destino), analise.ambiguas_destino,
+                                                  config, coletar)
+    if coletar and conversao.convertida:
+        # Chaves encontradas com os valores originais da origem (ver registrar_chaves_origem)
+        usadas = _contidas(chave_convertida, correspondencia.usadas).to_numpy()
+        correspondencia.usadas = chave_original[usadas].drop_duplicates()
+    if relatorio is not None:
+        relatorio.correspondencia = correspondencia
+    if atualizadas:
+        df_merge, contagens = atualizar_colunas(df_merge, atualizadas, config.atualizacao)
+        if relatorio is not None:
+            relatorio.celulas_atualizadas = contagens
+    if progresso is not None:
+        progresso.registrar_linhas(len(df_merge))
+    return df_merge
+
+
+def colunas_atualizadas(indice, destino, coluna, config):
+    """Colunas a copiar que já existem no destino e serão atualizadas em vez de acrescentadas"""
+    if config.atualizacao == 'acrescentar':
+        return []
+    return [c for c in indice.columns if c != coluna and c in destino.columns]
+
+
+def _coluna_origem(coluna):
+    return f"{coluna}{SUFIXO_ORIGEM}"
+
+
+def _vazias(serie):
+    """Células sem valor: ausentes ou, fora das colunas numéricas e de datas, texto vazio"""
+    vazias = serie.isna()
+    if not pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        vazias |= serie.eq('')
+    return vazias
+
+
+def atualizar_colunas(df_merge, colunas, modo):
+    """Preenche (ou sobrescreve) colunas do destino com as da origem, já alinhadas pela junção.
+
+    As colunas da origem chegam com SUFIXO_ORIGEM e saem do resultado. No modo
+    'preencher' só as células vazias do destino recebem o valor da origem; no
+    'sobrescrever' toda célula com valor na origem o recebe. Retorna
+    (resultado, {coluna: células preenchidas ou alteradas}).
+    """
+    resultado = df_merge.drop(columns=[_coluna_origem(c) for c in colunas])
+    contagens = {}
+    for coluna in colunas:
+        destino = df_merge[coluna]
+        origem = df_merge[_coluna_origem(coluna)]
+        usar = ~_vazias(origem)
+        if modo == 'preencher':
+            usar &= _vazias(destino)
+        else:
+            usar &= _vazias(destino) | (destino.astype(object) != origem.astype(object))
+        try:
+            resultado[coluna] = destino.where(~usar, origem)
+        except (TypeError, ValueError):
+            # Tipos incompatíveis (ex.: inteiros do destino e textos da origem)
+            resultado[coluna] = destino.astype(object).where(~usar, origem.astype(object))
+        contagens[coluna] = int(usar.sum())
+    return resultado, contagens
+
+
+def somar_contagens(contagens):
+    """Soma as células atualizadas por coluna de várias abas ou blocos (None quando não houve atualização)"""
+    total = {}
+    for parte in contagens:
+        for coluna, celulas in (parte or {}).items():
+            total[coluna] = total.get(coluna, 0) + celulas
+    return total or None
+
+
+def separar_indicador(df_merge, coluna, linhas_destino, ambiguas, config, coletar=False):
+    """Remove do resultado o indicador e a coluna de junção, contando as correspondências.
+
+    Retorna (resultado, analiseChaves.Correspondencia). Com `coletar`, guarda as
+    chaves do destino sem correspondência e as chaves de junção encontradas.
+    """
+    sem_correspondencia = df_merge[COLUNA_INDICADOR] == 'left_only'
+    correspondencia = analiseChaves.Correspondencia(linhas_destino, int(sem_correspondencia.sum()), ambiguas)
+    if coletar:
+        chaves = df_merge.loc[sem_correspondencia, config.colunas_chave_destino]
+        correspondencia.chaves_destino = chaves.drop_duplicates(ignore_index=True)
+        correspondencia.usadas = df_merge.loc[~sem_correspondencia, coluna].drop_duplicates()
+    return df_merge.drop(columns=[COLUNA_INDICADOR, COLUNA_JUNCAO], errors='ignore'), correspondencia
+
+
+def _contidas(serie, valores):
+    """Como Series.isin, mas casando também os ausentes (o isin de Int64 e Float64 não os casa)"""
+    contidas = serie.isin(valores)
+    if pd.Series(valores, dtype=object).isna().any():
+        contidas |= serie.isna()
+    return contidas
+
+
+def registrar_conversao_composta(relatorio, tradutor, config):
+    """Guarda no relatório as conversões de tipo das colunas de uma chave composta (ver chaveComposta)"""
+    if relatorio is not None and config.chave_composta:
+        relatorio.conversao_chave = tradutor.conversao()
+
+
+def registrar_chaves_origem(correspondencia, df1, indice, coluna, config):
+    """Guarda na correspondência as chaves da origem (valores originais) que nenhuma linha do destino usou"""
+    usadas = correspondencia.usadas if correspondencia.usadas is not None else []
+    nao_usadas = ~_contidas(indice[coluna], usadas)
+    chaves = df1.loc[indice.index[nao_usadas.to_numpy()], config.colunas_chave_origem]
+    correspondencia.chaves_origem = chaves.drop_duplicates(ignore_index=True)
+    correspondencia.usadas = None
+
+
+def vincular(df1, df2, config, relatorio=None):
+    """Copia as colunas selecionadas de df1 (origem) para df2 (destino) pela chave"""
+    indice, destino, coluna = preparar_juncao(df1, df2, config)
+    return juntar(indice, destino, coluna, config, relatorio)
+
+
+def executar_merge(config, cache=None, relatorio=None, progresso=None):
+    """Lê os dois arquivos e retorna o DataFrame vinculado (dict de abas, com todas as abas).
+
+    `progresso` (progresso.Progresso) recebe as etapas e permite cancelar.
+    """
+    config.validar()
+    progresso = progresso_merge.obter(progresso)
+    df1, df2 = carregar_entradas(config, cache, progresso)
+
+    progresso.etapa("Preparando chaves")
+    indice, coluna, tradutor = preparar_origem(df1, config)
+    if isinstance(df2, dict):
+        resultado = juntar_abas(indice, coluna, tradutor, df2, config, relatorio, progresso)
+    else:
+        destino = preparar_destino(df2, config, tradutor)
+        progresso.etapa("Vinculando")
+        resultado = juntar(indice, destino, coluna, config, relatorio, progresso)
+    registrar_conversao_composta(relatorio, tradutor, config)
+    if relatorio is not None and relatorio.coletar_chaves:
+        registrar_chaves_origem(relatorio.correspondencia, df1, indice, coluna, config)
+    return resultado
+
+
+def executar_analise(config, cache=None):
+    """Lê os dois arquivos e retorna apenas a análise das colunas-chave"""
+    config.validar()
+    df1, df2 = carregar_entradas(config, cache)
+    if isinstance(df2, dict):
+        # Analisa as abas vinculáveis do destino como um único conjunto de chaves
+        abas = [df[config.colunas_chave_destino] for df in df2.values() if tem_chaves(df, config)]
+        if not abas:
+            raise ValueError("Nenhuma aba do arquivo destino tem as colunas-chave selecionadas")
+        df2 = pd.concat(abas, ignore_index=True)
+    return analisar(df1, df2, config)
+
+
+def previsualizar(config, cache=None, linhas=LINHAS_PREVIA):
+    """Vincula a origem às primeiras `linhas` do destino, sem ler o destino inteiro.
+
+    A origem é carregada como na execução completa (e fica no cache para ela);
+    com todas as abas, a prévia usa a primeira aba do destino com as colunas-chave.
+    """
+    config.validar()
+    df1 = carregar_origem(config, cache)
+    df2 = ler_arquivo(config.arquivo_destino, skiprows=config.skip_destino, nrows=linhas,
+                      motor=config.motor_leitura, aba=config.aba_destino)
+    if isinstance(df2, dict):
+        abas = [df for df in df2.values() if tem_chaves(df, config)]
+        if not abas:
+            raise ValueError("Nenhuma aba do arquivo destino tem as colunas-chave selecionadas")
+        df2 = abas[0]
+
+    indice, coluna, tradutor = preparar_origem(df1, config)
+    relatorio = RelatorioMerge()
+    resultado = juntar(indice, preparar_destino(df2, config, tradutor), coluna, config, relatorio)
+    return PreviaMerge(resultado, relatorio.correspondencia)
+
+
+def executar_merge_streaming(config, caminho_saida, chunksize=TAMANHO_CHUNK, cache=None, progresso=None,
+                             relatorio=None):
+    """Vincula um destino CSV em blocos, gravando cada bloco direto no CSV de saída.
+
+    Apenas a origem reduzida (chave + colunas a copiar) fica em memória; o
+    destino é lido em blocos de `chunksize` linhas, de modo que o consumo de
+    memória não depende do tamanho do destino. Os blocos vão para um arquivo
+    temporário, que só substitui a saída ao final. Retorna o total de linhas gravadas;
+    as correspondências de todos os blocos vão para `relatorio.correspondencia`.
+    """
+    config.validar()
+    if not eh_csv(config.arquivo_destino):
+        raise ValueError("O modo streaming exige um arquivo destino CSV")
+    if not eh_csv(caminho_saida):
+        raise ValueError("O modo streaming grava apenas arquivos CSV")
+
+    progresso = progresso_merge.obter(progresso)
+    progresso.etapa("Lendo origem")
+    df1 = carregar_origem(config, cache, progresso)
+    progresso.etapa("Preparando chaves")
+    # O codificador da chave composta ou o índice de trigramas da origem é montado
+    # uma vez e consultado a cada bloco
+    indice_completo, chave, tradutor = preparar_origem(df1, config)
+    chave_destino = chave
+    verificar_expansao = config.duplicadas == 'manter' and config.limite_expansao is not None
+    coletar = relatorio is not None and relatorio.coletar_chaves
+    correspondencias = []
+    contagens = []
+    conversoes = []
+    indice = contagem_origem = atualizadas = conversao = None
+
+    total_linhas = 0
+    progresso.etapa("Vinculando em blocos")
+    temporario = escritores.temporario_para(caminho_saida)
+    try:
+        # Sem normalização as colunas-chave são lidas como texto: o tipo deduzido pelo pandas pode
+        # mudar entre blocos (ex.: um bloco só com números e outro com "N/D"), e a conversão é
+        # decidida uma vez. Normalizadas, elas já viram texto em todos os blocos
+        tipos_chave = None
+        if not config.normalizar_chave.ativa:
+            tipos_chave = {c: str for c in config.colunas_chave_destino}
+        with leitores.ler_em_blocos(config.arquivo_destino, config.skip_destino, chunksize,
+                                    config.motor_leitura, progresso, dtype=tipos_chave) as leitor:
+            for numero, bloco in enumerate(leitor):
+                bloco = preparar_destino(bloco, config, tradutor)
+                if indice is None:
+                    # O tipo comum das chaves é escolhido pelo primeiro bloco, e a origem é convertida uma vez
+                    indice_completo, bloco, chave, conversao = conciliar_chaves(indice_completo, bloco, chave)
+                    indice, contagem_origem = _indice_streaming(indice_completo, chave, config)
+                    # Todos os blocos têm as colunas do cabeçalho
+                    atualizadas = colunas_atualizadas(indice, bloco, chave, config)
+                    indice = indice.rename(columns={c: _coluna_origem(c) for c in atualizadas})
+                elif conversao.convertida:
+                    chave_bloco, conversao = tiposChave.converter(bloco[chave_destino], conversao.tipo)
+                    bloco = bloco.assign(**{COLUNA_JUNCAO: chave_bloco})
+                conversoes.append(conversao)
+                ambiguas = 0
+                if contagem_origem is not None:
+                    contagem_bloco = bloco[chave].value_counts(dropna=False)
+                    ambiguas = analiseChaves.linhas_ambiguas(contagem_origem, contagem_bloco)
+                    # Verifica a expansão do bloco antes de juntá-lo
+                    projetadas = analiseChaves.linhas_projetadas(contagem_origem, contagem_bloco)
+                    if verificar_expansao and projetadas > config.limite_expansao * max(len(bloco), 1):
+                        raise ValueError(f"O merge multiplicaria o destino por {projetadas / max(len(bloco), 1):,.1f} "
+                                         f"(limite: {config.limite_expansao:,.1f}) por causa de chaves "
+                                         "repetidas na origem. Escolha outra política para chaves duplicadas.")
+                df_bloco = bloco.merge(indice, on=chave, how='left', indicator=COLUNA_INDICADOR)
+                df_bloco, correspondencia_bloco = separar_indicador(df_bloco, chave, len(bloco), ambiguas,
+                                                                    config, coletar)
+                correspondencias.append(correspondencia_bloco)
+                if atualizadas:
+                    df_bloco, contagens_bloco = atualizar_colunas(df_bloco, atualizadas, config.atualizacao)
+                    contagens.append(contagens_bloco)
+                df_bloco.to_csv(temporario, index=False, mode='w' if numero == 0 else 'a',
+                                header=numero == 0)
+                total_linhas += len(df_bloco)
+        if temporario.exists():
+            os.replace(temporario, caminho_saida)
+    except BaseException:
+        # Erro ou cancelamento: a saída anterior (se houver) fica intacta
+        temporario.unlink(missing_ok=True)
+        raise
+    progresso.registrar_linhas(total_linhas)
+    if relatorio is not None:
+        relatorio.correspondencia = analiseChaves.Correspondencia.total(correspondencias)
+        relatorio.celulas_atualizadas = somar_contagens(contagens)
+        relatorio.conversao_chave = tiposChave.ConversaoChave.total(conversoes)
+        registrar_conversao_composta(relatorio, tradutor, config)
+        if coletar:
+            registrar_chaves_origem(relatorio.correspondencia, df1, indice_completo, chave, config)
+    return total_linhas
+
+
+def _indice_streaming(indice, chave, config):
+    """Origem do modo streaming com a política de duplicadas aplicada.
+
+    Com chaves repetidas, retorna também as contagens da origem, que servem
+    para as linhas ambíguas e a expansão de cada bloco (None sem repetições).
+    """
+    contagem_origem = None
+    if indice[chave].duplicated().any():
+        if config.duplicadas == 'erro':
+            repetidas = int(indice[chave].duplicated(keep=False).sum())
+            raise ValueError(f"A coluna-chave da origem tem {repetidas:,} linhas com valores repetidos")
+        contagem_origem = indice[chave].value_counts(dropna=False)
+        indice = analiseChaves.aplicar_politica(indice, chave, config.duplicadas)
+    # Colunas inteiras viram Int64 para que blocos com e sem correspondência
+    # gravem os números no mesmo formato (sem o ".0" de float)
+    indice = indice.astype({c: 'Int64' for c in indice.columns
+                            if c != chave and pd.api.types.is_integer_dtype(indice[c])})
+    return indice, contagem_origem
+
+
+def _projetar(lido, colunas):
+    """Seleciona as colunas existentes de um DataFrame (ou de cada aba) já lido por completo"""
+    if isinstance(lido, dict):
+        return {nome: _projetar(df, colunas) for nome, df in lido.items()}
+    selecionadas = set(colunas)
+    return lido[[c for c in lido.columns if c in selecionadas]]
+
+
+class SessaoMerge:
+    """Cabeçalhos e DataFrames já lidos durante uma sessão da interface.
+
+    Cada arquivo é identificado por caminho, tamanho, data de modificação e
+    linhas puladas, de modo que validação, carga de colunas e merge leiam o
+    arquivo uma única vez. A leitura completa pode ser iniciada em segundo
+    plano com pre_carregar(); o merge apenas aguarda o resultado.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._cabecalhos = {}
+        self._dados = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="safe-leitura")
+
+    def _chave(self, caminho, skiprows, sheet=0, projecao=None):
+        info = os.stat(caminho)
+        return (os.path.abspath(caminho), info.st_size, info.st_mtime_ns, sheet, skiprows, projecao)
+
+    def cabecalho(self, caminho, skiprows=0, aba=0):
+        """Colunas do arquivo, lidas uma única vez por sessão"""
+        chave = self._chave(caminho, skiprows, aba)
+        if chave not in self._cabecalhos:
+            futuro = self._dados.get(chave)
+            if futuro is not None and futuro.done() and futuro.exception() is None:
+                # O arquivo já foi lido por completo: reaproveita as colunas
+                lido = futuro.result()
+                abas = lido.values() if isinstance(lido, dict) else [lido]
+                self._cabecalhos[chave] = list(dict.fromkeys(c for df in abas for c in df.columns))
+            else:
+                self._cabecalhos[chave] = ler_cabecalho(caminho, skiprows, aba=aba)
+        return self._cabecalhos[chave]
+
+    def validar(self, caminho):
+        """Valida se o arquivo existe e é legível, guardando o cabeçalho lido"""
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
+        self.cabecalho(caminho)
+
+    def _leitura(self, caminho, leitor, skiprows, sheet, projecao):
+        if self.cache is not None:
+            return self.cache.obter(caminho, leitor, skiprows=skiprows, sheet=sheet, projecao=projecao)
+        return leitor()
+
+    def _agendar(self, caminho, leitor, skiprows=0, sheet=0, projecao=None):
+        chave = self._chave(caminho, skiprows, sheet, projecao)
+        with self._lock:
+            futuro = self._dados.get(chave)
+            if futuro is None and projecao is not None:
+                # Uma leitura completa já feita ou em andamento atende a projeção
+                completa = self._dados.get(self._chave(caminho, skiprows, sheet))
+                if completa is not None:
+                    return chave, completa
+            if futuro is None:
+                futuro = self._executor.submit(self._leitura, caminho, leitor, skiprows, sheet, projecao)
+                self._dados[chave] = futuro
+        return chave, futuro
+
+    def pre_carregar(self, caminho, skiprows=0, motor='auto', aba=0):
+        """Inicia a leitura completa do arquivo (ou da aba) em segundo plano"""
+        self._agendar(caminho, lambda: ler_arquivo(caminho, skiprows=skiprows, motor=motor, aba=aba),
+                      skiprows, aba)
+
+    def obter(self, caminho, leitor, skiprows=0, sheet=0, projecao=None, progresso=None):
+        """Retorna o DataFrame já lido ou aguarda a leitura em andamento"""
+        chave, futuro = self._agendar(caminho, leitor, skiprows, sheet, projecao)
+        if progresso is not None:
+            # A leitura em segundo plano continua para a sessão; só a espera é cancelada
+            while not futuro.done():
+                progresso.verificar()
+                wait([futuro], timeout=0.2)
+        try:
+            lido = futuro.result()
+        except Exception:
+            # Não mantém leituras com erro, para que uma nova tentativa releia o arquivo
+            with self._lock:
+                self._dados.pop(chave, None)
+                self._dados.pop(self._chave(caminho, skiprows, sheet), None)
+            raise
+        if projecao is None or chave in self._dados:
+            return lido
+        return _projetar(lido, projecao[0])
+
+    def manter_apenas(self, caminhos):
+        """Libera da memória os arquivos que não estão mais selecionados"""
+        abertos = {os.path.abspath(c) for c in caminhos if c}
+        with self._lock:
+            for chave in [c for c in self._dados if c[0] not in abertos]:
+                self._dados.pop(chave)
+            for chave in [c for c in self._cabecalhos if c[0] not in abertos]:
+                self._cabecalhos.pop(chave)
+
+    def descartar_desatualizados(self):
+        """Libera da memória as leituras de arquivos que mudaram ou sumiram desde que foram lidos"""
+        atuais = {}
+
+        def desatualizado(chave):
+            caminho = chave[0]
+            if caminho not in atuais:
+                try:
+                    info = os.stat(caminho)
+                    atuais[caminho] = (info.st_size, info.st_mtime_ns)
+                except OSError:
+                    atuais[caminho] = None
+            return atuais[caminho] != chave[1:3]
+
+        with self._lock:
+            for chave in [c for c in self._dados if desatualizado(c)]:
+                self._dados.pop(chave)
+            for chave in [c for c in self._cabecalhos if desatualizado(c)]:
+                self._cabecalhos.pop(chave)
+
+    def encerrar(self):
+        """Encerra as leituras em segundo plano"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extensao_saida(arquivo_destino):
+    """Extensão padrão do arquivo de saída, conforme o tipo do destino"""
+    return '.csv' if eh_csv(arquivo_destino) else '.xlsx'
+
+
+def nome_saida_sugerido(arquivo_destino):
+    """Caminho sugerido para o arquivo vinculado, ao lado do destino"""
+    arquivo_base = Path(arquivo_destino)
+    return arquivo_base.parent / f"{arquivo_base.stem}_vinculado{extensao_saida(arquivo_destino)}"
+
+
+def caminho_final(caminho_saida, extensao=None, formato=None):
+    """Caminho de saída com a extensão garantida (do formato, da extensão padrão ou .xlsx)"""
+    caminho_saida = str(caminho_saida)
+    if not caminho_saida.lower().endswith(EXTENSOES_SAIDA):
+        if formato:
+            extensao = escritores.FORMATOS[formato][1]
+        caminho_saida += extensao or '.xlsx'
+    return caminho_saida
+
+
+def _base_saida(caminho_saida):
+    """Caminho de saída sem a extensão"""
+    caminho_saida = str(caminho_saida)
+    for extensao in EXTENSOES_SAIDA:
+        if caminho_saida.lower().endswith(extensao):
+            return caminho_saida[:-len(extensao)]
+    return caminho_saida
+
+
+def salvar_chaves_sem_correspondencia(correspondencia, caminho_saida):
+    """Grava em CSV, ao lado da saída, as chaves do destino sem correspondência e as da origem não usadas.
+
+    Usa as chaves coletadas com RelatorioMerge(coletar_chaves=True); retorna os caminhos gravados.
+    """
+    base = _base_saida(caminho_saida)
+    gravados = []
+    for chaves, sufixo in ((correspondencia.chaves_destino, "_destino_sem_correspondencia.csv"),
+                           (correspondencia.chaves_origem, "_origem_nao_usada.csv")):
+        if chaves is not None:
+            escritores.gravar(chaves, base + sufixo, 'csv')
+            gravados.append(base + sufixo)
+    return gravados
+
+
+def salvar_resultado(df_merge, caminho_saida, extensao=None, formato=None, progresso=None):
+    """Grava o resultado (DataFrame ou dict de abas) e retorna o caminho final (com extensão garantida)"""
+    caminho_saida = caminho_final(caminho_saida, extensao, formato)
+    escritores.gravar(df_merge, caminho_saida, formato, progresso)
+    return caminho_saida
@@ -0,0 +1,243 @@
+"""Tempo, vazão e pico de memória de cada etapa da vinculação.
+
+O MedidorMerge é ligado a um progresso.Progresso e acompanha as mesmas etapas
+(leitura, preparo das chaves, vinculação, gravação): mede o tempo de cada uma,
+as linhas processadas por segundo (ou MB/s na leitura, medida em bytes) e o
+pico de memória do processo, amostrando o RSS em uma thread enquanto a etapa
+roda. Cada execução concluída pode ser acrescentada ao log local de métricas,
+um objeto JSON por linha, para comparar formatos de arquivo e motores de leitura.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+
+import cacheLeitura
+import escritores
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+ARQUIVO_LOG = cacheLeitura.DIRETORIO_PADRAO / "metricas.jsonl"
+INTERVALO_AMOSTRAGEM = 0.05
+
+
+def _memoria_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class Contadores(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    contadores = Contadores()
+    contadores.cb = ctypes.sizeof(Contadores)
+    processo = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(processo, ctypes.byref(contadores), contadores.cb):
+        return None
+    return contadores.WorkingSetSize
+
+
+def memoria_rss():
+    """Memória residente do processo em bytes, ou None se não for possível medir"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        if sys.platform == "win32":
+            return _memoria_windows()
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _memoria_fisica_windows():
+    import ctypes
+
+    class Estado(ctypes.Structure):
+        _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+    estado = Estado()
+    estado.dwLength = ctypes.sizeof(Estado)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(estado)):
+        return None
+    return estado.ullTotalPhys
+
+
+def memoria_fisica():
+    """Memória física total da máquina em bytes, ou None se não for possível medir"""
+    if psutil is not None:
+        return psutil.virtual_memory().total
+    try:
+        if sys.platform == "win32":
+            return _memoria_fisica_windows()
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@dataclass
+class MetricaEtapa:
+    """Medidas de uma etapa concluída"""
+    etapa: str
+    segundos: float = 0.0
+    linhas: int = None
+    bytes_lidos: int = None
+    pico_memoria: int = None
+
+    @property
+    def linhas_por_segundo(self):
+        if not self.linhas or self.segundos <= 0:
+            return None
+        return self.linhas / self.segundos
+
+    def texto(self):
+        """Uma linha com o tempo, a vazão e o pico de memória da etapa"""
+        partes = [f"{self.segundos:.2f}s"]
+        if self.linhas_por_segundo is not None:
+            partes.append(f"{self.linhas:,} linhas ({self.linhas_por_segundo:,.0f}/s)")
+        if self.bytes_lidos and self.segundos > 0:
+            partes.append(f"{self.bytes_lidos / 1e6 / self.segundos:,.1f} MB/s")
+        if self.pico_memoria is not None:
+            partes.append(f"pico {self.pico_memoria / 1e6:,.0f} MB")
+        return f"{self.etapa}: {', '.join(partes)}"
+
+
+class MedidorMerge:
+    """Mede as etapas informadas pelo Progresso (ver progresso.Progresso)"""
+
+    def __init__(self):
+        self.etapas = []
+        self._atual = None
+        self._inicio = 0.0
+        self._pico = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._amostrador = None
+
+    def iniciar(self, nome, anterior=None):
+        """Encerra a etapa em andamento (ver encerrar) e começa a medir a etapa `nome`"""
+        self.encerrar(anterior)
+        with self._lock:
+            self._atual = MetricaEtapa(nome)
+            self._pico = memoria_rss()
+            self._inicio = time.perf_counter()
+        if self._pico is not None:
+            self._parar.clear()
+            self._amostrador = threading.Thread(target=self._amostrar, daemon=True)
+            self._amostrador.start()
+
+    def registrar(self, linhas=None, bytes_lidos=None):
+        """Informa as linhas e/ou bytes processados pela etapa em andamento"""
+        with self._lock:
+            if self._atual is None:
+                return
+            if linhas is not None:
+                self._atual.linhas = linhas
+            if bytes_lidos is not None:
+                self._atual.bytes_lidos = bytes_lidos
+
+    def encerrar(self, estado=None):
+        """Conclui a etapa em andamento, se houver.
+
+        `estado` (progresso.EstadoProgresso) completa as linhas ou os bytes
+        que não foram informados com registrar().
+        """
+        if self._amostrador is not None:
+            self._parar.set()
+            self._amostrador.join()
+            self._amostrador = None
+        with self._lock:
+            if self._atual is None:
+                return
+            self._atual.segundos = time.perf_counter() - self._inicio
+            if estado is not None and estado.feito:
+                if estado.unidade == 'bytes' and self._atual.bytes_lidos is None:
+                    self._atual.bytes_lidos = estado.feito
+                elif estado.unidade == 'linhas' and self._atual.linhas is None:
+                    self._atual.linhas = estado.feito
+            self._atual.pico_memoria = self._maior(memoria_rss())
+            self.etapas.append(self._atual)
+            self._atual = None
+
+    def _maior(self, memoria):
+        if memoria is None or self._pico is None:
+            return self._pico
+        return max(self._pico, memoria)
+
+    def _amostrar(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM):
+            memoria = memoria_rss()
+            with self._lock:
+                self._pico = self._maior(memoria)
+
+    @property
+    def segundos(self):
+        return sum(m.segundos for m in self.etapas)
+
+    @property
+    def pico_memoria(self):
+        picos = [m.pico_memoria for m in self.etapas if m.pico_memoria is not None]
+        return max(picos) if picos else None
+
+    def resumo(self):
+        """Texto com as medidas de cada etapa e o total, para mensagens ao usuário"""
+        linhas = [f"• {m.texto()}" for m in self.etapas]
+        total = f"• Total: {self.segundos:.2f}s"
+        if self.pico_memoria is not None:
+            total += f", pico de memória {self.pico_memoria / 1e6:,.0f} MB"
+        return "\n".join(linhas + [total])
+
+
+def _tamanho(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except (OSError, TypeError):
+        return None
+
+
+def registro(medidor, config, caminho_saida=None, total_linhas=None, formato=None, modo='completo'):
+    """Objeto JSON de uma execução: arquivos, motor de leitura, formato da saída e etapas"""
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "modo": modo,
+        "origem": str(config.arquivo_origem),
+        "tamanho_origem": _tamanho(config.arquivo_origem),
+        "destino": str(config.arquivo_destino),
+        "tamanho_destino": _tamanho(config.arquivo_destino),
+        "motor_leitura": config.motor_leitura,
+        "saida": str(caminho_saida) if caminho_saida else None,
+        "tamanho_saida": _tamanho(caminho_saida),
+        "formato_saida": formato or (escritores.formato_por_caminho(caminho_saida) if caminho_saida else None),
+        "linhas": total_linhas,
+        "segundos": round(medidor.segundos, 3),
+        "pico_memoria": medidor.pico_memoria,
+        "etapas": [dict(asdict(m), segundos=round(m.segundos, 3)) for m in medidor.etapas],
+    }
+
+
+def gravar_log(dados, arquivo=None):
+    """Acrescenta o registro ao log de métricas; falhas de gravação apenas geram aviso"""
+    arquivo = Path(arquivo or os.environ.get("SAFE_METRICAS_LOG", ARQUIVO_LOG))
+    try:
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        with open(arquivo, "a", encoding="utf-8") as log:
+            log.write(json.dumps(dados, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"Não foi possível gravar o log de métricas ({arquivo}): {e}")
+    return arquivo
@@ -0,0 +1,130 @@
+"""Normalização das colunas-chave antes do merge.
+
+CNPJs e nomes chegam em formatos diferentes em cada planilha
+("12.345.678/0001-90", "12345678000190", 1234567800019.0, "Empresa  Ltda").
+As opções abaixo são aplicadas com operações vetorizadas do pandas (.str) às
+duas colunas-chave, e a chave normalizada de cada arquivo fica guardada em
+memória enquanto o DataFrame lido existir, para ser reaproveitada entre merges.
+"""
+import weakref
+from dataclasses import dataclass, replace
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class OpcoesNormalizacao:
+    """Etapas de normalização aplicadas às colunas-chave"""
+    numeros_como_texto: bool = False
+    strip: bool = False
+    remover_acentos: bool = False
+    casefold: bool = False
+    apenas_digitos: bool = False
+    largura_zeros: int = 0
+
+    @property
+    def ativa(self):
+        """Indica se alguma etapa está ligada"""
+        return self != OpcoesNormalizacao()
+
+
+# Combinações prontas, usadas pela linha de comando e pela interface
+PREDEFINIDAS = {
+    'cnpj': OpcoesNormalizacao(numeros_como_texto=True, apenas_digitos=True, largura_zeros=14),
+    'cpf': OpcoesNormalizacao(numeros_como_texto=True, apenas_digitos=True, largura_zeros=11),
+    'texto': OpcoesNormalizacao(numeros_como_texto=True, strip=True, remover_acentos=True, casefold=True),
+}
+
+# Nome das opções aceitas por opcoes_de_nomes()
+ETAPAS = ('numeros_como_texto', 'strip', 'remover_acentos', 'casefold', 'apenas_digitos')
+
+
+def opcoes_de_nomes(nomes, largura_zeros=0):
+    """Monta as opções a partir de nomes de etapas e/ou combinações prontas"""
+    opcoes = OpcoesNormalizacao()
+    for nome in nomes or []:
+        if nome in PREDEFINIDAS:
+            predefinida = PREDEFINIDAS[nome]
+            opcoes = replace(opcoes, **{campo: True for campo in ETAPAS if getattr(predefinida, campo)},
+                             largura_zeros=max(opcoes.largura_zeros, predefinida.largura_zeros))
+        elif nome in ETAPAS:
+            opcoes = replace(opcoes, **{nome: True})
+        else:
+            raise ValueError(f"Etapa de normalização desconhecida: '{nome}'")
+    if largura_zeros:
+        opcoes = replace(opcoes, largura_zeros=largura_zeros)
+    return opcoes
+
+
+def _inteiros_sem_sinal(serie):
+    """Indica se a Series numérica só tem inteiros não negativos (ex.: CNPJ lido como float)"""
+    if pd.api.types.is_bool_dtype(serie) or not pd.api.types.is_numeric_dtype(serie):
+        return False
+    valores = serie.dropna()
+    return bool(((valores % 1 == 0) & (valores >= 0)).all())
+
+
+def numeros_como_texto(serie):
+    """Converte números em texto sem o ".0" que o Excel acrescenta aos inteiros"""
+    if pd.api.types.is_bool_dtype(serie) or not pd.api.types.is_numeric_dtype(serie):
+        return serie.astype('string')
+    if pd.api.types.is_float_dtype(serie) and _inteiros_sem_sinal(serie):
+        # Passar por Int64 é bem mais rápido que remover ".0" com regex
+        return serie.astype('Int64').astype('string')
+    texto = serie.astype('string')
+    if pd.api.types.is_float_dtype(serie):
+        texto = texto.str.replace(r'\.0$', '', regex=True)
+    return texto
+
+
+def normalizar(serie, opcoes):
+    """Aplica as etapas de normalização a uma Series, de forma vetorizada"""
+    if not opcoes.ativa:
+        return serie
+
+    # Inteiros não negativos já viram texto só com dígitos: as etapas de texto são dispensáveis
+    if _inteiros_sem_sinal(serie):
+        texto = numeros_como_texto(serie)
+        if opcoes.largura_zeros:
+            texto = texto.str.zfill(opcoes.largura_zeros)
+        return texto
+
+    texto = numeros_como_texto(serie)
+    if opcoes.strip:
+        texto = texto.str.strip().str.replace(r'\s+', ' ', regex=True)
+    if opcoes.remover_acentos:
+        texto = (texto.str.normalize('NFKD')
+                 .str.encode('ascii', errors='ignore')
+                 .str.decode('ascii')
+                 .astype('string'))
+    if opcoes.casefold:
+        texto = texto.str.casefold()
+    if opcoes.apenas_digitos:
+        texto = texto.str.replace(r'\D', '', regex=True)
+    # Chaves que ficaram vazias (ex.: sem nenhum dígito) viram ausentes antes de receber
+    # zeros à esquerda, e a junção não as casa entre si (ver mergeEngine.preparar_origem)
+    texto = texto.mask(texto.str.len() == 0)
+    if opcoes.largura_zeros:
+        texto = texto.str.zfill(opcoes.largura_zeros)
+    return texto
+
+
+# id(DataFrame) -> {(coluna, opções): chave normalizada}
+_normalizadas = {}
+
+
+def chave_normalizada(df, coluna, opcoes):
+    """Chave normalizada da coluna, calculada uma vez por DataFrame lido"""
+    if not opcoes.ativa:
+        return df[coluna]
+
+    identificador = id(df)
+    if identificador not in _normalizadas:
+        _normalizadas[identificador] = {}
+        # Descarta as chaves guardadas quando o DataFrame deixar de existir
+        weakref.finalize(df, _normalizadas.pop, identificador, None)
+
+    guardadas = _normalizadas[identificador]
+    if (coluna, opcoes) not in guardadas:
+        guardadas[(coluna, opcoes)] = normalizar(df[coluna], opcoes)
+    return guardadas[(coluna, opcoes)]
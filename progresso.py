@@ -0,0 +1,192 @@
+"""Progresso por etapa e cancelamento da vinculação.
+
+O motor informa a etapa atual (leitura, preparo das chaves, junção,
+gravação) e quanto dela já foi feito: bytes lidos do arquivo na leitura e
+linhas na junção e na gravação. A interface recebe um EstadoProgresso a cada
+atualização (no máximo a cada INTERVALO_ATUALIZACAO segundos) e pode pedir o
+cancelamento, que interrompe a leitura, a junção ou a gravação no próximo
+bloco com a exceção MergeCancelado.
+"""
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+INTERVALO_ATUALIZACAO = 0.1
+
+
+class MergeCancelado(Exception):
+    """Vinculação interrompida a pedido do usuário"""
+
+    def __init__(self, mensagem="Vinculação cancelada pelo usuário"):
+        super().__init__(mensagem)
+
+
+@dataclass
+class EstadoProgresso:
+    """Situação da etapa em andamento, enviada à interface"""
+    etapa: str
+    feito: int = 0
+    total: int = None
+    unidade: str = 'linhas'
+    segundos_restantes: float = None
+    # Andamento de cada arquivo quando vários são lidos ao mesmo tempo (ex.: "origem 40%, destino 75%")
+    detalhe: str = None
+
+    @property
+    def percentual(self):
+        """Percentual concluído da etapa, ou None se o total não é conhecido"""
+        if not self.total:
+            return None
+        return min(100.0, 100.0 * self.feito / self.total)
+
+    def texto(self):
+        """Descrição da etapa com o andamento e o tempo restante estimado"""
+        if self.percentual is None:
+            return f"{self.etapa}..."
+        if self.unidade == 'bytes':
+            andamento = f"{self.feito / 1e6:,.1f} de {self.total / 1e6:,.1f} MB"
+        else:
+            andamento = f"{self.feito:,} de {self.total:,} {self.unidade}"
+        texto = f"{self.etapa}: {andamento} ({self.percentual:.0f}%)"
+        if self.detalhe:
+            texto += f" — {self.detalhe}"
+        if self.segundos_restantes is not None:
+            minutos, segundos = divmod(int(self.segundos_restantes), 60)
+            texto += f" — restam {minutos}:{segundos:02d}"
+        return texto
+
+
+class Progresso:
+    """Acompanha as etapas da vinculação e o pedido de cancelamento.
+
+    `ao_atualizar(estado)` é chamado da thread do motor; a interface deve
+    repassar a atualização para a sua própria thread. Sem `ao_atualizar`
+    serve apenas para cancelar. Com `medidor` (metricas.MedidorMerge), o
+    tempo, as linhas e o pico de memória de cada etapa são medidos.
+    """
+
+    def __init__(self, ao_atualizar=None, medidor=None):
+        self.ao_atualizar = ao_atualizar
+        self.medidor = medidor
+        self._cancelado = threading.Event()
+        self._lock = threading.Lock()
+        self._estado = EstadoProgresso("Preparando")
+        self._inicio = time.perf_counter()
+        self._ultima_atualizacao = 0.0
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def cancelar(self):
+        """Pede a interrupção da vinculação no próximo ponto de verificação"""
+        self._cancelado.set()
+
+    def verificar(self):
+        """Interrompe com MergeCancelado se o cancelamento foi pedido"""
+        if self._cancelado.is_set():
+            raise MergeCancelado()
+
+    def etapa(self, nome, total=None, unidade='linhas'):
+        """Inicia uma nova etapa"""
+        self.verificar()
+        if self.medidor is not None:
+            self.medidor.iniciar(nome, self._estado)
+        with self._lock:
+            self._estado = EstadoProgresso(nome, 0, total, unidade)
+            self._inicio = time.perf_counter()
+        self._notificar(forcar=True)
+
+    def concluir(self):
+        """Encerra a medição da etapa atual (ex.: enquanto o usuário escolhe onde gravar)"""
+        if self.medidor is not None:
+            self.medidor.encerrar(self._estado)
+
+    def registrar_linhas(self, quantidade):
+        """Informa as linhas obtidas na etapa atual, quando o andamento é medido em outra unidade"""
+        if self.medidor is not None:
+            self.medidor.registrar(linhas=quantidade)
+
+    def definir_total(self, total, unidade='linhas'):
+        """Informa o total da etapa atual quando só é conhecido depois de iniciá-la"""
+        with self._lock:
+            self._estado.total = total
+            self._estado.unidade = unidade
+        self._notificar(forcar=True)
+
+    def avancar(self, quantidade):
+        """Soma `quantidade` ao que já foi feito na etapa e verifica o cancelamento"""
+        with self._lock:
+            self._estado.feito += quantidade
+        self._notificar()
+        self.verificar()
+
+    def posicionar(self, feito):
+        """Define o quanto da etapa já foi feito (ex.: posição no arquivo lido)"""
+        with self._lock:
+            self._estado.feito = feito
+        self._notificar()
+        self.verificar()
+
+    def posicionar_arquivos(self, arquivos):
+        """Andamento de leituras simultâneas: {nome: (bytes lidos, tamanho)}, somado na etapa atual.
+
+        Não verifica o cancelamento: é chamado por quem acompanha as leituras, não por elas.
+        """
+        iniciados = {nome: (feito, total) for nome, (feito, total) in arquivos.items() if total}
+        if not iniciados:
+            return
+        with self._lock:
+            self._estado.feito = sum(feito for feito, _ in iniciados.values())
+            self._estado.total = sum(total for _, total in iniciados.values())
+            self._estado.unidade = 'bytes'
+            self._estado.detalhe = ", ".join(f"{nome} {min(100, 100 * feito // total)}%"
+                                             for nome, (feito, total) in iniciados.items())
+        self._notificar()
+
+    def _notificar(self, forcar=False):
+        if self.ao_atualizar is None:
+            return
+        agora = time.perf_counter()
+        with self._lock:
+            if not forcar and agora - self._ultima_atualizacao < INTERVALO_ATUALIZACAO:
+                return
+            self._ultima_atualizacao = agora
+            estado = EstadoProgresso(**vars(self._estado))
+            decorrido = agora - self._inicio
+            if estado.total and estado.feito and decorrido > 1:
+                estado.segundos_restantes = decorrido / estado.feito * max(estado.total - estado.feito, 0)
+        self.ao_atualizar(estado)
+
+
+def obter(progresso):
+    """O próprio progresso ou um que apenas ignora as atualizações"""
+    return progresso if progresso is not None else Progresso()
+
+
+class ArquivoMonitorado(io.BufferedReader):
+    """Arquivo aberto para leitura que informa a posição lida e atende ao cancelamento"""
+
+    def __init__(self, caminho, progresso):
+        super().__init__(io.FileIO(caminho, 'rb'))
+        self._progresso = progresso
+        progresso.definir_total(os.fstat(self.fileno()).st_size, 'bytes')
+
+    def _registrar(self, resultado):
+        self._progresso.posicionar(self.tell())
+        return resultado
+
+    def read(self, size=-1):
+        return self._registrar(super().read(size))
+
+    def read1(self, size=-1):
+        return self._registrar(super().read1(size))
+
+    def readinto(self, buffer):
+        return self._registrar(super().readinto(buffer))
+
+    def readline(self, size=-1):
+        return self._registrar(super().readline(size))
@@ -0,0 +1,238 @@
+"""Receitas de vinculação: a configuração de um merge guardada em JSON.
+
+Uma receita guarda arquivos, linhas puladas, abas, colunas-chave, colunas a
+copiar e demais opções da ConfigMerge, além da saída e do formato, para que o
+merge repetido toda semana não precise ser configurado de novo. Caminhos
+relativos na receita são resolvidos a partir da pasta do próprio arquivo JSON.
+
+No modo de observação, os arquivos de entrada da receita são monitorados e o
+merge é refeito quando algum deles muda. Os avisos vêm do watchdog (inotify no
+Linux) quando ele está instalado, com consulta periódica do tamanho e da data
+de modificação como alternativa. Os DataFrames ficam em uma SessaoMerge entre
+as execuções, de modo que só as entradas alteradas são lidas de novo.
+"""
+import contextlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+
+import mergeEngine
+import normalizacao
+
+
+VERSAO = 1
+EXTENSAO_RECEITA = '.json'
+# Segundos entre consultas aos arquivos observados
+INTERVALO_OBSERVACAO = 2.0
+# Segundos sem mudanças antes de refazer o merge (o arquivo pode estar sendo gravado)
+ESPERA_ESTABILIDADE = 1.0
+
+_CAMPOS_CONFIG = {campo.name for campo in fields(mergeEngine.ConfigMerge)}
+
+
+@dataclass
+class Receita:
+    """Configuração de um merge e onde gravar o resultado"""
+    config: mergeEngine.ConfigMerge
+    saida: str = None
+    formato: str = None
+
+    @property
+    def caminho_saida(self):
+        """Saída da receita ou, sem ela, <destino>_vinculado ao lado do destino"""
+        return str(self.saida or mergeEngine.nome_saida_sugerido(self.config.arquivo_destino))
+
+    @property
+    def entradas(self):
+        """Arquivos observados: origem e destino"""
+        return list(dict.fromkeys([self.config.arquivo_origem, self.config.arquivo_destino]))
+
+
+@dataclass
+class Execucao:
+    """Resultado de uma execução da receita no modo de observação"""
+    caminho_saida: str = None
+    total_linhas: int = 0
+    segundos: float = 0.0
+    relatorio: mergeEngine.RelatorioMerge = None
+    erro: str = None
+
+    @property
+    def sucesso(self):
+        return self.erro is None
+
+
+def para_dict(receita):
+    """Receita no formato gravado em JSON, com os caminhos absolutos"""
+    config = asdict(receita.config)
+    for campo in ('arquivo_origem', 'arquivo_destino'):
+        config[campo] = os.path.abspath(config[campo])
+    saida = os.path.abspath(receita.saida) if receita.saida else None
+    return {'versao': VERSAO, 'config': config, 'saida': saida, 'formato': receita.formato}
+
+
+def de_dict(dados, pasta=None):
+    """Monta a receita lida do JSON; `pasta` resolve os caminhos relativos"""
+    if not isinstance(dados, dict) or not isinstance(dados.get('config'), dict):
+        raise ValueError("Receita inválida: falta a configuração do merge")
+    if dados.get('versao', VERSAO) > VERSAO:
+        raise ValueError(f"Receita gravada por uma versão mais nova do SAFE (versão {dados['versao']})")
+    config = dict(dados['config'])
+    desconhecidos = set(config) - _CAMPOS_CONFIG
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos na receita: {', '.join(sorted(desconhecidos))}")
+    if isinstance(config.get('normalizar_chave'), dict):
+        config['normalizar_chave'] = normalizacao.OpcoesNormalizacao(**config['normalizar_chave'])
+
+    def resolver(caminho):
+        if not caminho or pasta is None or os.path.isabs(caminho):
+            return caminho
+        return os.path.join(pasta, caminho)
+
+    for campo in ('arquivo_origem', 'arquivo_destino'):
+        config[campo] = resolver(config.get(campo))
+    try:
+        config = mergeEngine.ConfigMerge(**config)
+    except TypeError as e:
+        raise ValueError(f"Receita inválida: {e}")
+    config.validar()
+    return Receita(config, resolver(dados.get('saida')), dados.get('formato'))
+
+
+def salvar(receita, caminho):
+    """Grava a receita em JSON de forma atômica e retorna o caminho gravado"""
+    caminho = str(caminho)
+    if not caminho.lower().endswith(EXTENSAO_RECEITA):
+        caminho += EXTENSAO_RECEITA
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as arquivo:
+            json.dump(para_dict(receita), arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+    return caminho
+
+
+def carregar(caminho):
+    """Lê a receita gravada em JSON"""
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Receita inválida ({caminho}): {e}")
+    return de_dict(dados, os.path.dirname(os.path.abspath(caminho)))
+
+
+def executar(receita, cache=None, relatorio=None, progresso=None):
+    """Executa o merge da receita e grava o resultado; retorna (caminho da saída, total de linhas)"""
+    config = receita.config
+    df_merge = mergeEngine.executar_merge(config, cache, relatorio, progresso)
+    caminho_saida = mergeEngine.salvar_resultado(df_merge, receita.caminho_saida,
+                                                 mergeEngine.extensao_saida(config.arquivo_destino),
+                                                 receita.formato, progresso)
+    return caminho_saida, mergeEngine.total_linhas(df_merge)
+
+
+def assinatura(caminhos):
+    """Tamanho e data de modificação de cada arquivo (None para os que não existem)"""
+    resultado = []
+    for caminho in caminhos:
+        try:
+            info = os.stat(caminho)
+            resultado.append((info.st_size, info.st_mtime_ns))
+        except OSError:
+            resultado.append(None)
+    return tuple(resultado)
+
+
+def watchdog_disponivel():
+    """Indica se o watchdog (avisos do sistema, como o inotify) está instalado"""
+    return importlib.util.find_spec('watchdog') is not None
+
+
+@contextlib.contextmanager
+def _avisos(caminhos):
+    """Evento acionado pelo sistema quando algo muda nas pastas dos arquivos.
+
+    Sem o watchdog o evento nunca é acionado e a espera vira consulta periódica.
+    """
+    aviso = threading.Event()
+    if not watchdog_disponivel():
+        yield aviso
+        return
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    class Tratador(FileSystemEventHandler):
+        def on_any_event(self, event):
+            aviso.set()
+
+    observador = Observer()
+    for pasta in {os.path.dirname(os.path.abspath(c)) for c in caminhos}:
+        if os.path.isdir(pasta):
+            observador.schedule(Tratador(), pasta, recursive=False)
+    observador.start()
+    try:
+        yield aviso
+    finally:
+        observador.stop()
+        observador.join()
+
+
+def aguardar_mudanca(caminhos, anterior, intervalo=INTERVALO_OBSERVACAO, espera=ESPERA_ESTABILIDADE, parar=None):
+    """Bloqueia até algum arquivo mudar e ficar `espera` segundos sem mudar de novo.
+
+    Retorna a nova assinatura, ou None se `parar` (threading.Event) for acionado.
+    """
+    parar = parar or threading.Event()
+    with _avisos(caminhos) as aviso:
+        while not parar.is_set():
+            atual = assinatura(caminhos)
+            if atual == anterior:
+                # Com watchdog a espera termina no aviso; o intervalo cobre avisos perdidos
+                aviso.wait(intervalo)
+                aviso.clear()
+                continue
+            # Espera a gravação terminar (o Excel, por exemplo, grava em várias etapas)
+            while not parar.wait(espera):
+                estavel = assinatura(caminhos)
+                if estavel == atual:
+                    return atual
+                atual = estavel
+    return None
+
+
+def observar(receita, ao_executar=None, cache=None, intervalo=INTERVALO_OBSERVACAO, espera=ESPERA_ESTABILIDADE,
+             parar=None, executar_inicio=True):
+    """Refaz o merge da receita sempre que a origem ou o destino mudam, até `parar` ser acionado.
+
+    `ao_executar(execucao)` recebe o Execucao de cada rodada; erros de uma
+    rodada (ex.: arquivo ainda incompleto) são informados e a observação continua.
+    """
+    sessao = mergeEngine.SessaoMerge(cache)
+    try:
+        atual = assinatura(receita.entradas)
+        if not executar_inicio:
+            atual = aguardar_mudanca(receita.entradas, atual, intervalo, espera, parar)
+        while atual is not None:
+            sessao.descartar_desatualizados()
+            relatorio = mergeEngine.RelatorioMerge()
+            inicio = time.perf_counter()
+            try:
+                caminho_saida, total_linhas = executar(receita, sessao, relatorio)
+                execucao = Execucao(caminho_saida, total_linhas, time.perf_counter() - inicio, relatorio)
+            except Exception as e:
+                execucao = Execucao(segundos=time.perf_counter() - inicio, erro=str(e))
+            if ao_executar is not None:
+                ao_executar(execucao)
+            atual = aguardar_mudanca(receita.entradas, atual, intervalo, espera, parar)
+    finally:
+        sessao.encerrar()
@@ -0,0 +1,287 @@
+"""safe-merge: executa a vinculação do SAFE pela linha de comando.
+
+Exemplos:
+    python safeMerge.py origem.xlsx destino.xlsx --chave CNPJ --colunas Email Telefone
+    python safeMerge.py origem.csv destino.xlsx --chave-origem Codigo --chave-destino ID \\
+        --colunas Nome --skip-origem 2 --saida resultado.xlsx
+    python safeMerge.py origem.xlsx export_erp.csv --chave CNPJ --colunas Email --streaming
+    python safeMerge.py origem.xlsx clientes/ --chave CNPJ --colunas Email --pasta-saida vinculados/
+    python safeMerge.py origem.xlsx filiais.xlsx --chave CNPJ --colunas Email --aba-destino "*"
+    python safeMerge.py origem.csv destino.xlsx --chave CNPJ --colunas Email --saida diario.xlsx --incremental
+    python safeMerge.py origem.xlsx destino.xlsx --chave CNPJ --colunas Email --salvar-receita semanal.json
+    python safeMerge.py --receita semanal.json --observar
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import replace
+
+import analiseChaves
+import batchMerge
+import cacheLeitura
+import escritores
+import fuzzyJoin
+import incremental
+import leitores
+import mergeEngine
+import metricas
+import normalizacao
+import progresso
+import receitas
+import sqlEngine
+
+
+def criar_parser():
+    """Define os argumentos aceitos pelo safe-merge"""
+    parser = argparse.ArgumentParser(
+        prog="safe-merge",
+        description="Copia colunas do arquivo origem para o arquivo destino pela coluna-chave."
+    )
+    parser.add_argument("origem", nargs="?", help="Arquivo origem (fonte dos dados)")
+    parser.add_argument("destino", nargs="*",
+                        help="Arquivo destino (receberá os dados); vários arquivos ou uma pasta executam em lote")
+    parser.add_argument("-k", "--chave", nargs="+",
+                        help="Coluna-chave comum aos dois arquivos (várias colunas formam uma chave composta)")
+    parser.add_argument("--chave-origem", nargs="+", help="Coluna(s)-chave do arquivo origem (modo manual)")
+    parser.add_argument("--chave-destino", nargs="+", help="Coluna(s)-chave do arquivo destino (modo manual)")
+    parser.add_argument("-c", "--colunas", nargs="+", help="Colunas do arquivo origem a copiar")
+    parser.add_argument("--skip-origem", type=int, default=0, help="Linhas a pular no arquivo origem")
+    parser.add_argument("--skip-destino", type=int, default=0, help="Linhas a pular no arquivo destino")
+    parser.add_argument("--aba-origem", type=leitores.aba_de_texto, default=0,
+                        help="Aba do arquivo origem: nome, posição (0 = primeira) ou \"*\" para juntar todas")
+    parser.add_argument("--aba-destino", type=leitores.aba_de_texto, default=0,
+                        help="Aba do arquivo destino: nome, posição (0 = primeira) ou \"*\" para vincular todas")
+    parser.add_argument("-o", "--saida",
+                        help="Arquivo de saída (padrão: <destino>_vinculado ao lado do destino)")
+    parser.add_argument("--motor", choices=leitores.MOTORES, default="auto",
+                        help="Motor de leitura (auto escolhe o mais rápido instalado)")
+    parser.add_argument("--formato", choices=list(escritores.FORMATOS),
+                        help="Formato de saída (padrão: deduzido pela extensão da saída)")
+    parser.add_argument("--duplicadas", choices=list(analiseChaves.POLITICAS_DUPLICADAS), default="manter",
+                        help="O que fazer com chaves repetidas na origem")
+    parser.add_argument("--atualizacao", choices=list(mergeEngine.MODOS_ATUALIZACAO), default="acrescentar",
+                        help="Colunas a copiar que já existem no destino: acrescentar (sufixos _x/_y), "
+                             "preencher só as células vazias ou sobrescrever com os valores da origem")
+    parser.add_argument("--limite-expansao", type=float, default=analiseChaves.LIMITE_EXPANSAO,
+                        help="Interrompe se o resultado passar de N vezes as linhas do destino (0 desativa)")
+    parser.add_argument("--normalizar", nargs="+", metavar="ETAPA",
+                        choices=list(normalizacao.ETAPAS) + list(normalizacao.PREDEFINIDAS),
+                        help="Normaliza as colunas-chave antes do merge: "
+                             + ", ".join(list(normalizacao.ETAPAS) + list(normalizacao.PREDEFINIDAS)))
+    parser.add_argument("--zeros", type=int, default=0,
+                        help="Completa a chave normalizada com zeros à esquerda até N dígitos")
+    parser.add_argument("--aproximada", action="store_true",
+                        help="Junção aproximada: vincula chaves parecidas (ex.: nomes de empresas)")
+    parser.add_argument("--similaridade", type=float, default=fuzzyJoin.SIMILARIDADE_MINIMA,
+                        help="Similaridade mínima (0 a 1) aceita na junção aproximada")
+    parser.add_argument("--apenas-analise", action="store_true",
+                        help="Só analisa as colunas-chave, sem gravar o resultado")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Lê o destino CSV em blocos e grava cada bloco direto na saída CSV")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Refaz só as linhas afetadas pelas mudanças na origem desde a última execução "
+                             "com a mesma saída")
+    parser.add_argument("--fora-da-memoria", choices=("auto", "sim", "nao"), default="auto",
+                        help="Vincula pelo SQLite em arquivo temporário, para arquivos maiores que a memória "
+                             "(auto: quando o tamanho estimado passa da metade da memória da máquina)")
+    parser.add_argument("--chaves-sem-correspondencia", action="store_true",
+                        help="Grava ao lado da saída, em CSV, as chaves do destino sem correspondência e as "
+                             "chaves da origem que nenhuma linha usou")
+    parser.add_argument("--receita",
+                        help="Receita JSON com os arquivos, as colunas e as opções do merge (dispensa os demais "
+                             "argumentos; --saida e --formato, se informados, prevalecem)")
+    parser.add_argument("--salvar-receita", metavar="ARQUIVO",
+                        help="Grava a configuração deste merge como receita JSON para reutilizar depois")
+    parser.add_argument("--observar", action="store_true",
+                        help="Depois da primeira execução, refaz o merge sempre que a origem ou o destino mudarem "
+                             "(Ctrl+C encerra)")
+    parser.add_argument("--chunksize", type=int, default=mergeEngine.TAMANHO_CHUNK,
+                        help="Linhas por bloco no modo streaming")
+    parser.add_argument("--pasta-saida", help="Pasta dos arquivos vinculados no modo lote (padrão: ao lado de cada destino)")
+    parser.add_argument("--processos", type=int,
+                        help="Processos em paralelo no modo lote (padrão: um por núcleo)")
+    parser.add_argument("--metricas", action="store_true",
+                        help="Mostra o tempo, as linhas por segundo e o pico de memória de cada etapa "
+                             "(o registro vai sempre para ~/.safe_cache/metricas.jsonl)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Não usa o cache em disco de planilhas já lidas")
+    parser.add_argument("--cache-dir", help="Diretório do cache (padrão: ~/.safe_cache)")
+    parser.add_argument("--cache-limite-mb", type=float,
+                        help="Tamanho máximo do cache em MB (padrão: 1024)")
+    return parser
+
+
+def config_de_args(args):
+    """Monta a ConfigMerge a partir dos argumentos da linha de comando"""
+    if not args.origem or not args.destino:
+        raise ValueError("Informe os arquivos origem e destino ou uma --receita")
+    chave_origem = args.chave_origem or args.chave
+    chave_destino = args.chave_destino or args.chave
+    if not chave_origem or not chave_destino:
+        raise ValueError("Informe --chave ou --chave-origem e --chave-destino")
+
+    return mergeEngine.ConfigMerge(
+        arquivo_origem=args.origem,
+        arquivo_destino=args.destino[0],
+        chave_origem=chave_origem,
+        chave_destino=chave_destino,
+        colunas=args.colunas,
+        skip_origem=args.skip_origem,
+        skip_destino=args.skip_destino,
+        motor_leitura=args.motor,
+        duplicadas=args.duplicadas,
+        atualizacao=args.atualizacao,
+        limite_expansao=args.limite_expansao or None,
+        normalizar_chave=normalizacao.opcoes_de_nomes(args.normalizar, args.zeros),
+        juncao_aproximada=args.aproximada,
+        similaridade_minima=args.similaridade,
+        aba_origem=args.aba_origem,
+        aba_destino=args.aba_destino,
+    )
+
+
+def receita_de_args(args):
+    """Receita lida de --receita ou montada a partir dos argumentos da linha de comando"""
+    if not args.receita:
+        return receitas.Receita(config_de_args(args), args.saida, args.formato)
+    if args.origem or args.destino:
+        raise ValueError("Informe os arquivos pela receita ou pelos argumentos, não pelos dois")
+    receita = receitas.carregar(args.receita)
+    return replace(receita, saida=args.saida or receita.saida, formato=args.formato or receita.formato)
+
+
+def observar(receita, cache):
+    """Refaz o merge da receita a cada mudança na origem ou no destino, até Ctrl+C"""
+    if receitas.watchdog_disponivel():
+        avisos = "avisos do sistema"
+    else:
+        avisos = f"consulta a cada {receitas.INTERVALO_OBSERVACAO:g} s"
+    print(f"Observando {', '.join(receita.entradas)} ({avisos}). Ctrl+C encerra.", flush=True)
+
+    def ao_executar(execucao):
+        horario = time.strftime("%H:%M:%S")
+        if not execucao.sucesso:
+            print(f"[{horario}] Erro na vinculação: {execucao.erro}", file=sys.stderr, flush=True)
+            return
+        linha = (f"[{horario}] Arquivo salvo em: {execucao.caminho_saida} "
+                 f"({execucao.total_linhas:,} linhas em {execucao.segundos:.1f} s)")
+        if execucao.relatorio.correspondencia is not None:
+            linha += f" - {execucao.relatorio.correspondencia.resumo()}"
+        print(linha, flush=True)
+
+    try:
+        receitas.observar(receita, ao_executar, cache)
+    except KeyboardInterrupt:
+        print("Observação encerrada")
+    return 0
+
+
+def executar_lote(args, config, destinos, formato, cache):
+    """Vincula a origem a vários destinos, mostrando o progresso e o resumo por arquivo"""
+    if args.streaming or args.apenas_analise:
+        raise ValueError("--streaming e --apenas-analise não se aplicam ao modo lote")
+
+    def progresso(resultado, concluidos, total):
+        situacao = "ok" if resultado.sucesso else "erro"
+        print(f"[{concluidos}/{total}] {situacao}: {resultado.arquivo_destino}", flush=True)
+
+    resultados = batchMerge.executar_lote(config, destinos, args.pasta_saida, formato,
+                                          args.processos, cache, progresso)
+    print(batchMerge.resumo_lote(resultados))
+    return 0 if all(r.sucesso for r in resultados) else 1
+
+
+def main(argv=None):
+    """Função principal do safe-merge"""
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        receita = receita_de_args(args)
+        config, formato = receita.config, receita.formato
+        if args.salvar_receita:
+            print(f"Receita salva em: {receitas.salvar(receita, args.salvar_receita)}")
+        cache = None if args.sem_cache else cacheLeitura.CacheLeitura(args.cache_dir, args.cache_limite_mb)
+        destinos = args.destino or [config.arquivo_destino]
+        if len(destinos) > 1 or os.path.isdir(destinos[0]):
+            if args.incremental or args.observar:
+                raise ValueError("--incremental e --observar não se aplicam ao modo lote")
+            return executar_lote(args, config, destinos, formato, cache)
+        if args.apenas_analise:
+            print(mergeEngine.executar_analise(config, cache).resumo())
+            return 0
+        if args.observar:
+            if args.streaming or args.incremental or args.chaves_sem_correspondencia:
+                raise ValueError("--observar não pode ser usado com --streaming, --incremental ou "
+                                 "--chaves-sem-correspondencia")
+            return observar(receita, cache)
+
+        saida = receita.caminho_saida
+        relatorio = mergeEngine.RelatorioMerge(coletar_chaves=args.chaves_sem_correspondencia)
+        medicao = progresso.Progresso(medidor=metricas.MedidorMerge())
+        if args.incremental:
+            if args.streaming:
+                raise ValueError("--incremental e --streaming não podem ser usados juntos")
+            if args.chaves_sem_correspondencia:
+                raise ValueError("--chaves-sem-correspondencia não se aplica ao modo incremental")
+            modo = 'incremental'
+            caminho_saida, total_linhas = incremental.executar_incremental(config, saida, formato,
+                                                                           cache, relatorio, progresso=medicao)
+        elif args.fora_da_memoria == 'sim' or (args.fora_da_memoria == 'auto' and not args.streaming
+                                                and sqlEngine.recomendado(config)):
+            modo = 'fora_da_memoria'
+            caminho_saida, total_linhas = sqlEngine.executar_merge_sql(config, saida, formato, relatorio,
+                                                                       medicao)
+        elif args.streaming:
+            modo = 'streaming'
+            caminho_saida = str(saida)
+            total_linhas = mergeEngine.executar_merge_streaming(config, caminho_saida, args.chunksize, cache,
+                                                                medicao, relatorio)
+        else:
+            modo = 'completo'
+            df_merge = mergeEngine.executar_merge(config, cache, relatorio, medicao)
+            caminho_saida = mergeEngine.salvar_resultado(
+                df_merge, saida, mergeEngine.extensao_saida(config.arquivo_destino), formato, medicao)
+            total_linhas = mergeEngine.total_linhas(df_merge)
+        medicao.concluir()
+        relatorio.metricas = medicao.medidor
+        metricas.gravar_log(metricas.registro(medicao.medidor, config, caminho_saida, total_linhas,
+                                              formato, modo))
+        arquivos_chaves = []
+        if args.chaves_sem_correspondencia:
+            arquivos_chaves = mergeEngine.salvar_chaves_sem_correspondencia(relatorio.correspondencia,
+                                                                            caminho_saida)
+    except Exception as e:
+        print(f"Erro na vinculação: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Arquivo salvo em: {caminho_saida}")
+    print(f"Total de linhas: {total_linhas:,}")
+    print(f"Colunas adicionadas: {len(config.colunas)}")
+    if relatorio.analise_chaves is not None:
+        print(relatorio.analise_chaves.resumo())
+    if relatorio.conversao_chave is not None:
+        print(f"Conversão das chaves: {relatorio.conversao_chave.resumo()}")
+    if relatorio.correspondencia is not None:
+        print(f"Correspondência: {relatorio.correspondencia.resumo()}")
+    for arquivo in arquivos_chaves:
+        print(f"Chaves salvas em: {arquivo}")
+    if relatorio.celulas_atualizadas:
+        print("Células atualizadas: " + ", ".join(f"{coluna} {celulas:,}"
+                                                   for coluna, celulas in relatorio.celulas_atualizadas.items()))
+    if relatorio.incremental is not None:
+        print(relatorio.incremental.resumo())
+    if relatorio.abas_vinculadas is not None:
+        print(f"Abas vinculadas: {', '.join(relatorio.abas_vinculadas)}")
+        if relatorio.abas_mantidas:
+            print(f"Abas mantidas sem alteração: {', '.join(relatorio.abas_mantidas)}")
+    if relatorio.linhas_aproximadas is not None:
+        print(f"Linhas vinculadas por similaridade: {relatorio.linhas_aproximadas:,}")
+    if args.metricas:
+        print(f"Desempenho:\n{relatorio.metricas.resumo()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
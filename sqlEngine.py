@@ -0,0 +1,342 @@
+"""Vinculação fora da memória, com a junção feita em um banco SQLite temporário.
+
+Para destinos maiores que a memória da máquina: a origem (só as colunas
+usadas) e o destino, lido em blocos quando é CSV, são copiados para tabelas
+de um banco SQLite em arquivo temporário. O LEFT JOIN é feito pelo SQLite,
+com um índice na coluna de junção, e o resultado é lido em blocos direto para
+o gravador do formato escolhido (ver escritores.ResultadoEmBlocos), de modo
+que nem o destino nem o resultado ficam inteiros em memória.
+
+Normalização, chave composta e junção aproximada preparam as chaves como no
+motor em memória (preparar_origem/preparar_destino), e a análise das chaves
+e a política de duplicadas valem da mesma forma. Os tipos das chaves também
+são conciliados antes da cópia (ver tiposChave), em vez de ficarem por conta
+da afinidade das colunas do SQLite. Diferente do merge do pandas, chaves
+vazias não casam entre si. Planilhas Excel não podem ser
+lidas em blocos; como cabem no máximo 1 048 575 linhas por aba, o destino
+Excel é lido inteiro e só então copiado para o banco.
+"""
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import analiseChaves
+import escritores
+import fuzzyJoin
+import leitores
+import mergeEngine
+import metricas
+import progresso as progresso_merge
+import tiposChave
+from leitores import TODAS_ABAS
+
+
+BLOCO_LINHAS = 100_000
+# Acima desta fração da memória física, a vinculação automática usa o SQLite
+FRACAO_MEMORIA = 0.5
+LIMITE_PADRAO_MB = 4096
+# Memória ocupada pelo DataFrame lido em relação ao tamanho do arquivo
+FATOR_MEMORIA = {'.csv': 4, '.xls': 4, '.xlsx': 12, '.xlsm': 12, '.ods': 12}
+ORIGEM = "origem"
+DESTINO = "destino"
+
+
+def limite_memoria():
+    """Memória (em bytes) acima da qual a vinculação é feita fora da memória"""
+    limite_mb = os.environ.get("SAFE_LIMITE_MEMORIA_MB")
+    if limite_mb:
+        return float(limite_mb) * 1e6
+    total = metricas.memoria_fisica()
+    return total * FRACAO_MEMORIA if total else LIMITE_PADRAO_MB * 1e6
+
+
+def estimar_memoria(caminho):
+    """Memória estimada para ler o arquivo inteiro em um DataFrame"""
+    return os.path.getsize(caminho) * FATOR_MEMORIA.get(Path(caminho).suffix.lower(), 4)
+
+
+def verificar_config(config):
+    """Interrompe com ValueError se a configuração não puder ser vinculada pelo SQLite"""
+    if config.aba_destino == TODAS_ABAS:
+        raise ValueError("A vinculação fora da memória aceita apenas uma aba do destino")
+    if config.atualizacao != 'acrescentar':
+        raise ValueError("A vinculação fora da memória apenas acrescenta colunas; "
+                         "use a vinculação em memória para atualizar colunas existentes")
+
+
+def recomendado(config, limite=None):
+    """Indica se os arquivos são grandes demais para a vinculação em memória"""
+    try:
+        verificar_config(config)
+        estimativa = estimar_memoria(config.arquivo_origem) + estimar_memoria(config.arquivo_destino)
+    except (ValueError, OSError):
+        return False
+    return estimativa > (limite if limite is not None else limite_memoria())
+
+
+def _nome(coluna):
+    """Nome de coluna entre aspas para o SQL"""
+    return '"' + str(coluna).replace('"', '""') + '"'
+
+
+def _conectar(arquivo):
+    conexao = sqlite3.connect(arquivo)
+    # O banco é descartável: sem journal nem sincronização com o disco
+    conexao.execute("PRAGMA journal_mode = OFF")
+    conexao.execute("PRAGMA synchronous = OFF")
+    conexao.execute("PRAGMA cache_size = -65536")
+    return conexao
+
+
+def _copiar(conexao, tabela, df):
+    """Acrescenta o DataFrame à tabela (criada no primeiro bloco)"""
+    # Tipos do pandas que o sqlite3 não aceita (pd.NA, category) viram objetos Python;
+    # categorias vão como texto e são recuperadas pelo texto em _restaurar_tipos
+    convertidas = {c: (df[c].cat.rename_categories(str) if isinstance(df[c].dtype, pd.CategoricalDtype)
+                       else df[c]).astype(object)
+                   for c in df.columns if pd.api.types.is_extension_array_dtype(df[c])}
+    if convertidas:
+        df = df.assign(**convertidas)
+        df = df.where(df.notna(), None)
+    df.rename(columns=str).to_sql(tabela, conexao, if_exists='append', index=False)
+
+
+def _copiar_destino(conexao, config, indice, coluna, tradutor, progresso):
+    """Copia o destino preparado para o banco, em blocos, com as chaves no tipo da origem.
+
+    Como no modo streaming, o tipo comum das chaves é escolhido pelo primeiro
+    bloco (ver mergeEngine.conciliar_chaves) e os seguintes são convertidos
+    para ele. Retorna (tipos das colunas, índice da origem convertido, coluna
+    de junção, tiposChave.ConversaoChave das chaves do destino).
+    """
+    if not leitores.eh_csv(config.arquivo_destino):
+        destino = mergeEngine.preparar_destino(mergeEngine.carregar_destino(config, progresso=progresso),
+                                               config, tradutor)
+        indice, destino, coluna, conversao = mergeEngine.conciliar_chaves(indice, destino, coluna)
+        progresso.definir_total(len(destino))
+        for inicio in range(0, len(destino), BLOCO_LINHAS):
+            bloco = destino.iloc[inicio:inicio + BLOCO_LINHAS]
+            _copiar(conexao, DESTINO, bloco)
+            progresso.avancar(len(bloco))
+        if not len(destino):
+            _copiar(conexao, DESTINO, destino)
+        return destino.dtypes, indice, coluna, tiposChave.ConversaoChave.total([conversao])
+
+    tipos = None
+    conversoes = []
+    chave_destino = coluna
+    linhas = 0
+    with leitores.ler_em_blocos(config.arquivo_destino, config.skip_destino, BLOCO_LINHAS,
+                                config.motor_leitura, progresso) as leitor:
+        for bloco in leitor:
+            bloco = mergeEngine.preparar_destino(bloco, config, tradutor)
+            if tipos is None:
+                indice, bloco, coluna, conversao = mergeEngine.conciliar_chaves(indice, bloco, coluna)
+                tipos = bloco.dtypes
+            elif conversao.convertida:
+                chave, conversao = tiposChave.converter(bloco[chave_destino], conversao.tipo)
+                bloco = bloco.assign(**{mergeEngine.COLUNA_JUNCAO: chave})
+            conversoes.append(conversao)
+            _copiar(conexao, DESTINO, bloco)
+            linhas += len(bloco)
+    if tipos is None:
+        raise ValueError("O arquivo destino não tem linhas")
+    progresso.registrar_linhas(linhas)
+    return tipos, indice, coluna, tiposChave.ConversaoChave.total(conversoes)
+
+
+def _contar(conexao, sql):
+    return conexao.execute(sql).fetchone()[0] or 0
+
+
+def _analisar(conexao, coluna, ausentes_casam=True):
+    """Análise das chaves (analiseChaves.AnaliseChaves) feita por consultas no banco.
+
+    `ausentes_casam` como em analiseChaves.analisar_chaves.
+    """
+    chave = _nome(coluna)
+
+    def contagens(tabela, filtro=""):
+        linhas = _contar(conexao, f"SELECT COUNT(*) FROM {tabela}")
+        unicas = _contar(conexao, f"SELECT COUNT(*) FROM (SELECT 1 FROM {tabela} {filtro} GROUP BY {chave})")
+        repetidas = _contar(conexao, f"SELECT SUM(n) FROM (SELECT COUNT(*) AS n FROM {tabela} {filtro} "
+                                     f"GROUP BY {chave} HAVING n > 1)")
+        return linhas, unicas, repetidas
+
+    linhas_origem, unicas_origem, duplicadas_origem = contagens(ORIGEM)
+    linhas_destino, unicas_destino, duplicadas_destino = contagens(
+        DESTINO, "" if ausentes_casam else f"WHERE {chave} IS NOT NULL")
+    ambiguas = 0
+    if duplicadas_origem:
+        ambiguas = _contar(conexao, f"SELECT COUNT(*) FROM {DESTINO} d JOIN (SELECT {chave} FROM {ORIGEM} "
+                                    f"GROUP BY {chave} HAVING COUNT(*) > 1) r ON d.{chave} = r.{chave}")
+    return analiseChaves.AnaliseChaves(
+        linhas_origem=linhas_origem,
+        unicas_origem=unicas_origem,
+        duplicadas_origem=duplicadas_origem,
+        linhas_destino=linhas_destino,
+        unicas_destino=unicas_destino,
+        duplicadas_destino=duplicadas_destino,
+        linhas_projetadas=_contar(conexao, f"SELECT COUNT(*) FROM {DESTINO} d LEFT JOIN {ORIGEM} o "
+                                           f"ON d.{chave} = o.{chave}"),
+        ambiguas_destino=ambiguas,
+    )
+
+
+def _aplicar_politica(conexao, coluna, politica):
+    """Política de duplicadas (ver analiseChaves.aplicar_politica) aplicada à tabela da origem"""
+    chave = _nome(coluna)
+    if politica in ('primeira', 'ultima'):
+        manter = "MIN" if politica == 'primeira' else "MAX"
+        conexao.execute(f"DELETE FROM {ORIGEM} WHERE rowid NOT IN "
+                        f"(SELECT {manter}(rowid) FROM {ORIGEM} GROUP BY {chave})")
+    elif politica == 'agregar':
+        repetidas = f"SELECT {chave} FROM {ORIGEM} GROUP BY {chave} HAVING COUNT(*) > 1"
+        df = pd.read_sql_query(f"SELECT * FROM {ORIGEM} WHERE {chave} IN ({repetidas}) ORDER BY rowid", conexao)
+        if len(df):
+            agregadas = analiseChaves.aplicar_politica(df, str(coluna), 'agregar')
+            conexao.execute(f"DELETE FROM {ORIGEM} WHERE {chave} IN ({repetidas})")
+            _copiar(conexao, ORIGEM, agregadas)
+    conexao.commit()
+
+
+def _colunas_resultado(tipos_destino, tipos_origem, coluna):
+    """(expressão do SELECT, nome no resultado, tipo original) de cada coluna do resultado.
+
+    Como no merge do pandas, colunas com o mesmo nome nos dois lados recebem os sufixos _x e _y.
+    """
+    destino = [c for c in tipos_destino.index if c != mergeEngine.COLUNA_JUNCAO]
+    origem = [c for c in tipos_origem.index if c != coluna]
+    comuns = set(destino) & set(origem)
+    selecao = [(f"d.{_nome(c)}", f"{c}_x" if c in comuns else c, tipos_destino[c]) for c in destino]
+    selecao += [(f"o.{_nome(c)}", f"{c}_y" if c in comuns else c, tipos_origem[c]) for c in origem]
+    return selecao
+
+
+def _restaurar_tipos(bloco, tipos):
+    """Devolve às categorias, números inteiros, datas e booleanos o tipo que tinham antes do banco"""
+    convertidos = {}
+    for coluna, tipo in tipos.items():
+        serie = bloco[coluna]
+        if isinstance(tipo, pd.CategoricalDtype):
+            categorias = dict(zip(tipo.categories.astype(str), tipo.categories))
+            # Textos agregados (política 'agregar') não são categorias e ficam como texto
+            if serie.dropna().isin(categorias).all():
+                convertidos[coluna] = serie.map(categorias).astype(tipo)
+        elif pd.api.types.is_datetime64_any_dtype(tipo):
+            convertidos[coluna] = pd.to_datetime(serie, format='ISO8601')
+        elif pd.api.types.is_bool_dtype(tipo):
+            convertidos[coluna] = serie.astype('boolean') if serie.isna().any() else serie.astype(bool)
+        elif pd.api.types.is_integer_dtype(tipo) and pd.api.types.is_numeric_dtype(serie):
+            convertidos[coluna] = serie.astype('Int64') if serie.isna().any() else serie.astype('int64')
+    return bloco.assign(**convertidos) if convertidos else bloco
+
+
+def _blocos_resultado(conexao, sql, nomes, tipos, coluna, config, correspondencias, coletar=False):
+    """Blocos do resultado lidos do banco, já sem as colunas auxiliares.
+
+    A correspondência de cada bloco, contada pelo indicador do próprio SELECT,
+    é acrescentada a `correspondencias`.
+    """
+    for bloco in pd.read_sql_query(sql, conexao, chunksize=BLOCO_LINHAS):
+        bloco.columns = nomes
+        # As linhas do destino e as ambíguas vêm da análise das chaves
+        bloco, correspondencia = mergeEngine.separar_indicador(_restaurar_tipos(bloco, tipos), coluna, 0, 0,
+                                                               config, coletar)
+        correspondencias.append(correspondencia)
+        yield bloco
+
+
+def executar_merge_sql(config, caminho_saida, formato=None, relatorio=None, progresso=None, diretorio=None):
+    """Vincula pelo SQLite em arquivo temporário e grava o resultado em blocos.
+
+    `diretorio` é onde fica o banco temporário (padrão: pasta temporária do
+    sistema); ele precisa de espaço para os dois arquivos. Retorna (caminho
+    final da saída, total de linhas gravadas).
+    """
+    config.validar()
+    verificar_config(config)
+    progresso = progresso_merge.obter(progresso)
+
+    progresso.etapa("Lendo origem")
+    df1 = mergeEngine.carregar_origem(config, progresso=progresso)
+    progresso.etapa("Preparando chaves")
+    indice, coluna, tradutor = mergeEngine.preparar_origem(df1, config)
+    coletar = relatorio is not None and relatorio.coletar_chaves
+    if coletar:
+        # Só as chaves ficam em memória, para apontar as chaves da origem não usadas
+        chaves_origem = df1[config.colunas_chave_origem]
+    linhas_indice = indice.index
+    del df1
+
+    fd, arquivo = tempfile.mkstemp(prefix="safe_", suffix=".sqlite", dir=diretorio)
+    os.close(fd)
+    conexao = _conectar(arquivo)
+    try:
+        # O destino vai primeiro: o tipo comum das chaves é escolhido pelo seu primeiro bloco
+        progresso.etapa("Copiando destino para o disco")
+        tipos_destino, indice, coluna, conversao = _copiar_destino(conexao, config, indice, coluna, tradutor,
+                                                                   progresso)
+        if coletar:
+            # Chaves que a conversão deixou ausentes também são apontadas como não usadas
+            juncao_origem = indice[[coluna]].reindex(linhas_indice)
+
+        progresso.etapa("Copiando origem para o disco", total=len(indice))
+        for inicio in range(0, len(indice), BLOCO_LINHAS):
+            bloco = indice.iloc[inicio:inicio + BLOCO_LINHAS]
+            _copiar(conexao, ORIGEM, bloco)
+            progresso.avancar(len(bloco))
+        if not len(indice):
+            _copiar(conexao, ORIGEM, indice)
+        tipos_origem = indice.dtypes
+        del indice
+        conexao.commit()
+
+        progresso.etapa("Vinculando")
+        conexao.execute(f"CREATE INDEX indice_origem ON {ORIGEM} ({_nome(coluna)})")
+        analise = _analisar(conexao, coluna, not config.juncao_aproximada)
+        analiseChaves.verificar_expansao(analise, config.duplicadas, config.limite_expansao)
+        _aplicar_politica(conexao, coluna, config.duplicadas)
+        if relatorio is not None:
+            relatorio.analise_chaves = analise
+            if config.juncao_aproximada:
+                relatorio.linhas_aproximadas = _contar(
+                    conexao, f"SELECT COUNT(*) FROM {DESTINO} WHERE {_nome(fuzzyJoin.COLUNA_SIMILARIDADE)} < 1")
+
+        selecao = _colunas_resultado(tipos_destino, tipos_origem, coluna)
+        chave = _nome(coluna)
+        nomes = [nome for _, nome, _ in selecao]
+        tipos = {nome: tipo for _, nome, tipo in selecao}
+        # Indicador do merge e, com a coleta de chaves, a chave de junção normalizada
+        auxiliares = [("CASE WHEN o.rowid IS NULL THEN 'left_only' ELSE 'both' END",
+                       mergeEngine.COLUNA_INDICADOR)]
+        if coletar and coluna == mergeEngine.COLUNA_JUNCAO:
+            auxiliares.append((f"d.{chave}", coluna))
+        expressoes = [expressao for expressao, _, _ in selecao] + [expressao for expressao, _ in auxiliares]
+        juncao = f"FROM {DESTINO} d LEFT JOIN {ORIGEM} o ON d.{chave} = o.{chave}"
+        total = _contar(conexao, f"SELECT COUNT(*) {juncao}")
+        sql = f"SELECT {', '.join(expressoes)} {juncao} ORDER BY d.rowid"
+
+        correspondencias = []
+        blocos = _blocos_resultado(conexao, sql, nomes + [nome for _, nome in auxiliares], tipos, coluna, config,
+                                   correspondencias, coletar)
+        resultado = escritores.ResultadoEmBlocos(nomes, blocos, total)
+        caminho_saida = mergeEngine.salvar_resultado(resultado, caminho_saida,
+                                                     mergeEngine.extensao_saida(config.arquivo_destino),
+                                                     formato, progresso)
+        if relatorio is not None:
+            correspondencia = analiseChaves.Correspondencia.total(correspondencias)
+            correspondencia.linhas_destino = analise.linhas_destino
+            correspondencia.ambiguas = analise.ambiguas_destino
+            relatorio.correspondencia = correspondencia
+            relatorio.conversao_chave = conversao
+            mergeEngine.registrar_conversao_composta(relatorio, tradutor, config)
+            if coletar:
+                mergeEngine.registrar_chaves_origem(correspondencia, chaves_origem, juncao_origem, coluna, config)
+        return caminho_saida, total
+    finally:
+        conexao.close()
+        Path(arquivo).unlink(missing_ok=True)
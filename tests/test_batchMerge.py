@@ -0,0 +1,24 @@
+"""Nomes dos arquivos gravados por um lote"""
+import os
+
+import pytest
+
+import batchMerge
+
+
+def test_destinos_de_mesmo_nome_em_pastas_diferentes(tmp_path):
+    saidas = batchMerge.caminhos_saida(['jan/clientes.csv', 'fev/clientes.csv'], str(tmp_path))
+
+    assert [os.path.basename(saida) for saida in saidas] == ['jan_clientes_vinculado.csv',
+                                                               'fev_clientes_vinculado.csv']
+
+
+def test_destinos_sem_repeticao_mantem_o_nome(tmp_path):
+    saidas = batchMerge.caminhos_saida(['jan/clientes.csv', 'jan/pedidos.csv'], str(tmp_path))
+
+    assert [os.path.basename(saida) for saida in saidas] == ['clientes_vinculado.csv', 'pedidos_vinculado.csv']
+
+
+def test_repeticao_que_o_prefixo_nao_resolve(tmp_path):
+    with pytest.raises(ValueError, match='mesmo arquivo'):
+        batchMerge.caminhos_saida(['a/jan/clientes.csv', 'b/jan/clientes.csv'], str(tmp_path))
@@ -0,0 +1,51 @@
+"""Vinculação incremental executada duas vezes sobre os mesmos arquivos"""
+import os
+
+import pandas as pd
+
+import incremental
+import mergeEngine
+
+
+def _executar(config, saida, diretorio):
+    relatorio = mergeEngine.RelatorioMerge()
+    incremental.executar_incremental(config, saida, relatorio=relatorio, diretorio=diretorio)
+    return relatorio.incremental
+
+
+def _gravar_origem(caminho, emails):
+    pd.DataFrame({'k': [1, 2, 3], 'Email': emails}).to_csv(caminho, index=False)
+    # Garante data de modificação diferente mesmo em sistemas de arquivos com pouca resolução
+    info = os.stat(caminho)
+    os.utime(caminho, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+
+
+def test_coluna_copiada_que_ja_existe_no_destino(tmp_path):
+    origem, destino, saida = tmp_path / 'o.csv', tmp_path / 'd.csv', tmp_path / 's.csv'
+    _gravar_origem(origem, ['a', 'b', 'c'])
+    pd.DataFrame({'k': [1, 2, 4], 'Email': ['x', 'y', 'z']}).to_csv(destino, index=False)
+    config = mergeEngine.ConfigMerge.automatica(str(origem), str(destino), 'k', ['Email'])
+
+    assert _executar(config, saida, tmp_path / 'estado').completa
+    _gravar_origem(origem, ['A', 'b', 'c'])
+    resumo = _executar(config, saida, tmp_path / 'estado')
+
+    assert not resumo.completa
+    assert (resumo.chaves_atualizadas, resumo.linhas_alteradas) == (1, 1)
+    resultado = pd.read_csv(saida)
+    assert resultado['Email_x'].tolist() == ['x', 'y', 'z']
+    assert resultado['Email_y'].tolist()[:2] == ['A', 'b']
+
+
+def test_chave_numerica_na_origem_e_texto_no_destino(tmp_path):
+    origem, destino, saida = tmp_path / 'o.csv', tmp_path / 'd.csv', tmp_path / 's.csv'
+    _gravar_origem(origem, ['a', 'b', 'c'])
+    pd.DataFrame({'k': ['1', '2', 'X'], 'v': [1, 2, 3]}).to_csv(destino, index=False)
+    config = mergeEngine.ConfigMerge.automatica(str(origem), str(destino), 'k', ['Email'])
+
+    _executar(config, saida, tmp_path / 'estado')
+    _gravar_origem(origem, ['A', 'b', 'c'])
+    resumo = _executar(config, saida, tmp_path / 'estado')
+
+    assert resumo.linhas_alteradas == 1 and resumo.regravado
+    assert pd.read_csv(saida)['Email'].tolist()[:2] == ['A', 'b']
@@ -0,0 +1,56 @@
+"""Vinculação em memória com chaves normalizadas, convertidas ou aproximadas"""
+import pandas as pd
+
+import mergeEngine
+import normalizacao
+
+
+def test_normalizacao_e_juncao_aproximada_com_chave_que_fica_vazia():
+    origem = pd.DataFrame({'k': ['11.222.333/0001-81', 'N/D', '44.555.666/0001-99'], 'Email': ['a', 'nd', 'b']})
+    destino = pd.DataFrame({'k': ['11222333000181', '44555666000199', 'N/D']})
+    config = mergeEngine.ConfigMerge.automatica('o.csv', 'd.csv', 'k', ['Email'], juncao_aproximada=True,
+                                                normalizar_chave=normalizacao.PREDEFINIDAS['cnpj'])
+
+    resultado = mergeEngine.vincular(origem, destino, config)
+
+    assert resultado['Email'].tolist()[:2] == ['a', 'b']
+    assert pd.isna(resultado['Email'].iloc[2])
+
+
+def test_streaming_com_chave_que_nao_vira_numero_em_bloco_posterior(tmp_path):
+    origem, destino, saida = tmp_path / 'o.csv', tmp_path / 'd.csv', tmp_path / 's.csv'
+    pd.DataFrame({'k': [1, 2, None, 3], 'Email': ['a', 'b', 'NULO', 'c']}).to_csv(origem, index=False)
+    destino.write_text('k,v\n1,x\n2,y\nN/D,z\n3,w\n')
+    config = mergeEngine.ConfigMerge.automatica(str(origem), str(destino), 'k', ['Email'])
+    relatorio = mergeEngine.RelatorioMerge()
+
+    mergeEngine.executar_merge_streaming(config, str(saida), chunksize=2, relatorio=relatorio)
+
+    resultado = pd.read_csv(saida)
+    assert resultado['Email'].tolist()[:2] == ['a', 'b'] and resultado['Email'].iloc[3] == 'c'
+    assert pd.isna(resultado['Email'].iloc[2])
+    assert relatorio.correspondencia.sem_correspondencia == 1
+
+
+def test_chave_texto_com_valor_nao_numerico_e_origem_com_ausentes():
+    origem = pd.DataFrame({'k': [111, 333, None], 'Email': ['a', 'b', 'NULO']})
+    destino = pd.DataFrame({'k': ['0111', '333.0', 'N/D', None]})
+    config = mergeEngine.ConfigMerge.automatica('o.csv', 'd.csv', 'k', ['Email'])
+    relatorio = mergeEngine.RelatorioMerge()
+
+    resultado = mergeEngine.vincular(origem, destino, config, relatorio)
+
+    assert resultado['Email'].tolist()[:2] == ['a', 'b']
+    assert resultado['Email'].iloc[2:].isna().all()
+    assert relatorio.conversao_chave.tipo == 'Int64' and relatorio.conversao_chave.nao_convertidas == 1
+
+
+def test_analise_da_juncao_aproximada_nao_conta_linhas_sem_correspondencia_como_repetidas():
+    origem = pd.DataFrame({'k': ['Joao Silva', 'Maria Souza'], 'Email': ['a', 'b']})
+    destino = pd.DataFrame({'k': ['Joao Silvaa', 'Xyzw', 'Qwerty', 'Abcde']})
+    config = mergeEngine.ConfigMerge.automatica('o.csv', 'd.csv', 'k', ['Email'], juncao_aproximada=True)
+
+    analise = mergeEngine.analisar(origem, destino, config)
+
+    assert (analise.linhas_destino, analise.unicas_destino, analise.duplicadas_destino) == (4, 1, 0)
+    assert analise.linhas_projetadas == 4
@@ -0,0 +1,20 @@
+"""Vinculação pelo SQLite comparada à vinculação em memória"""
+import pandas as pd
+
+import mergeEngine
+import sqlEngine
+
+
+def test_chaves_conciliadas_como_no_motor_em_memoria(tmp_path):
+    origem, destino, saida = tmp_path / 'o.csv', tmp_path / 'd.csv', tmp_path / 's.csv'
+    pd.DataFrame({'k': [111, 333, None, 4, 5], 'Email': ['a', 'b', 'NULO', 'd', 'e']}).to_csv(origem, index=False)
+    destino.write_text('k,v\n0111,x\n333.0,y\nN/D,z\n,w\n5,u\n')
+    config = mergeEngine.ConfigMerge.automatica(str(origem), str(destino), 'k', ['Email'])
+    em_memoria, no_sqlite = mergeEngine.RelatorioMerge(), mergeEngine.RelatorioMerge()
+
+    esperado = mergeEngine.executar_merge(config, relatorio=em_memoria)
+    sqlEngine.executar_merge_sql(config, str(saida), relatorio=no_sqlite)
+
+    assert pd.read_csv(saida)['Email'].fillna('').tolist() == esperado['Email'].fillna('').tolist()
+    assert no_sqlite.correspondencia.sem_correspondencia == em_memoria.correspondencia.sem_correspondencia == 2
+    assert no_sqlite.conversao_chave.resumo() == em_memoria.conversao_chave.resumo()
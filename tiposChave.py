@@ -0,0 +1,205 @@
+"""Conciliação dos tipos das colunas-chave antes do merge.
+
+O mesmo CNPJ chega como int64 em um arquivo e como texto no outro, ou como
+float (1234.0) quando a coluna do Excel tem células vazias. Com tipos
+diferentes o merge do pandas falha ou compara objetos Python um a um. Antes da
+junção os dois lados recebem um tipo comum e compacto, com conversões
+vetorizadas: inteiro anulável (Int64) quando os dois representam inteiros ou
+decimal (Float64) quando algum número tem casas decimais. Textos que não são
+números (ex.: "N/D") não teriam correspondência do outro lado de qualquer forma:
+ficam ausentes e são contados e exemplificados no relatório; as chaves
+ausentes da origem ficam fora da junção (ver mergeEngine.conciliar_chaves),
+para que não casem com eles. A comparação é feita como texto (string) só
+quando os inteiros não cabem em um int64.
+"""
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+import normalizacao
+
+
+TIPO_INTEIRO = 'Int64'
+TIPO_DECIMAL = 'Float64'
+TIPO_TEXTO = 'string'
+DESCRICOES = {TIPO_INTEIRO: "inteiros", TIPO_DECIMAL: "números decimais", TIPO_TEXTO: "texto"}
+# Valores não convertidos mostrados no relatório
+EXEMPLOS = 5
+
+_LIMITE_INT64 = 2 ** 63
+
+
+@dataclass
+class ConversaoChave:
+    """Tipo comum escolhido para as chaves e valores que não puderam virar número"""
+    tipo_origem: str = None
+    tipo_destino: str = None
+    # None quando as chaves já tinham o mesmo tipo (ou tipos que o pandas compara bem)
+    tipo: str = None
+    nao_convertidas: int = 0
+    exemplos: list = field(default_factory=list)
+    # Chaves compostas: valores distintos da origem que viraram a mesma chave (ex.: "1" e "01");
+    # só o primeiro é vinculado (ver chaveComposta)
+    colididas: int = 0
+    exemplos_colididos: list = field(default_factory=list)
+
+    @property
+    def convertida(self):
+        return self.tipo is not None
+
+    @classmethod
+    def total(cls, partes):
+        """Junta as conversões de várias abas ou blocos do destino"""
+        convertidas = [p for p in partes if p is not None and p.convertida]
+        if not convertidas:
+            return None
+        total = cls(convertidas[0].tipo_origem, convertidas[0].tipo_destino, convertidas[0].tipo,
+                    sum(p.nao_convertidas for p in convertidas))
+        exemplos = dict.fromkeys(e for p in convertidas for e in p.exemplos)
+        total.exemplos = list(exemplos)[:EXEMPLOS]
+        # As colisões são da origem: se repetem em cada bloco ou aba do destino
+        total.colididas = max(p.colididas for p in convertidas)
+        colididos = dict.fromkeys(e for p in convertidas for e in p.exemplos_colididos)
+        total.exemplos_colididos = list(colididos)[:EXEMPLOS]
+        return total
+
+    def resumo(self):
+        """Texto com o tipo escolhido, para mensagens ao usuário"""
+        texto = (f"chaves comparadas como {DESCRICOES[self.tipo]} "
+                 f"(origem {self.tipo_origem}, destino {self.tipo_destino})")
+        if self.nao_convertidas:
+            exemplos = ", ".join(repr(e) for e in self.exemplos)
+            consequencia = ("foram comparados como texto" if self.tipo == TIPO_TEXTO
+                            else "ficaram sem correspondência")
+            texto += f"; {self.nao_convertidas:,} valores não são números ({exemplos}) e {consequencia}"
+        if self.colididas:
+            exemplos = ", ".join(repr(e) for e in self.exemplos_colididos)
+            texto += (f"; {self.colididas:,} valores da origem viraram a mesma chave que outro valor "
+                      f"({exemplos}) e suas linhas não foram vinculadas")
+        return texto
+
+
+def _inteiros(numeros):
+    """Máscara dos números que são inteiros e cabem em um int64"""
+    return (numeros % 1 == 0) & (numeros.abs() < _LIMITE_INT64)
+
+
+def _integrais(numeros):
+    """Indica se os números (sem os ausentes) são inteiros que cabem em um int64"""
+    return bool(_inteiros(numeros.dropna()).all())
+
+
+def _categoria(serie):
+    """'inteiro', 'decimal', 'texto' ou None (datas, booleanos, categorias...)"""
+    dtype = serie.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return None
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'inteiro'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'inteiro' if _integrais(serie) else 'decimal'
+    if pd.api.types.is_string_dtype(dtype) or dtype == object:
+        return 'texto'
+    return None
+
+
+def _como_numeros(serie):
+    """Números dos textos (vazio = ausente) e máscara dos valores que não são número"""
+    texto = serie.astype('string').str.strip()
+    vazias = texto.isna() | (texto == '')
+    numeros = pd.to_numeric(texto.mask(vazias), errors='coerce')
+    return numeros, numeros.isna() & ~vazias
+
+
+def _lembrar(memoria, chave, calcular):
+    """Resultado guardado em `memoria` (dict) ou calculado na hora, quando não há memória"""
+    if memoria is None:
+        return calcular()
+    if chave not in memoria:
+        memoria[chave] = calcular()
+    return memoria[chave]
+
+
+def _converter(serie, categoria, tipo, numeros=None):
+    if tipo == TIPO_TEXTO:
+        if categoria == 'texto':
+            return serie.astype(TIPO_TEXTO)
+        # Sem o ".0" que o Excel acrescenta aos inteiros
+        return normalizacao.numeros_como_texto(serie)
+    if categoria == 'texto':
+        serie = numeros
+    if tipo == TIPO_INTEIRO and not _integrais(serie):
+        # Números com casas decimais não têm inteiro correspondente
+        serie = serie.where(_inteiros(serie))
+    return serie.astype(tipo)
+
+
+def converter(serie, tipo):
+    """Converte uma coluna-chave para o tipo já escolhido (ex.: blocos seguintes do destino).
+
+    Retorna (Series convertida, ConversaoChave); valores que não viram número
+    ficam ausentes e são contados em `nao_convertidas`.
+    """
+    conversao = ConversaoChave(tipo_destino=str(serie.dtype), tipo=tipo)
+    categoria = _categoria(serie)
+    if categoria is None or serie.dtype == tipo:
+        return serie, conversao
+    numeros = None
+    if categoria == 'texto' and tipo != TIPO_TEXTO:
+        numeros, falhas = _como_numeros(serie)
+        if tipo == TIPO_INTEIRO:
+            falhas |= numeros.notna() & ~_inteiros(numeros)
+        if falhas.any():
+            conversao.nao_convertidas = int(falhas.sum())
+            conversao.exemplos = list(serie[falhas].drop_duplicates().head(EXEMPLOS))
+    elif categoria == 'decimal' and tipo == TIPO_INTEIRO:
+        falhas = serie.notna() & ~_inteiros(serie)
+        conversao.nao_convertidas = int(falhas.sum())
+        conversao.exemplos = list(serie[falhas].drop_duplicates().head(EXEMPLOS))
+    return _converter(serie, categoria, tipo, numeros), conversao
+
+
+def conciliar(origem, destino, memoria=None):
+    """Converte as duas colunas-chave (Series) para um tipo comum.
+
+    Retorna (origem, destino, ConversaoChave); sem conversão as Series voltam
+    como vieram. `memoria` (dict) guarda o que foi calculado para a origem, para
+    não refazê-lo a cada aba do destino.
+    """
+    conversao = ConversaoChave(str(origem.dtype), str(destino.dtype))
+    categoria_origem, categoria_destino = _categoria(origem), _categoria(destino)
+    if origem.dtype == destino.dtype or categoria_origem is None or categoria_destino is None:
+        return origem, destino, conversao
+
+    numeros_origem = numeros_destino = None
+    if categoria_origem == categoria_destino == 'texto':
+        # object x string: o mesmo tipo de texto nos dois lados
+        conversao.tipo = TIPO_TEXTO
+    elif 'texto' not in (categoria_origem, categoria_destino):
+        if categoria_origem != categoria_destino or all(pd.api.types.is_integer_dtype(s.dtype)
+                                                        for s in (origem, destino)):
+            # Inteiros x decimais e inteiros de larguras diferentes: o pandas já compara bem
+            return origem, destino, conversao
+        # Inteiros guardados como float (1234.0) x int64
+        conversao.tipo = TIPO_INTEIRO
+    else:
+        if categoria_origem == 'texto':
+            numeros_origem, falhas = _lembrar(memoria, 'numeros', lambda: _como_numeros(origem))
+            texto, numerica, numeros = origem, destino, numeros_origem
+        else:
+            numeros_destino, falhas = _como_numeros(destino)
+            texto, numerica, numeros = destino, origem, numeros_destino
+        if falhas.any():
+            conversao.nao_convertidas = int(falhas.sum())
+            conversao.exemplos = list(texto[falhas].drop_duplicates().head(EXEMPLOS))
+        decimais = _categoria(numerica) == 'decimal' or bool((numeros.dropna() % 1 != 0).any())
+        if not (decimais or _integrais(numeros)):
+            # Inteiros além do int64 só são comparados com exatidão como texto
+            conversao.tipo = TIPO_TEXTO
+        else:
+            conversao.tipo = TIPO_DECIMAL if decimais else TIPO_INTEIRO
+
+    origem = _lembrar(memoria, conversao.tipo,
+                      lambda: _converter(origem, categoria_origem, conversao.tipo, numeros_origem))
+    destino = _converter(destino, categoria_destino, conversao.tipo, numeros_destino)
+    return origem, destino, conversao